@@ -12,10 +12,11 @@ from django.core.exceptions import ValidationError
 from django.db import models
 from django.conf import settings
 from django.db.models import Sum, Case, When, F
+from commons.campos_precio import CamposPrecioMixin
 from commons.enums import EstadoRegistroEnum
 
 
-class Cliente(models.Model):
+class Cliente(CamposPrecioMixin, models.Model):
     """
     Modelo que representa un cliente en el sistema.
 
@@ -46,6 +47,9 @@ class Cliente(models.Model):
     tipo = models.CharField(max_length=10, choices=SEGMENTOS, default="MIN")
     usuarios = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name="clientes")
 
+    # El segmento define el descuento de comisión (ver commons/campos_precio.py)
+    CAMPOS_PRECIO = ("tipo",)
+
     def __str__(self):
         """
         Retorna la representación en cadena del cliente.
@@ -273,7 +277,38 @@ class TasaComision(models.Model):
             TasaComision | None: Objeto de tasa de comisión vigente o None.
         """
         return cls.vigente_para_tipo(cliente.tipo, fecha=fecha)
-      
+
+    @classmethod
+    def vigentes_por_tipo(cls, tipos_cliente, fecha=None):
+        """
+        Obtiene en una sola consulta la tasa vigente de varios tipos de cliente.
+
+        Aplica el mismo criterio que ``vigente_para_tipo`` (la de
+        ``vigente_desde`` más reciente y, a igualdad, la de mayor id).
+
+        Args:
+            tipos_cliente (Iterable[str]): Segmentos a consultar.
+            fecha (date, optional): Fecha de referencia. Defaults to hoy.
+
+        Returns:
+            dict[str, TasaComision]: Tasa vigente por segmento. Los segmentos
+            sin tasa vigente no aparecen en el diccionario.
+        """
+        fecha = fecha or date.today()
+        qs = (
+            cls.objects.filter(
+                estado=EstadoRegistroEnum.ACTIVO.value,
+                tipo_cliente__in=list(tipos_cliente),
+                vigente_desde__lte=fecha,
+            )
+            .filter(models.Q(vigente_hasta__isnull=True) | models.Q(vigente_hasta__gte=fecha))
+            .order_by("tipo_cliente", "-vigente_desde", "-id")
+        )
+        vigentes = {}
+        for tc in qs:
+            vigentes.setdefault(tc.tipo_cliente, tc)
+        return vigentes
+
 
 class LimitePYG(models.Model):
     """
@@ -0,0 +1,41 @@
+"""
+Seguimiento de los campos de un modelo que intervienen en el cálculo de precios.
+
+Los modelos que lo usan (``Cliente``, ``PaymentMethod``, ``MedioAcreditacion``)
+declaran ``CAMPOS_PRECIO``; al leerse de la base cada instancia recuerda esos
+valores y ``cambio_campos_precio()`` dice si un ``save()`` los modificó. Las
+señales de ``transaccion/signals.py`` lo usan para incrementar
+``VersionPrecios`` solo cuando cambia algo que afecta una cotización, y no al
+editar un nombre o un dato de contacto. Es el mismo patrón que usa
+``Transaccion.from_db`` para los contadores de límites.
+"""
+
+
+class CamposPrecioMixin:
+    """Mixin para modelos con ``CAMPOS_PRECIO``: recuerda sus valores leídos de la base."""
+
+    #: Campos que intervienen en el cálculo de precios.
+    CAMPOS_PRECIO = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._valores_precio = instance.valores_precio()
+        return instance
+
+    def valores_precio(self):
+        """Valores actuales de ``CAMPOS_PRECIO``, o None si alguno no fue cargado."""
+        if set(self.CAMPOS_PRECIO) & self.get_deferred_fields():
+            return None
+        return tuple(getattr(self, campo) for campo in self.CAMPOS_PRECIO)
+
+    def cambio_campos_precio(self):
+        """
+        True si los valores de ``CAMPOS_PRECIO`` difieren de los leídos de la
+        base, o si no se conocen (instancia no leída de la base o campos diferidos).
+        Deja como referencia los valores actuales.
+        """
+        anterior = getattr(self, "_valores_precio", None)
+        actual = self.valores_precio()
+        self._valores_precio = actual
+        return anterior is None or actual is None or anterior != actual
@@ -0,0 +1,86 @@
+"""
+Paginación por clave (keyset) para listados ordenados por fecha.
+
+A diferencia de ``Paginator`` (``OFFSET``), cada página se pide con un cursor
+que contiene la fecha y el id de la última (o primera) fila mostrada, y la
+consulta filtra ``(fecha, id) < cursor`` sobre un índice que empiece por la
+fecha. El costo de una página no depende de cuántas filas haya antes.
+
+Los cursores son opacos para el cliente: base64 de ``"<valor ISO>|<id>"``.
+"""
+import base64
+import binascii
+from collections import namedtuple
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+#: Resultado de ``paginar_por_clave``: filas de la página y cursores (o None).
+Pagina = namedtuple("Pagina", ["items", "siguiente", "anterior"])
+
+
+def codificar_cursor(valor, pk):
+    texto = f"{valor.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(texto.encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor, campo):
+    """
+    Devuelve ``(valor, pk)`` del cursor, convertido con el campo del modelo,
+    o None si el cursor no es válido.
+    """
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        texto = base64.urlsafe_b64decode(cursor + relleno).decode()
+        valor, pk = texto.rsplit("|", 1)
+        return campo.to_python(valor), int(pk)
+    except (ValueError, TypeError, UnicodeDecodeError, binascii.Error, ValidationError):
+        return None
+
+
+def paginar_por_clave(queryset, campo="fecha", tamano=25, despues=None, antes=None, descendente=True):
+    """
+    Devuelve una ``Pagina`` de ``queryset`` ordenado por ``(campo, id)``.
+
+    Args:
+        campo: campo de orden (no nulo), desempatado por ``id``.
+        tamano: filas por página.
+        despues: cursor ``siguiente`` de la página anterior.
+        antes: cursor ``anterior`` de la página siguiente (para volver atrás).
+        descendente: True para mostrar primero los valores más recientes.
+
+    Un cursor inválido se ignora y se devuelve la primera página.
+    """
+    modelo_campo = queryset.model._meta.get_field(campo)
+    cursor = despues or antes
+    clave = decodificar_cursor(cursor, modelo_campo) if cursor else None
+    hacia_atras = clave is not None and not despues
+
+    # Al retroceder se recorre en orden inverso y luego se da vuelta la página
+    invertido = descendente != hacia_atras
+    orden = (f"-{campo}", "-id") if invertido else (campo, "id")
+
+    if clave is not None:
+        valor, pk = clave
+        op = "lt" if invertido else "gt"
+        queryset = queryset.filter(
+            Q(**{f"{campo}__{op}": valor}) | Q(**{campo: valor, f"id__{op}": pk})
+        )
+
+    filas = list(queryset.order_by(*orden)[: tamano + 1])
+    hay_mas = len(filas) > tamano
+    filas = filas[:tamano]
+    if hacia_atras:
+        filas.reverse()
+
+    if not filas:
+        return Pagina(filas, None, None)
+
+    primera, ultima = filas[0], filas[-1]
+    hay_siguiente = hacia_atras or hay_mas
+    hay_anterior = hay_mas if hacia_atras else clave is not None
+    return Pagina(
+        filas,
+        codificar_cursor(getattr(ultima, campo), ultima.pk) if hay_siguiente else None,
+        codificar_cursor(getattr(primera, campo), primera.pk) if hay_anterior else None,
+    )
@@ -5,17 +5,20 @@ import os
 def redondear_a_denom_py(monto, denominaciones_path=None):
     """
     Redondea el monto al valor más cercano (arriba o abajo) que se pueda formar con las denominaciones válidas de PYG.
+
+    Por defecto usa el catálogo en memoria de denominaciones (``tauser.catalogo_denominaciones``),
+    cargado una sola vez por proceso. Si se indica ``denominaciones_path`` se lee ese archivo JSON.
     """
     if denominaciones_path is None:
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-        denominaciones_path = os.path.join(base_dir, '../tauser/denominaciones.json')
-
-    with open(denominaciones_path, 'r') as f:
-        denominaciones = json.load(f)
+        from tauser.catalogo_denominaciones import catalogo_denominaciones
+        denoms_pyg = catalogo_denominaciones.valores('PYG')  # Ya ordenadas de mayor a menor
+    else:
+        with open(denominaciones_path, 'r') as f:
+            denominaciones = json.load(f)
 
-    # Filtrar solo denominaciones de PYG
-    denoms_pyg = [Decimal(str(d['value'])) for d in denominaciones if d['currency'] == 'PYG']
-    denoms_pyg = sorted(denoms_pyg, reverse=True)  # Ordenar de mayor a menor
+        # Filtrar solo denominaciones de PYG
+        denoms_pyg = [Decimal(str(d['value'])) for d in denominaciones if d['currency'] == 'PYG']
+        denoms_pyg = sorted(denoms_pyg, reverse=True)  # Ordenar de mayor a menor
 
     monto = Decimal(monto)
 
@@ -31,7 +34,7 @@ def redondear_a_denom_py(monto, denominaciones_path=None):
         return monto_actual
 
     # Buscar el múltiplo inferior y superior de la denominación más baja
-    denom_min = min(denoms_pyg)
+    denom_min = denoms_pyg[-1]
     abajo = (monto // denom_min) * denom_min
     arriba = ((monto + denom_min - 1) // denom_min) * denom_min
 
@@ -0,0 +1,178 @@
+"""
+Lecturas de reportes y tableros en una réplica de la base de datos.
+
+``RouterReplica`` (en ``DATABASE_ROUTERS``) manda las lecturas al alias
+``REPLICA_ALIAS`` solo mientras está activo ``en_replica()``; las vistas lo
+activan con el decorador ``lectura_en_replica``. Todo lo demás (escrituras,
+migraciones y cualquier lectura fuera de esas vistas) sigue en ``default``.
+
+Se lee del primario aunque la vista haya optado por la réplica cuando:
+
+- no hay réplica configurada (``DATABASES`` no tiene el alias);
+- la réplica está atrasada más de ``REPLICA_RETRASO_MAXIMO_SEGUNDOS`` o no
+  responde (el retraso se consulta como mucho cada
+  ``REPLICA_VERIFICACION_SEGUNDOS`` por proceso);
+- hay una transacción abierta en ``default`` (lo escrito todavía no llegó
+  a la réplica);
+- el modelo es de sesiones, autenticación o usuarios, o la tabla de la caché
+  (``APPS_SOLO_PRIMARIO``): un login recién hecho o una invalidación tienen
+  que verse enseguida.
+
+Para probarlo en local alcanza con dos bases: ``DB_REPLICA_NAME`` (y
+opcionalmente ``DB_REPLICA_HOST``/``DB_REPLICA_PORT``) agrega el alias
+``replica``. En los tests el alias existe siempre y es un espejo de
+``default``; como los ``TestCase`` corren dentro de una transacción, ahí se
+lee del primario sin consultar el retraso.
+"""
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+REPLICA_ALIAS = "replica"
+
+#: Apps cuyos modelos se leen siempre del primario.
+APPS_SOLO_PRIMARIO = {"admin", "auth", "contenttypes", "sessions", "usuarios", "mfa", "django_cache"}
+
+_en_replica = ContextVar("lectura_en_replica", default=False)
+
+# Retraso de PostgreSQL en segundos: 0 si la réplica ya aplicó todo lo recibido
+# o si no es una réplica (pg_is_in_recovery() falso)
+CONSULTA_RETRASO = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+def replica_configurada():
+    return REPLICA_ALIAS in connections.settings
+
+
+def retraso_replica():
+    """Segundos de atraso de la réplica, o None si no se pudo consultar."""
+    conexion = connections[REPLICA_ALIAS]
+    if conexion.vendor != "postgresql":
+        return 0.0
+    try:
+        with conexion.cursor() as cursor:
+            cursor.execute(CONSULTA_RETRASO)
+            return float(cursor.fetchone()[0])
+    except DatabaseError:
+        logger.warning("No se pudo consultar el retraso de la réplica", exc_info=True)
+        return None
+
+
+class EstadoReplica:
+    """Recuerda por proceso si la réplica está al día, consultándolo cada tanto."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._disponible = False
+        self._verificada_en = None
+
+    @staticmethod
+    def _intervalo():
+        return getattr(settings, "REPLICA_VERIFICACION_SEGUNDOS", 5)
+
+    @staticmethod
+    def _retraso_maximo():
+        return getattr(settings, "REPLICA_RETRASO_MAXIMO_SEGUNDOS", 30)
+
+    def disponible(self):
+        if not replica_configurada():
+            return False
+        ahora = time.monotonic()
+        with self._lock:
+            if self._verificada_en is not None and ahora - self._verificada_en < self._intervalo():
+                return self._disponible
+            # Mientras se consulta, los demás hilos usan el último resultado
+            self._verificada_en = ahora
+        retraso = retraso_replica()
+        disponible = retraso is not None and retraso <= self._retraso_maximo()
+        if not disponible:
+            logger.info("Réplica no disponible (retraso: %s s); se lee del primario", retraso)
+        with self._lock:
+            self._disponible = disponible
+        return disponible
+
+    def invalidar(self):
+        with self._lock:
+            self._verificada_en = None
+
+
+estado_replica = EstadoReplica()
+
+
+@contextmanager
+def en_replica():
+    """Dentro del bloque, las lecturas van a la réplica si está disponible."""
+    # Con una transacción abierta el router lee del primario: no hace falta consultar el retraso
+    token = _en_replica.set(not connections["default"].in_atomic_block and estado_replica.disponible())
+    try:
+        yield
+    finally:
+        _en_replica.reset(token)
+
+
+def leyendo_de_replica():
+    """
+    True si el bloque actual optó por la réplica y está disponible. Lo que se
+    calcule así puede estar atrasado: no debe guardarse en cachés que duran
+    más que ``REPLICA_RETRASO_MAXIMO_SEGUNDOS``.
+    """
+    return _en_replica.get()
+
+
+def _iterar_en_replica(contenido):
+    with en_replica():
+        yield from contenido
+
+
+def lectura_en_replica(vista):
+    """
+    Decorador de vistas de solo lectura (reportes, tableros, JSON de gráficos).
+    Las respuestas por partes también se generan leyendo de la réplica.
+    """
+
+    @functools.wraps(vista)
+    def envuelta(request, *args, **kwargs):
+        with en_replica():
+            response = vista(request, *args, **kwargs)
+        if getattr(response, "streaming", False):
+            response.streaming_content = _iterar_en_replica(response.streaming_content)
+        return response
+
+    return envuelta
+
+
+class RouterReplica:
+    """Router de ``DATABASE_ROUTERS``; ver la documentación del módulo."""
+
+    def db_for_read(self, model, **hints):
+        if not _en_replica.get() or model._meta.app_label in APPS_SOLO_PRIMARIO:
+            return None
+        if connections["default"].in_atomic_block:
+            return None
+        return REPLICA_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Son la misma base: una fila leída de la réplica puede apuntar a una del primario
+        if {obj1._state.db, obj2._state.db} <= {"default", REPLICA_ALIAS}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA_ALIAS
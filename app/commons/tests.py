@@ -1,9 +1,137 @@
 import unittest
+from unittest import mock
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from commons import replicas
+from monedas.models import Moneda
+from usuarios.models import User
+
 
 class CommonsSmokeTest(unittest.TestCase):
     def test_import(self):
         import commons
         self.assertTrue(True)
 
+
+class RouterReplicaTest(SimpleTestCase):
+    """Las lecturas van a la réplica solo dentro de las vistas que lo piden y si está al día."""
+
+    def setUp(self):
+        self.router = replicas.RouterReplica()
+        replicas.estado_replica.invalidar()
+        self.addCleanup(replicas.estado_replica.invalidar)
+
+    def _con_replica(self, retraso):
+        patches = [
+            mock.patch.object(replicas, "replica_configurada", return_value=True),
+            mock.patch.object(replicas, "retraso_replica", return_value=retraso),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    @mock.patch.object(replicas, "replica_configurada", return_value=False)
+    def test_sin_replica_configurada(self, _):
+        with replicas.en_replica():
+            self.assertIsNone(self.router.db_for_read(Moneda))
+
+    def test_solo_dentro_de_la_vista(self):
+        self._con_replica(0)
+        vistos = []
+
+        @replicas.lectura_en_replica
+        def vista(request):
+            vistos.append((self.router.db_for_read(Moneda), self.router.db_for_read(User)))
+            return HttpResponse()
+
+        vista(None)
+        self.assertEqual(vistos, [(replicas.REPLICA_ALIAS, None)])
+        self.assertIsNone(self.router.db_for_read(Moneda))
+        self.assertEqual(self.router.db_for_write(Moneda), "default")
+
+    def test_respuesta_por_partes(self):
+        self._con_replica(0)
+
+        @replicas.lectura_en_replica
+        def vista(request):
+            return StreamingHttpResponse(iter([b"x"]))
+
+        response = vista(None)
+        self.assertIsNone(self.router.db_for_read(Moneda))
+        for _ in response.streaming_content:
+            self.assertEqual(self.router.db_for_read(Moneda), replicas.REPLICA_ALIAS)
+
+    @override_settings(REPLICA_RETRASO_MAXIMO_SEGUNDOS=30)
+    def test_replica_atrasada_o_caida(self):
+        for retraso in (31, None):
+            replicas.estado_replica.invalidar()
+            with self.subTest(retraso=retraso):
+                self._con_replica(retraso)
+                with replicas.en_replica():
+                    self.assertIsNone(self.router.db_for_read(Moneda))
+
+    @override_settings(REPLICA_VERIFICACION_SEGUNDOS=60)
+    def test_retraso_consultado_cada_tanto(self):
+        self._con_replica(0)
+        for _ in range(3):
+            with replicas.en_replica():
+                pass
+        self.assertEqual(replicas.retraso_replica.call_count, 1)
+
+
+@unittest.skipUnless(
+    replicas.REPLICA_ALIAS in settings.DATABASES,
+    "Requiere el alias replica (global_exchange.settings.test)",
+)
+class RouterReplicaBaseDeDatosTest(TransactionTestCase):
+    """
+    Con el alias ``replica`` de los tests: una segunda conexión, espejo de la
+    base de pruebas (ver global_exchange/settings/test.py). Es
+    TransactionTestCase porque dentro de una transacción abierta el router lee
+    siempre del primario.
+    """
+
+    databases = {"default"} | ({replicas.REPLICA_ALIAS} & set(settings.DATABASES))
+
+    def setUp(self):
+        replicas.estado_replica.invalidar()
+        self.addCleanup(replicas.estado_replica.invalidar)
+        self.moneda = Moneda.objects.create(codigo="XRP", nombre="Moneda réplica")
+
+    def test_vista_lee_de_la_replica(self):
+        @replicas.lectura_en_replica
+        def vista(request):
+            return HttpResponse(Moneda.objects.get(pk=self.moneda.pk)._state.db)
+
+        with CaptureQueriesContext(connections[replicas.REPLICA_ALIAS]) as en_replica, \
+                CaptureQueriesContext(connections["default"]) as en_primario:
+            response = vista(None)
+        self.assertEqual(response.content.decode(), replicas.REPLICA_ALIAS)
+        self.assertEqual(len(en_replica), 1)
+        self.assertEqual(len(en_primario), 0)
+
+        # Fuera de la vista se lee del primario
+        self.assertEqual(Moneda.objects.get(pk=self.moneda.pk)._state.db, "default")
+
+    def test_respuesta_por_partes_lee_de_la_replica(self):
+        def filas():
+            for moneda in Moneda.objects.filter(pk=self.moneda.pk):
+                yield moneda.codigo.encode()
+
+        @replicas.lectura_en_replica
+        def vista(request):
+            return StreamingHttpResponse(filas())
+
+        response = vista(None)
+        with CaptureQueriesContext(connections[replicas.REPLICA_ALIAS]) as en_replica:
+            self.assertEqual(b"".join(response.streaming_content), b"XRP")
+        self.assertEqual(len(en_replica), 1)
+
+
 if __name__ == "__main__":
     unittest.main()
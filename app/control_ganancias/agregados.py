@@ -0,0 +1,115 @@
+"""
+Agregados de ganancias para el dashboard de control de ganancias.
+
+Cada función recibe un queryset ya filtrado y resuelve su agrupación con una
+sola consulta (``values()`` + ``annotate(Sum, Count)``). Las ganancias se
+devuelven como ``Decimal`` (0 cuando no hay filas).
+
+El queryset puede ser de ``Transaccion`` (``transacciones_con_ganancia``; las
+fechas se agrupan con ``TruncDate`` en la zona horaria local, igual que los
+filtros ``fecha__date``) o de la tabla resumen ``GananciaDiaria``
+(``ganancias_diarias``), que tiene a lo sumo una fila por día y combinación de
+dimensiones: el costo ya no depende de cuántas transacciones haya en el rango.
+"""
+from decimal import Decimal
+
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+from clientes.models import Cliente
+from commons.enums import EstadoTransaccionEnum, TipoTransaccionEnum
+from payments.models import PaymentMethod
+from transaccion.models import Transaccion
+from .models import GananciaDiaria
+
+#: Estados cuyas transacciones generan ganancia.
+ESTADOS_CON_GANANCIA = (EstadoTransaccionEnum.COMPLETADA, EstadoTransaccionEnum.PAGADA)
+
+CERO = Decimal('0')
+
+
+def transacciones_con_ganancia(desde, hasta):
+	"""Transacciones pagadas o completadas entre ``desde`` y ``hasta`` (fechas, inclusive)."""
+	return Transaccion.objects.filter(
+		estado__in=ESTADOS_CON_GANANCIA,
+		fecha__date__gte=desde,
+		fecha__date__lte=hasta,
+	)
+
+
+def ganancias_diarias(desde, hasta):
+	"""Filas de ``GananciaDiaria`` entre ``desde`` y ``hasta`` (fechas, inclusive)."""
+	return GananciaDiaria.objects.filter(fecha__gte=desde, fecha__lte=hasta)
+
+
+def _es_resumen(queryset):
+	return queryset.model is GananciaDiaria
+
+
+def _cantidad(queryset):
+	return Sum('cantidad') if _es_resumen(queryset) else Count('id')
+
+
+def _agrupar(queryset, campo, **agregados):
+	"""Filas ``values(campo).annotate(**agregados)`` ordenadas por ``campo``."""
+	return queryset.values(campo).annotate(**agregados).order_by(campo)
+
+
+def por_estado(queryset):
+	"""``{estado: {'cantidad': int, 'ganancia': Decimal}}`` para cada estado de ``ESTADOS_CON_GANANCIA``."""
+	resultado = {estado: {'cantidad': 0, 'ganancia': CERO} for estado in ESTADOS_CON_GANANCIA}
+	for fila in _agrupar(queryset, 'estado', cantidad=_cantidad(queryset), ganancia=Sum('ganancia')):
+		resultado[fila['estado']] = {'cantidad': fila['cantidad'], 'ganancia': fila['ganancia'] or CERO}
+	return resultado
+
+
+def por_fecha(queryset):
+	"""``[(fecha, ganancia)]`` por día, en orden cronológico."""
+	if _es_resumen(queryset):
+		filas = _agrupar(queryset, 'fecha', ganancia=Sum('ganancia'))
+		return [(fila['fecha'], fila['ganancia'] or CERO) for fila in filas]
+	filas = _agrupar(queryset.annotate(dia=TruncDate('fecha')), 'dia', ganancia=Sum('ganancia'))
+	return [(fila['dia'], fila['ganancia'] or CERO) for fila in filas]
+
+
+def por_moneda(queryset):
+	"""``[(codigo, ganancia)]`` ordenado por código de moneda."""
+	filas = _agrupar(queryset, 'moneda__codigo', ganancia=Sum('ganancia'))
+	return [(fila['moneda__codigo'], fila['ganancia'] or CERO) for fila in filas]
+
+
+def por_medio_pago(queryset):
+	"""
+	``{descripcion: ganancia}`` por medio de pago (las transacciones sin medio
+	de pago no se incluyen). Las descripciones se leen con una consulta más.
+	Sobre ``GananciaDiaria`` se agrupa por tipo de medio de pago.
+	"""
+	if _es_resumen(queryset):
+		etiquetas = dict(PaymentMethod.PAYMENT_TYPE_CHOICES)
+		return {
+			etiquetas.get(fila['medio'], fila['medio']): fila['ganancia'] or CERO
+			for fila in _agrupar(queryset, 'medio', ganancia=Sum('ganancia'))
+		}
+	filas = list(_agrupar(queryset.filter(medio_pago__isnull=False), 'medio_pago_id', ganancia=Sum('ganancia')))
+	medios = PaymentMethod.objects.in_bulk([fila['medio_pago_id'] for fila in filas])
+	resultado = {}
+	for fila in filas:
+		nombre = str(medios[fila['medio_pago_id']])
+		resultado[nombre] = resultado.get(nombre, CERO) + (fila['ganancia'] or CERO)
+	return resultado
+
+
+def por_tipo(queryset):
+	"""``{etiqueta: {'cantidad': int, 'ganancia': Decimal}}`` por tipo de transacción presente."""
+	etiquetas = dict(TipoTransaccionEnum.choices)
+	return {
+		etiquetas.get(fila['tipo'], fila['tipo']): {'cantidad': fila['cantidad'], 'ganancia': fila['ganancia'] or CERO}
+		for fila in _agrupar(queryset, 'tipo', cantidad=_cantidad(queryset), ganancia=Sum('ganancia'))
+	}
+
+
+def por_segmento(queryset):
+	"""``[(etiqueta, cantidad)]`` en el orden de ``Cliente.SEGMENTOS`` (incluye los segmentos sin transacciones)."""
+	campo = 'segmento' if _es_resumen(queryset) else 'cliente__tipo'
+	cantidades = {fila[campo]: fila['cantidad'] for fila in _agrupar(queryset, campo, cantidad=_cantidad(queryset))}
+	return [(etiqueta, cantidades.get(valor, 0)) for valor, etiqueta in Cliente.SEGMENTOS]
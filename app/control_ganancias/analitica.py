@@ -0,0 +1,155 @@
+"""
+Distribuciones de ganancia y volumen para rangos grandes de transacciones.
+
+``cargar`` lee de a bloques (``values_list(...).iterator(chunk_size=...)``)
+solo las columnas necesarias y las guarda en arreglos de la librería
+estándar (``array``): 8 bytes por valor, sin instancias de modelo ni
+``Decimal`` por fila. Sobre esas columnas se calculan percentiles (una sola
+ordenación por columna), histogramas, la distribución del spread por
+segmento de cliente y el volumen diario con ventana móvil, cada uno en una
+pasada.
+"""
+from array import array
+from bisect import bisect_right
+from collections import namedtuple
+from datetime import date
+from math import floor
+
+from django.utils import timezone
+
+from clientes.models import Cliente
+from commons.enums import TipoTransaccionEnum
+from . import agregados
+
+#: Columnas numéricas de ``Transaccion`` que se cargan como ``float``.
+NUMERICAS = ('monto_operado', 'monto_pyg', 'tasa_aplicada', 'comision', 'ganancia')
+
+#: Código de cada segmento en la columna ``segmento`` (posición en ``Cliente.SEGMENTOS``).
+SEGMENTOS = [codigo for codigo, _ in Cliente.SEGMENTOS]
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+FILAS_POR_BLOQUE = 5000
+
+Columnas = namedtuple('Columnas', NUMERICAS + ('dia', 'moneda_id', 'venta', 'segmento'))
+Columnas.__doc__ = """
+Transacciones en columnas paralelas: ``dia`` es el ordinal de la fecha local,
+``venta`` vale 1 para las ventas y 0 para las compras y ``segmento`` es la
+posición del segmento del cliente en ``SEGMENTOS`` (-1 si no tiene).
+"""
+
+
+def cargar(desde, hasta, chunk_size=FILAS_POR_BLOQUE):
+	"""
+	Columnas de las transacciones pagadas o completadas entre ``desde`` y
+	``hasta`` (fechas, inclusive).
+	"""
+	columnas = Columnas(*(array('d') for _ in NUMERICAS), array('l'), array('q'), array('b'), array('b'))
+	numericas = columnas[:len(NUMERICAS)]
+	codigo_segmento = {codigo: i for i, codigo in enumerate(SEGMENTOS)}
+	filas = (
+		agregados.transacciones_con_ganancia(desde, hasta)
+		.order_by()
+		.values_list(*NUMERICAS, 'fecha', 'moneda_id', 'tipo', 'cliente__tipo')
+		.iterator(chunk_size=chunk_size)
+	)
+	for fila in filas:
+		for destino, valor in zip(numericas, fila):
+			destino.append(float(valor or 0))
+		fecha, moneda_id, tipo, segmento = fila[len(NUMERICAS):]
+		columnas.dia.append(timezone.localdate(fecha).toordinal())
+		columnas.moneda_id.append(moneda_id)
+		columnas.venta.append(1 if tipo == TipoTransaccionEnum.VENTA else 0)
+		columnas.segmento.append(codigo_segmento.get(segmento, -1))
+	return columnas
+
+
+def percentiles(valores, ps=PERCENTILES):
+	"""
+	``{p: valor}`` con interpolación lineal entre las posiciones vecinas (el
+	mismo criterio que ``numpy.percentile``). Vacío si no hay valores.
+	"""
+	if not valores:
+		return {}
+	ordenados = sorted(valores)
+	ultimo = len(ordenados) - 1
+	resultado = {}
+	for p in ps:
+		posicion = ultimo * p / 100
+		i = floor(posicion)
+		j = min(i + 1, ultimo)
+		resultado[p] = ordenados[i] + (ordenados[j] - ordenados[i]) * (posicion - i)
+	return resultado
+
+
+def histograma(valores, clases=20, rango=None):
+	"""
+	``(bordes, conteos)`` con ``clases`` intervalos iguales entre el mínimo y
+	el máximo (o ``rango``); el último intervalo incluye su borde superior.
+	Los valores fuera de ``rango`` no se cuentan.
+	"""
+	if rango is None:
+		if not valores:
+			return [], []
+		rango = (min(valores), max(valores))
+	inferior, superior = rango
+	if superior <= inferior:
+		superior = inferior + 1
+	ancho = (superior - inferior) / clases
+	bordes = [inferior + ancho * i for i in range(clases)] + [superior]
+	conteos = [0] * clases
+	for valor in valores:
+		if valor < inferior or valor > superior:
+			continue
+		conteos[min(bisect_right(bordes, valor) - 1, clases - 1)] += 1
+	return bordes, conteos
+
+
+def spread(columnas):
+	"""Ganancia sobre el monto en guaraníes (%) de cada transacción; 0 si el monto es 0."""
+	return array('d', (
+		ganancia * 100 / pyg if pyg else 0.0
+		for ganancia, pyg in zip(columnas.ganancia, columnas.monto_pyg)
+	))
+
+
+def spread_por_segmento(columnas, ps=PERCENTILES):
+	"""
+	``{segmento: {'cantidad', 'promedio', 'percentiles'}}`` del spread de las
+	transacciones de cada segmento de cliente.
+	"""
+	valores = {codigo: array('d') for codigo in SEGMENTOS}
+	for segmento, valor in zip(columnas.segmento, spread(columnas)):
+		if segmento >= 0:
+			valores[SEGMENTOS[segmento]].append(valor)
+	return {
+		codigo: {
+			'cantidad': len(lista),
+			'promedio': sum(lista) / len(lista) if lista else None,
+			'percentiles': percentiles(lista, ps),
+		}
+		for codigo, lista in valores.items()
+	}
+
+
+def volumen_movil(columnas, ventana=7, columna='monto_pyg'):
+	"""
+	``[(fecha, volumen_del_dia, volumen_de_la_ventana)]`` para cada día entre
+	la primera y la última transacción (los días sin operaciones suman 0). La
+	ventana cubre el día y los ``ventana - 1`` anteriores.
+	"""
+	if not columnas.dia:
+		return []
+	primero = min(columnas.dia)
+	por_dia = [0.0] * (max(columnas.dia) - primero + 1)
+	for dia, monto in zip(columnas.dia, getattr(columnas, columna)):
+		por_dia[dia - primero] += monto
+
+	resultado = []
+	acumulado = 0.0
+	for i, volumen in enumerate(por_dia):
+		acumulado += volumen
+		if i >= ventana:
+			acumulado -= por_dia[i - ventana]
+		resultado.append((date.fromordinal(primero + i), volumen, acumulado))
+	return resultado
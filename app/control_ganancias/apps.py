@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ControlGananciasConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'control_ganancias'
+
+    def ready(self):
+        from . import signals
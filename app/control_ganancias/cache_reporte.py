@@ -0,0 +1,96 @@
+"""
+Caché de los totales y series de ``reporte_transacciones``.
+
+Cada entrada se guarda en la caché de Django bajo una clave que combina la
+generación actual con un hash de los filtros normalizados (sin vacíos, sin
+espacios, ordenados). Cualquier escritura de ``Transaccion`` incrementa la
+generación (ver ``control_ganancias/signals.py``): las entradas anteriores
+dejan de leerse y expiran solas a los ``REPORTE_TRANSACCIONES_CACHE_SEGUNDOS``.
+
+La caché es la compartida de ``CACHES`` (una tabla en la base), así que la
+generación es una sola para todos los workers y el barrido de expiración:
+una escritura en cualquier proceso invalida los reportes de todos. Si la
+clave de la generación se pierde (caché vaciada o depurada por
+``MAX_ENTRIES``) se vuelve a crear con la hora actual en nanosegundos, nunca
+con un número ya usado cuyas entradas podrían seguir guardadas.
+
+Lo calculado leyendo de la réplica (``commons.replicas``) puede estar atrasado
+hasta ``REPLICA_RETRASO_MAXIMO_SEGUNDOS``: se guarda igual, pero no más que
+ese tiempo, para que el atraso no quede fijo con la generación nueva durante
+todo el TTL.
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from commons import replicas
+
+CLAVE_GENERACION = 'control_ganancias:reporte:generacion'
+PREFIJO = 'control_ganancias:reporte'
+
+
+def _ttl():
+	return getattr(settings, 'REPORTE_TRANSACCIONES_CACHE_SEGUNDOS', 300)
+
+
+def _ttl_entrada():
+	"""TTL de una entrada nueva: acotado al retraso admitido si se leyó de la réplica."""
+	if replicas.leyendo_de_replica():
+		return min(_ttl(), getattr(settings, 'REPLICA_RETRASO_MAXIMO_SEGUNDOS', 30))
+	return _ttl()
+
+
+def _generacion_nueva():
+	# Mayor que cualquier generación anterior aunque se haya perdido la clave
+	return time.time_ns()
+
+
+def generacion():
+	"""Generación vigente; se crea si la caché no la tiene."""
+	actual = cache.get(CLAVE_GENERACION)
+	if actual is None:
+		nueva = _generacion_nueva()
+		cache.add(CLAVE_GENERACION, nueva, timeout=None)
+		actual = cache.get(CLAVE_GENERACION, nueva)
+	return actual
+
+
+def invalidar():
+	"""Pasa a la generación siguiente: ninguna entrada guardada vuelve a leerse."""
+	try:
+		cache.incr(CLAVE_GENERACION)
+	except ValueError:
+		# La clave no existía (caché vacía o depurada)
+		cache.add(CLAVE_GENERACION, _generacion_nueva(), timeout=None)
+
+
+def normalizar(filtros):
+	"""``{filtro: valor}`` sin valores vacíos y con los espacios recortados."""
+	normalizados = {}
+	for nombre, valor in filtros.items():
+		valor = (valor or '').strip()
+		if valor:
+			normalizados[nombre] = valor
+	return normalizados
+
+
+def clave(filtros):
+	datos = json.dumps(normalizar(filtros), sort_keys=True, separators=(',', ':'))
+	resumen = hashlib.sha256(datos.encode('utf-8')).hexdigest()[:32]
+	return f'{PREFIJO}:{generacion()}:{resumen}'
+
+
+def obtener(filtros, calcular):
+	"""
+	Devuelve el resultado guardado para ``filtros`` o lo calcula con
+	``calcular()`` y lo guarda.
+	"""
+	clave_filtros = clave(filtros)
+	resultado = cache.get(clave_filtros)
+	if resultado is None:
+		resultado = calcular()
+		cache.set(clave_filtros, resultado, timeout=_ttl_entrada())
+	return resultado
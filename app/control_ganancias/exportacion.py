@@ -0,0 +1,114 @@
+"""
+Exportación por partes del detalle de transacciones.
+
+Las filas salen de ``values_list(...).iterator(chunk_size=...)`` y se
+codifican de a una en CSV o JSON por línea (NDJSON); con ``gzip`` se
+comprimen con un único compresor a medida que se generan. La respuesta se
+arma con ``StreamingHttpResponse``, así que la memoria no depende de la
+cantidad de filas.
+"""
+import csv
+import json
+import zlib
+
+from django.utils import timezone
+
+#: (nombre de la columna, campo de ``Transaccion``)
+COLUMNAS = (
+	('id', 'id'),
+	('fecha', 'fecha'),
+	('tipo', 'tipo'),
+	('estado', 'estado'),
+	('moneda', 'moneda__codigo'),
+	('cliente_id', 'cliente_id'),
+	('cliente', 'cliente__nombre'),
+	('medio_pago', 'medio_pago__payment_type'),
+	('monto_operado', 'monto_operado'),
+	('monto_pyg', 'monto_pyg'),
+	('tasa_aplicada', 'tasa_aplicada'),
+	('comision', 'comision'),
+	('ganancia', 'ganancia'),
+)
+
+FORMATOS = {
+	'csv': ('text/csv; charset=utf-8', 'csv'),
+	'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+#: Filas leídas de la base por cada ida y vuelta.
+FILAS_POR_BLOQUE = 2000
+
+#: Bytes que se juntan antes de entregar un trozo de la respuesta.
+BYTES_POR_TROZO = 64 * 1024
+
+
+class _Eco:
+	"""Pseudo-archivo para ``csv.writer``: devuelve la línea en lugar de guardarla."""
+
+	def write(self, valor):
+		return valor
+
+
+def _texto(valor):
+	if valor is None:
+		return ''
+	if hasattr(valor, 'tzinfo'):
+		return timezone.localtime(valor).isoformat()
+	return str(valor)
+
+
+def _filas(transacciones):
+	campos = [campo for _, campo in COLUMNAS]
+	return transacciones.order_by('fecha', 'id').values_list(*campos).iterator(chunk_size=FILAS_POR_BLOQUE)
+
+
+def lineas_csv(transacciones):
+	escritor = csv.writer(_Eco())
+	yield escritor.writerow([nombre for nombre, _ in COLUMNAS])
+	for fila in _filas(transacciones):
+		yield escritor.writerow([_texto(valor) for valor in fila])
+
+
+def lineas_ndjson(transacciones):
+	nombres = [nombre for nombre, _ in COLUMNAS]
+	for fila in _filas(transacciones):
+		registro = {
+			nombre: valor if valor is None or isinstance(valor, int) else _texto(valor)
+			for nombre, valor in zip(nombres, fila)
+		}
+		yield json.dumps(registro, ensure_ascii=False) + '\n'
+
+
+def _en_trozos(lineas):
+	"""Agrupa las líneas en trozos de unos ``BYTES_POR_TROZO`` bytes."""
+	trozo = []
+	tamano = 0
+	for linea in lineas:
+		datos = linea.encode('utf-8')
+		trozo.append(datos)
+		tamano += len(datos)
+		if tamano >= BYTES_POR_TROZO:
+			yield b''.join(trozo)
+			trozo = []
+			tamano = 0
+	if trozo:
+		yield b''.join(trozo)
+
+
+def _comprimido(trozos):
+	compresor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+	for trozo in trozos:
+		datos = compresor.compress(trozo)
+		if datos:
+			yield datos
+	yield compresor.flush()
+
+
+def contenido(transacciones, formato, comprimir=False):
+	"""
+	Generador de bytes con las transacciones en ``formato`` ('csv' o
+	'ndjson'), comprimido con gzip si ``comprimir``.
+	"""
+	lineas = lineas_csv(transacciones) if formato == 'csv' else lineas_ndjson(transacciones)
+	trozos = _en_trozos(lineas)
+	return _comprimido(trozos) if comprimir else trozos
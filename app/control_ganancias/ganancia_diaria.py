@@ -0,0 +1,190 @@
+"""
+Mantenimiento de ``GananciaDiaria``.
+
+Cada transacción pagada o completada suma una unidad, su ganancia y sus montos
+a la fila de su día (zona horaria local), moneda, tipo, segmento del cliente,
+tipo de medio de pago y estado. Las señales de ``control_ganancias/signals.py``
+comparan los valores leídos de la base (``Transaccion._valores_ganancia``)
+con los guardados y aplican la diferencia con ``F()`` en la misma
+transacción de BD que el cambio: entrar o salir de PAGADA/COMPLETADA, pasar
+de una a otra o cambiar de montos mueve solo las filas afectadas.
+
+Si no se conocen los valores anteriores (instancia no leída de la base o
+campos diferidos) se recalcula el día desde ``Transaccion``. Lo mismo si hay
+que descontar de una fila que no existe (días anteriores a la tabla que
+todavía no se reconstruyeron): nunca se crean filas negativas. ``reconstruir``
+rehace la tabla por tramos de días; lo usa ``manage.py reconstruir_ganancias_diarias``,
+que entrypoint.sh corre con ``--si-vacia`` en cada despliegue.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from clientes.models import Cliente
+from commons.enums import EstadoTransaccionEnum, PaymentTypeEnum
+from payments.models import PaymentMethod
+from transaccion.models import Transaccion
+from .models import GananciaDiaria
+
+#: Estados cuyas transacciones se contabilizan.
+ESTADOS_CONTABILIZADOS = (EstadoTransaccionEnum.PAGADA, EstadoTransaccionEnum.COMPLETADA)
+
+#: Medio registrado para las transacciones sin medio de pago.
+SIN_MEDIO = PaymentTypeEnum.EFECTIVO.value
+
+CENTAVOS = Decimal('0.01')
+
+
+def _decimal(valor):
+	return Decimal(str(valor or 0)).quantize(CENTAVOS)
+
+
+def _contabilizada(valores):
+	return valores is not None and valores[0] in ESTADOS_CONTABILIZADOS
+
+
+def _aportes(lista_valores):
+	"""
+	``{clave: [cantidad, ganancia, monto_operado, monto_pyg]}`` de los valores
+	contabilizados (tuplas de ``Transaccion.CAMPOS_GANANCIA``), con a lo sumo
+	una consulta por clientes y otra por medios de pago.
+	"""
+	lista_valores = [v for v in lista_valores if _contabilizada(v)]
+	if not lista_valores:
+		return {}
+	segmentos = dict(Cliente.objects.filter(id__in={v[4] for v in lista_valores}).values_list('id', 'tipo'))
+	medio_ids = {v[5] for v in lista_valores if v[5] is not None}
+	medios = dict(PaymentMethod.objects.filter(id__in=medio_ids).values_list('id', 'payment_type')) if medio_ids else {}
+
+	aportes = {}
+	for estado, fecha, moneda_id, tipo, cliente_id, medio_pago_id, ganancia, operado, pyg in lista_valores:
+		clave = (
+			timezone.localdate(fecha), moneda_id, tipo, segmentos.get(cliente_id, ''),
+			medios.get(medio_pago_id, SIN_MEDIO), estado,
+		)
+		aporte = aportes.setdefault(clave, [0, Decimal('0'), Decimal('0'), Decimal('0')])
+		aporte[0] += 1
+		aporte[1] += _decimal(ganancia)
+		aporte[2] += _decimal(operado)
+		aporte[3] += _decimal(pyg)
+	return aportes
+
+
+def _aplicar(clave, cantidad, ganancia, operado, pyg, crear=True):
+	"""Suma el delta a la fila de ``clave``; False si no existe y ``crear`` es falso."""
+	fecha, moneda_id, tipo, segmento, medio, estado = clave
+	filtro = {
+		'fecha': fecha, 'moneda_id': moneda_id, 'tipo': tipo,
+		'segmento': segmento, 'medio': medio, 'estado': estado,
+	}
+	cambios = {
+		'cantidad': F('cantidad') + cantidad,
+		'ganancia': F('ganancia') + ganancia,
+		'monto_operado': F('monto_operado') + operado,
+		'monto_pyg': F('monto_pyg') + pyg,
+	}
+	if GananciaDiaria.objects.filter(**filtro).update(**cambios):
+		return True
+	if not crear:
+		return False
+	_, creada = GananciaDiaria.objects.get_or_create(
+		**filtro, defaults={'cantidad': cantidad, 'ganancia': ganancia, 'monto_operado': operado, 'monto_pyg': pyg}
+	)
+	if not creada:
+		GananciaDiaria.objects.filter(**filtro).update(**cambios)
+	return True
+
+
+def registrar_cambio(anterior, nuevo):
+	"""
+	Aplica la diferencia entre dos estados de una transacción (tuplas de
+	``Transaccion.CAMPOS_GANANCIA``; None = no contabilizada o inexistente).
+	"""
+	if not (_contabilizada(anterior) or _contabilizada(nuevo)) or anterior == nuevo:
+		return
+	quitar = _aportes([anterior])
+	sumar = _aportes([nuevo])
+	claves = sorted(set(quitar) | set(sumar))
+	with transaction.atomic():
+		for clave in claves:
+			menos = quitar.get(clave, (0, 0, 0, 0))
+			mas = sumar.get(clave, (0, 0, 0, 0))
+			delta = [m - q for m, q in zip(mas, menos)]
+			# La fila de lo que se descuenta tiene que existir; si no, la tabla no
+			# tenía ese día y se rehacen los días afectados desde Transaccion
+			if any(delta) and not _aplicar(clave, *delta, crear=clave not in quitar):
+				for dia in sorted({c[0] for c in claves}):
+					recalcular(dia)
+				return
+
+
+def _filas_desde_transacciones(desde, hasta):
+	"""Arma (sin guardar) las filas de ``GananciaDiaria`` de los días ``desde``..``hasta``."""
+	filas = (
+		Transaccion.objects.filter(
+			estado__in=ESTADOS_CONTABILIZADOS, fecha__date__gte=desde, fecha__date__lte=hasta,
+		)
+		.annotate(dia=TruncDate('fecha'))
+		.values('dia', 'moneda_id', 'tipo', 'cliente__tipo', 'medio_pago__payment_type', 'estado')
+		.annotate(
+			cantidad=Count('id'),
+			suma_ganancia=Coalesce(Sum('ganancia'), Decimal('0')),
+			suma_operado=Sum('monto_operado'),
+			suma_pyg=Sum('monto_pyg'),
+		)
+		.order_by()
+	)
+	return [
+		GananciaDiaria(
+			fecha=fila['dia'], moneda_id=fila['moneda_id'], tipo=fila['tipo'], segmento=fila['cliente__tipo'],
+			medio=fila['medio_pago__payment_type'] or SIN_MEDIO, estado=fila['estado'],
+			cantidad=fila['cantidad'], ganancia=fila['suma_ganancia'],
+			monto_operado=fila['suma_operado'], monto_pyg=fila['suma_pyg'],
+		)
+		for fila in filas.iterator()
+	]
+
+
+def recalcular(desde, hasta=None):
+	"""Rehace desde ``Transaccion`` las filas de los días ``desde``..``hasta``. Devuelve las filas creadas."""
+	hasta = hasta or desde
+	with transaction.atomic():
+		filas = _filas_desde_transacciones(desde, hasta)
+		GananciaDiaria.objects.filter(fecha__gte=desde, fecha__lte=hasta).delete()
+		GananciaDiaria.objects.bulk_create(filas)
+	return len(filas)
+
+
+def reconstruir(desde=None, hasta=None, dias_por_lote=31):
+	"""
+	Rehace la tabla entre ``desde`` y ``hasta`` (por defecto, todo el historial)
+	en tramos de ``dias_por_lote`` días, cada uno en su propia transacción de BD.
+
+	Returns:
+		int: filas creadas.
+	"""
+	completo = desde is None and hasta is None
+	rango = Transaccion.objects.filter(estado__in=ESTADOS_CONTABILIZADOS).aggregate(
+		primera=Min('fecha'), ultima=Max('fecha'),
+	)
+	if rango['primera'] is None:
+		if completo:
+			GananciaDiaria.objects.all().delete()
+		return 0
+	desde = desde or timezone.localdate(rango['primera'])
+	hasta = hasta or timezone.localdate(rango['ultima'])
+	if completo:
+		# Filas de días que ya no tienen transacciones contabilizadas
+		GananciaDiaria.objects.exclude(fecha__gte=desde, fecha__lte=hasta).delete()
+
+	creadas = 0
+	inicio = desde
+	while inicio <= hasta:
+		fin = min(inicio + timedelta(days=dias_por_lote - 1), hasta)
+		creadas += recalcular(inicio, fin)
+		inicio = fin + timedelta(days=1)
+	return creadas
@@ -0,0 +1,34 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from control_ganancias import ganancia_diaria
+from control_ganancias.models import GananciaDiaria
+
+
+class Command(BaseCommand):
+    help = (
+        'Reconstruye la tabla de ganancias diarias desde el historial de transacciones, '
+        'por tramos de días (cada tramo en su propia transacción de base de datos).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help='Primer día a reconstruir (YYYY-MM-DD); por defecto, la primera transacción')
+        parser.add_argument('--hasta', help='Último día a reconstruir (YYYY-MM-DD); por defecto, la última transacción')
+        parser.add_argument('--dias-por-lote', type=int, default=31, help='Días por tramo')
+        parser.add_argument('--si-vacia', action='store_true',
+                            help='Reconstruir solo si la tabla está vacía (para correr en cada despliegue)')
+
+    def handle(self, *args, **options):
+        try:
+            desde = date.fromisoformat(options['desde']) if options['desde'] else None
+            hasta = date.fromisoformat(options['hasta']) if options['hasta'] else None
+        except ValueError as e:
+            raise CommandError(f'Fecha inválida: {e}')
+        if options['dias_por_lote'] < 1:
+            raise CommandError('--dias-por-lote debe ser mayor a cero')
+        if options['si_vacia'] and GananciaDiaria.objects.exists():
+            self.stdout.write('La tabla de ganancias diarias ya tiene datos; no se reconstruye')
+            return
+        creadas = ganancia_diaria.reconstruir(desde, hasta, dias_por_lote=options['dias_por_lote'])
+        self.stdout.write(self.style.SUCCESS(f'Ganancias diarias reconstruidas: {creadas}'))
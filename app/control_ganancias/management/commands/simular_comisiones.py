@@ -0,0 +1,81 @@
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+
+from control_ganancias import simulador
+
+
+def _pares(valores, opcion):
+    """``['CLAVE=VALOR', ...]`` -> ``{CLAVE: VALOR}``."""
+    resultado = {}
+    for valor in valores or []:
+        clave, separador, dato = valor.partition('=')
+        if not separador or not clave or not dato:
+            raise CommandError(f'{opcion} espera CLAVE=VALOR: {valor!r}')
+        resultado[clave.strip()] = dato.strip()
+    return resultado
+
+
+def _decimal(valor, opcion):
+    try:
+        numero = Decimal(valor)
+    except InvalidOperation:
+        raise CommandError(f'{opcion}: número inválido {valor!r}')
+    if not numero.is_finite():
+        raise CommandError(f'{opcion}: número inválido {valor!r}')
+    return numero
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula la ganancia y el monto en PYG de las transacciones pagadas y completadas '
+        'con otro esquema de comisiones y muestra las diferencias por moneda y segmento.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--comision', action='append', metavar='MONEDA=COMPRA:VENTA',
+                            help='Comisiones de compra y venta de una moneda (ej: USD=50:60)')
+        parser.add_argument('--descuento', action='append', metavar='SEGMENTO=PORCENTAJE',
+                            help='Descuento sobre la comisión de un segmento (ej: VIP=10)')
+        parser.add_argument('--metodo', action='append', metavar='TIPO=PORCENTAJE',
+                            help='Comisión de un tipo de método de pago (ej: tarjeta=3)')
+        parser.add_argument('--desde', help='Primer día a simular (YYYY-MM-DD)')
+        parser.add_argument('--hasta', help='Último día a simular (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        try:
+            desde = date.fromisoformat(options['desde']) if options['desde'] else None
+            hasta = date.fromisoformat(options['hasta']) if options['hasta'] else None
+        except ValueError as e:
+            raise CommandError(f'Fecha inválida: {e}')
+
+        comisiones = {}
+        for moneda, valor in _pares(options['comision'], '--comision').items():
+            compra, separador, venta = valor.partition(':')
+            if not separador:
+                raise CommandError(f'--comision espera MONEDA=COMPRA:VENTA: {moneda}={valor}')
+            comisiones[moneda.upper()] = (_decimal(compra, '--comision'), _decimal(venta, '--comision'))
+        descuentos = {
+            segmento.upper(): _decimal(valor, '--descuento')
+            for segmento, valor in _pares(options['descuento'], '--descuento').items()
+        }
+        porcentajes = {
+            tipo: _decimal(valor, '--metodo') for tipo, valor in _pares(options['metodo'], '--metodo').items()
+        }
+
+        esquema = simulador.escenario(comisiones, descuentos, porcentajes)
+        resultado = simulador.simular(esquema, desde, hasta)
+        for titulo, filas in (('Por moneda', resultado['por_moneda']), ('Por segmento', resultado['por_segmento'])):
+            self.stdout.write(titulo)
+            for clave, fila in filas:
+                self.stdout.write(self._linea(clave, fila))
+        self.stdout.write(self.style.SUCCESS(self._linea('Total', resultado['total'])))
+
+    @staticmethod
+    def _linea(clave, fila):
+        return (
+            f"  {clave}: {fila['cantidad']} transacciones | "
+            f"ganancia {fila['ganancia_actual']:.2f} -> {fila['ganancia_simulada']:.2f} ({fila['delta_ganancia']:+.2f}) | "
+            f"monto PYG {fila['monto_pyg_actual']:.2f} -> {fila['monto_pyg_simulado']:.2f} ({fila['delta_monto_pyg']:+.2f})"
+        )
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('monedas', '0009_auto_poblar_monedas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GananciaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('tipo', models.CharField(choices=[('compra', 'Compra'), ('venta', 'Venta')], max_length=10)),
+                ('segmento', models.CharField(choices=[('MIN', 'Minorista'), ('CORP', 'Corporativo'), ('VIP', 'VIP')], max_length=10)),
+                ('medio', models.CharField(choices=[('efectivo', 'Efectivo'), ('tarjeta', 'Tarjeta'), ('cuenta_bancaria', 'Cuenta Bancaria'), ('billetera', 'Billetera')], max_length=20)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('pagada', 'Pagada'), ('anulada', 'Anulada'), ('cancelada', 'Cancelada'), ('completada', 'Completada')], max_length=15)),
+                ('cantidad', models.IntegerField(default=0)),
+                ('ganancia', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('monto_operado', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('monto_pyg', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('moneda', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ganancias_diarias', to='monedas.moneda')),
+            ],
+            options={
+                'verbose_name': 'Ganancia diaria',
+                'verbose_name_plural': 'Ganancias diarias',
+                'constraints': [models.UniqueConstraint(fields=('fecha', 'moneda', 'tipo', 'segmento', 'medio', 'estado'), name='ganancia_diaria_unica')],
+            },
+        ),
+    ]
@@ -1,3 +1,41 @@
 from django.db import models
 
-# Create your models here.
+from clientes.models import Cliente
+from commons.enums import EstadoTransaccionEnum, TipoTransaccionEnum
+from monedas.models import Moneda
+from payments.models import PaymentMethod
+
+
+class GananciaDiaria(models.Model):
+	"""
+	Ganancia acumulada por día, moneda, tipo de operación, segmento del
+	cliente, tipo de medio de pago y estado (pagada o completada).
+
+	Se mantiene con señales sobre ``Transaccion`` (ver
+	``control_ganancias/ganancia_diaria.py``) y se puede reconstruir con
+	``manage.py reconstruir_ganancias_diarias``. El segmento es el del cliente
+	al momento de contabilizar la transacción.
+	"""
+	fecha = models.DateField()
+	moneda = models.ForeignKey(Moneda, on_delete=models.CASCADE, related_name='ganancias_diarias')
+	tipo = models.CharField(max_length=10, choices=TipoTransaccionEnum.choices)
+	segmento = models.CharField(max_length=10, choices=Cliente.SEGMENTOS)
+	# Tipo de medio de pago; "efectivo" si la transacción no tiene medio de pago
+	medio = models.CharField(max_length=20, choices=PaymentMethod.PAYMENT_TYPE_CHOICES)
+	estado = models.CharField(max_length=15, choices=EstadoTransaccionEnum.choices)
+	cantidad = models.IntegerField(default=0)
+	ganancia = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+	monto_operado = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+	monto_pyg = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+
+	class Meta:
+		verbose_name = 'Ganancia diaria'
+		verbose_name_plural = 'Ganancias diarias'
+		constraints = [
+			models.UniqueConstraint(
+				fields=['fecha', 'moneda', 'tipo', 'segmento', 'medio', 'estado'], name='ganancia_diaria_unica'
+			),
+		]
+
+	def __str__(self):
+		return f"{self.fecha} {self.moneda_id} {self.tipo}/{self.segmento}/{self.medio} ({self.estado}): {self.ganancia}"
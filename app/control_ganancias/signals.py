@@ -0,0 +1,44 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from transaccion.models import Transaccion
+from transaccion.signals import transacciones_modificadas
+from . import cache_reporte, ganancia_diaria
+
+
+@receiver(post_save, sender=Transaccion, dispatch_uid="ganancia_diaria_save_Transaccion")
+def actualizar_ganancia_diaria(sender, instance, created, raw=False, **kwargs):
+	"""
+	Aplica a ``GananciaDiaria`` la diferencia entre los valores anteriores y los
+	actuales de la transacción (alta, cambio de estado o de montos).
+	"""
+	if raw:
+		return
+	nuevo = instance.valores_ganancia()
+	anterior = None if created else getattr(instance, "_valores_ganancia", False)
+	if nuevo is None or anterior is False:
+		# No se conocen los valores anteriores: se recalcula el día desde la base
+		ganancia_diaria.recalcular(timezone.localdate(instance.fecha))
+	else:
+		ganancia_diaria.registrar_cambio(anterior, nuevo)
+	instance._valores_ganancia = nuevo
+
+
+@receiver(post_delete, sender=Transaccion, dispatch_uid="ganancia_diaria_delete_Transaccion")
+def descontar_ganancia_diaria(sender, instance, **kwargs):
+	valores = getattr(instance, "_valores_ganancia", None)
+	if valores is not None:
+		ganancia_diaria.registrar_cambio(valores, None)
+	elif instance.estado in ganancia_diaria.ESTADOS_CONTABILIZADOS:
+		ganancia_diaria.recalcular(timezone.localdate(instance.fecha))
+
+
+@receiver(post_save, sender=Transaccion, dispatch_uid="cache_reporte_save_Transaccion")
+@receiver(post_delete, sender=Transaccion, dispatch_uid="cache_reporte_delete_Transaccion")
+@receiver(transacciones_modificadas, dispatch_uid="cache_reporte_lote_Transaccion")
+def invalidar_cache_reporte(sender, **kwargs):
+	"""Descarta los reportes guardados ahora y otra vez al confirmar la transacción de BD."""
+	cache_reporte.invalidar()
+	transaction.on_commit(cache_reporte.invalidar)
@@ -0,0 +1,170 @@
+"""
+Simulador de esquemas de comisión sobre el historial de transacciones.
+
+Vuelve a calcular la ganancia y el monto en guaraníes de las transacciones
+pagadas y completadas con otras comisiones (``PrecioBaseComision``),
+descuentos por segmento (``TasaComision``) y porcentajes por tipo de método
+de pago (``ComisionMetodoPago``). Lo que no se indica se toma de la
+configuración vigente.
+
+El precio base de cada transacción se deduce de lo que quedó guardado
+(``tasa_aplicada`` más o menos ``comision``), así se conserva la cotización
+del momento y solo cambia la comisión. Como ganancia y monto son lineales
+en ``monto_operado`` para un mismo precio, las transacciones se agrupan en
+la base por (moneda, tipo, segmento, tipo de método, tasa y comisión) y
+cada grupo se recalcula una vez con ``transaccion.matriz_precios.calcular_celda``,
+la misma aritmética que ``calcular_transaccion``. El monto simulado no se
+redondea a denominaciones por transacción: difiere del que daría
+``calcular_transaccion`` en menos de media denominación mínima de PYG por
+transacción.
+"""
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db.models import Count, Sum
+
+from clientes.models import Cliente, TasaComision
+from commons.enums import TipoTransaccionEnum
+from monedas.models import PrecioBaseComision
+from payments.models import ComisionMetodoPago
+from transaccion.matriz_precios import calcular_celda
+from transaccion.models import Transaccion
+from .agregados import ESTADOS_CON_GANANCIA
+from .ganancia_diaria import SIN_MEDIO
+
+CERO = Decimal('0')
+
+Escenario = namedtuple('Escenario', ['comisiones', 'descuentos', 'porcentajes_metodo'])
+Escenario.__doc__ = """
+Esquema de comisiones: ``comisiones`` es ``{codigo_moneda: (comision_compra,
+comision_venta)}``, ``descuentos`` ``{segmento: porcentaje}`` y
+``porcentajes_metodo`` ``{tipo_metodo: porcentaje}``.
+"""
+
+CAMPOS = (
+	'cantidad', 'ganancia_actual', 'ganancia_simulada', 'delta_ganancia',
+	'monto_pyg_actual', 'monto_pyg_simulado', 'delta_monto_pyg',
+)
+
+
+def _decimales(valores):
+	return {clave: Decimal(str(valor)) for clave, valor in valores.items()}
+
+
+def escenario_vigente():
+	"""Escenario con la configuración actual de las tres tablas."""
+	comisiones = {
+		codigo: (Decimal(str(compra)), Decimal(str(venta)))
+		for codigo, compra, venta in PrecioBaseComision.objects.values_list(
+			'moneda__codigo', 'comision_compra', 'comision_venta',
+		)
+	}
+	segmentos = [codigo for codigo, _ in Cliente.SEGMENTOS]
+	vigentes = TasaComision.vigentes_por_tipo(segmentos)
+	descuentos = {
+		segmento: Decimal(str(vigentes[segmento].porcentaje)) if segmento in vigentes else CERO
+		for segmento in segmentos
+	}
+	porcentajes = _decimales(dict(ComisionMetodoPago.objects.values_list('tipo_metodo', 'porcentaje_comision')))
+	return Escenario(comisiones, descuentos, porcentajes)
+
+
+def escenario(comisiones=None, descuentos=None, porcentajes_metodo=None):
+	"""El escenario vigente con los valores indicados reemplazados."""
+	vigente = escenario_vigente()
+	return Escenario(
+		{**vigente.comisiones, **{codigo: tuple(Decimal(str(v)) for v in par) for codigo, par in (comisiones or {}).items()}},
+		{**vigente.descuentos, **_decimales(descuentos or {})},
+		{**vigente.porcentajes_metodo, **_decimales(porcentajes_metodo or {})},
+	)
+
+
+def _grupos(desde=None, hasta=None):
+	transacciones = Transaccion.objects.filter(estado__in=ESTADOS_CON_GANANCIA)
+	if desde:
+		transacciones = transacciones.filter(fecha__date__gte=desde)
+	if hasta:
+		transacciones = transacciones.filter(fecha__date__lte=hasta)
+	return (
+		transacciones
+		.values('moneda__codigo', 'tipo', 'cliente__tipo', 'medio_pago__payment_type', 'tasa_aplicada', 'comision')
+		.annotate(
+			cantidad=Count('id'),
+			suma_operado=Sum('monto_operado'),
+			suma_pyg=Sum('monto_pyg'),
+			suma_ganancia=Sum('ganancia'),
+		)
+		.order_by()
+		.iterator()
+	)
+
+
+def _simular_grupo(grupo, esquema):
+	"""``(ganancia, monto_pyg)`` simulados del grupo; None si la moneda no tiene comisiones."""
+	comisiones = esquema.comisiones.get(grupo['moneda__codigo'])
+	if comisiones is None:
+		return None
+	tipo = grupo['tipo']
+	tasa = Decimal(grupo['tasa_aplicada'])
+	comision_guardada = Decimal(grupo['comision'])
+	precio_base = tasa + comision_guardada if tipo == TipoTransaccionEnum.VENTA else tasa - comision_guardada
+	celda = calcular_celda(
+		(precio_base, *comisiones), tipo,
+		esquema.descuentos.get(grupo['cliente__tipo'], CERO),
+		esquema.porcentajes_metodo.get(grupo['medio_pago__payment_type'] or SIN_MEDIO),
+	)
+	operado = Decimal(grupo['suma_operado'] or 0)
+	return operado * celda.comision_final, operado * celda.factor_pyg
+
+
+def _fila_vacia():
+	return {**dict.fromkeys(CAMPOS, CERO), 'cantidad': 0}
+
+
+def _acumular(totales, clave, cantidad, actual, simulado):
+	fila = totales.setdefault(clave, _fila_vacia())
+	fila['cantidad'] += cantidad
+	fila['ganancia_actual'] += actual[0]
+	fila['ganancia_simulada'] += simulado[0]
+	fila['monto_pyg_actual'] += actual[1]
+	fila['monto_pyg_simulado'] += simulado[1]
+
+
+def _filas(totales):
+	filas = []
+	for clave in sorted(totales):
+		fila = totales[clave]
+		fila['delta_ganancia'] = fila['ganancia_simulada'] - fila['ganancia_actual']
+		fila['delta_monto_pyg'] = fila['monto_pyg_simulado'] - fila['monto_pyg_actual']
+		filas.append((clave, fila))
+	return filas
+
+
+def simular(esquema=None, desde=None, hasta=None):
+	"""
+	Compara las transacciones pagadas y completadas (opcionalmente entre
+	``desde`` y ``hasta``) con lo que habrían dado bajo ``esquema`` (por
+	defecto, el vigente).
+
+	Returns:
+		dict: ``por_moneda`` y ``por_segmento`` son listas ``(clave, fila)``
+		y ``total`` una fila; cada fila tiene ``cantidad``,
+		``ganancia_actual``, ``ganancia_simulada``, ``delta_ganancia``,
+		``monto_pyg_actual``, ``monto_pyg_simulado`` y ``delta_monto_pyg``.
+	"""
+	esquema = esquema or escenario_vigente()
+	por_moneda = {}
+	por_segmento = {}
+	total = {}
+	for grupo in _grupos(desde, hasta):
+		actual = (Decimal(grupo['suma_ganancia'] or 0), Decimal(grupo['suma_pyg'] or 0))
+		simulado = _simular_grupo(grupo, esquema) or actual
+		for totales, clave in (
+			(por_moneda, grupo['moneda__codigo']), (por_segmento, grupo['cliente__tipo']), (total, None),
+		):
+			_acumular(totales, clave, grupo['cantidad'], actual, simulado)
+	return {
+		'por_moneda': _filas(por_moneda),
+		'por_segmento': _filas(por_segmento),
+		'total': _filas(total)[0][1] if total else _fila_vacia(),
+	}
@@ -1,3 +1,392 @@
-from django.test import TestCase
+from datetime import date, datetime, time
+from decimal import Decimal
+import csv
+import gzip
+import io
+import json
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from clientes.models import Cliente
+from commons import replicas
+from commons.enums import EstadoTransaccionEnum, PaymentTypeEnum, TipoTransaccionEnum
+from monedas.models import Moneda, PrecioBaseComision
+from payments.models import PaymentMethod
+from transaccion.models import Transaccion
+from transaccion.services import cancelar_transacciones
+
+from . import agregados, analitica, cache_reporte, ganancia_diaria, simulador
+from .models import GananciaDiaria
+
+
+class AgregadosGananciasTest(TestCase):
+	"""
+	Los agregados del dashboard se calculan en la base. Las transacciones se
+	ubican en 2030 para no mezclarse con las que crean las migraciones.
+	"""
+
+	def setUp(self):
+		self.minorista = Cliente.objects.create(nombre='Cliente MIN', tipo='MIN')
+		self.corporativo = Cliente.objects.create(nombre='Cliente CORP', tipo='CORP')
+		self.usd, _ = Moneda.objects.get_or_create(codigo='USD', defaults={'nombre': 'Dólar'})
+		self.eur, _ = Moneda.objects.get_or_create(codigo='EUR', defaults={'nombre': 'Euro'})
+		self.medio = PaymentMethod.objects.create(
+			cliente=self.corporativo, payment_type=PaymentTypeEnum.CUENTA_BANCARIA.value,
+			banco='Banco Test', numero_cuenta='123',
+		)
+		# ganancia = monto_operado * comision
+		self._crear(self.minorista, self.usd, TipoTransaccionEnum.COMPRA, '100', '2', EstadoTransaccionEnum.COMPLETADA, 5)
+		self._crear(self.corporativo, self.usd, TipoTransaccionEnum.VENTA, '50', '1', EstadoTransaccionEnum.PAGADA, 5, self.medio)
+		self._crear(self.minorista, self.eur, TipoTransaccionEnum.COMPRA, '10', '3', EstadoTransaccionEnum.PAGADA, 6)
+		self._crear(self.minorista, self.eur, TipoTransaccionEnum.COMPRA, '999', '3', EstadoTransaccionEnum.PENDIENTE, 6)
+		# Las fechas se movieron con update(): se rehace la tabla resumen
+		ganancia_diaria.reconstruir()
+
+	def _crear(self, cliente, moneda, tipo, monto, comision, estado, dia, medio_pago=None):
+		tx = Transaccion.objects.create(
+			cliente=cliente, moneda=moneda, tipo=tipo, monto_operado=Decimal(monto), monto_pyg=Decimal(monto),
+			tasa_aplicada=Decimal('1'), comision=Decimal(comision), estado=estado, medio_pago=medio_pago,
+		)
+		fecha = timezone.make_aware(datetime.combine(date(2030, 1, dia), time(12)))
+		Transaccion.objects.filter(pk=tx.pk).update(fecha=fecha)
+		return tx
+
+	def test_agregados(self):
+		qs = agregados.transacciones_con_ganancia(date(2030, 1, 1), date(2030, 1, 31))
+		estados = agregados.por_estado(qs)
+		self.assertEqual(estados[EstadoTransaccionEnum.COMPLETADA], {'cantidad': 1, 'ganancia': Decimal('200')})
+		self.assertEqual(estados[EstadoTransaccionEnum.PAGADA], {'cantidad': 2, 'ganancia': Decimal('80')})
+		self.assertEqual(agregados.por_fecha(qs), [(date(2030, 1, 5), Decimal('250')), (date(2030, 1, 6), Decimal('30'))])
+		self.assertEqual(agregados.por_moneda(qs), [('EUR', Decimal('30')), ('USD', Decimal('250'))])
+		self.assertEqual(agregados.por_medio_pago(qs), {str(self.medio): Decimal('50')})
+		self.assertEqual(agregados.por_tipo(qs)['Compra'], {'cantidad': 2, 'ganancia': Decimal('230')})
+		self.assertEqual(dict(agregados.por_segmento(qs)), {'Minorista': 2, 'Corporativo': 1, 'VIP': 0})
+
+	def test_dashboard_consultas_fijas(self):
+		url = reverse('dashboard_ganancias')
+		params = {'start_date': '2030-01-01', 'end_date': '2030-01-31'}
+		with CaptureQueriesContext(connection) as antes:
+			response = self.client.get(url, params)
+		self.assertEqual(response.context['ganancia_total'], Decimal('280'))
+		self.assertEqual(response.context['transacciones_pagadas'], 2)
+		self.assertEqual(json.loads(response.context['ganancias']), [250.0, 30.0])
+		self.assertEqual(json.loads(response.context['transacciones_por_tipo_cliente']), [2, 1, 0])
+
+		for dia in range(7, 12):
+			self._crear(self.corporativo, self.usd, TipoTransaccionEnum.VENTA, '1', '1', EstadoTransaccionEnum.PAGADA, dia, self.medio)
+		ganancia_diaria.reconstruir()
+		with CaptureQueriesContext(connection) as despues:
+			self.client.get(url, params)
+		self.assertEqual(len(despues), len(antes))
+
+
+class GananciaDiariaTest(TestCase):
+	"""La tabla resumen se mantiene con cada cambio de estado y coincide con la reconstrucción."""
+
+	def setUp(self):
+		self.cliente = Cliente.objects.create(nombre='Cliente VIP', tipo='VIP')
+		self.moneda, _ = Moneda.objects.get_or_create(codigo='USD', defaults={'nombre': 'Dólar'})
+		self.hoy = timezone.localdate()
+		# Las migraciones crean transacciones: la tabla arranca al día con ellas
+		ganancia_diaria.reconstruir()
+
+	def _fila(self, estado):
+		return GananciaDiaria.objects.filter(
+			fecha=self.hoy, moneda=self.moneda, segmento='VIP', medio=PaymentTypeEnum.EFECTIVO.value, estado=estado,
+		).values_list('cantidad', 'ganancia').first()
+
+	def _crear(self, monto='100', comision='2'):
+		return Transaccion.objects.create(
+			cliente=self.cliente, moneda=self.moneda, tipo=TipoTransaccionEnum.COMPRA, monto_operado=Decimal(monto),
+			monto_pyg=Decimal(monto), tasa_aplicada=Decimal('1'), comision=Decimal(comision),
+		)
+
+	def _instantanea(self):
+		return sorted(GananciaDiaria.objects.filter(cantidad__gt=0).values_list(
+			'fecha', 'moneda_id', 'tipo', 'segmento', 'medio', 'estado', 'cantidad', 'ganancia', 'monto_operado', 'monto_pyg',
+		))
+
+	def test_entra_y_sale_de_los_estados_contabilizados(self):
+		tx = self._crear()
+		self.assertIsNone(self._fila(EstadoTransaccionEnum.PAGADA))
+
+		tx.estado = EstadoTransaccionEnum.PAGADA
+		tx.save()
+		self.assertEqual(self._fila(EstadoTransaccionEnum.PAGADA), (1, Decimal('200')))
+
+		# Leída de la base: se aplica solo la diferencia entre estados
+		tx = Transaccion.objects.get(pk=tx.pk)
+		tx.estado = EstadoTransaccionEnum.COMPLETADA
+		tx.save()
+		self.assertEqual(self._fila(EstadoTransaccionEnum.PAGADA), (0, Decimal('0')))
+		self.assertEqual(self._fila(EstadoTransaccionEnum.COMPLETADA), (1, Decimal('200')))
+
+		otra = self._crear('50', '1')
+		otra.estado = EstadoTransaccionEnum.COMPLETADA
+		otra.save()
+		self.assertEqual(self._fila(EstadoTransaccionEnum.COMPLETADA), (2, Decimal('250')))
+
+		tx.estado = EstadoTransaccionEnum.ANULADA
+		tx.save()
+		self.assertEqual(self._fila(EstadoTransaccionEnum.COMPLETADA), (1, Decimal('50')))
+
+		incremental = self._instantanea()
+		ganancia_diaria.reconstruir()
+		self.assertEqual(self._instantanea(), incremental)
+
+	def test_valores_desconocidos_recalculan_el_dia(self):
+		tx = self._crear()
+		Transaccion.objects.filter(pk=tx.pk).update(estado=EstadoTransaccionEnum.PAGADA, ganancia=Decimal('200'))
+		diferida = Transaccion.objects.only('id', 'estado', 'fecha').get(pk=tx.pk)
+		diferida.save(update_fields=['estado'])
+		self.assertEqual(self._fila(EstadoTransaccionEnum.PAGADA), (1, Decimal('200')))
+
+	def test_dia_sin_reconstruir_no_queda_negativo(self):
+		tx = self._crear()
+		tx.estado = EstadoTransaccionEnum.PAGADA
+		tx.save()
+		# Como una transacción anterior a la tabla: su día nunca se cargó
+		GananciaDiaria.objects.filter(fecha=self.hoy).delete()
+
+		tx = Transaccion.objects.get(pk=tx.pk)
+		tx.estado = EstadoTransaccionEnum.COMPLETADA
+		tx.save()
+		self.assertFalse(GananciaDiaria.objects.filter(cantidad__lt=0).exists())
+		self.assertEqual(self._fila(EstadoTransaccionEnum.COMPLETADA), (1, Decimal('200')))
+
+	def test_comando_si_vacia(self):
+		GananciaDiaria.objects.all().delete()
+		call_command('reconstruir_ganancias_diarias', '--si-vacia', stdout=io.StringIO())
+		cargadas = self._instantanea()
+		self.assertTrue(cargadas)
+		GananciaDiaria.objects.filter(pk=GananciaDiaria.objects.first().pk).delete()
+		call_command('reconstruir_ganancias_diarias', '--si-vacia', stdout=io.StringIO())
+		self.assertEqual(len(self._instantanea()), len(cargadas) - 1)
+
+
+class ExportarTransaccionesTest(TestCase):
+	"""La exportación aplica los filtros del reporte y se genera por partes."""
+
+	def setUp(self):
+		cliente = Cliente.objects.create(nombre='Cliente Export', tipo='MIN')
+		self.moneda, _ = Moneda.objects.get_or_create(codigo='XTS', defaults={'nombre': 'Moneda de prueba'})
+		for monto, estado in (('10', EstadoTransaccionEnum.PAGADA), ('20', EstadoTransaccionEnum.PENDIENTE)):
+			Transaccion.objects.create(
+				cliente=cliente, moneda=self.moneda, tipo=TipoTransaccionEnum.COMPRA, monto_operado=Decimal(monto),
+				monto_pyg=Decimal(monto), tasa_aplicada=Decimal('1'), comision=Decimal('1'), estado=estado,
+			)
+		self.url = reverse('exportar_transacciones')
+
+	def _cuerpo(self, response):
+		self.assertTrue(response.streaming)
+		return b''.join(response.streaming_content)
+
+	def test_csv_con_filtros(self):
+		response = self.client.get(self.url, {'moneda': 'XTS', 'estado': EstadoTransaccionEnum.PAGADA})
+		self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+		filas = list(csv.reader(io.StringIO(self._cuerpo(response).decode('utf-8'))))
+		self.assertEqual(filas[0][:5], ['id', 'fecha', 'tipo', 'estado', 'moneda'])
+		self.assertEqual(len(filas), 2)
+		self.assertEqual(filas[1][4], 'XTS')
+		self.assertEqual(filas[1][filas[0].index('monto_operado')], '10.00')
+
+	def test_ndjson_comprimido(self):
+		response = self.client.get(self.url, {'moneda': 'XTS', 'formato': 'ndjson', 'gzip': '1'})
+		self.assertEqual(response['Content-Type'], 'application/gzip')
+		self.assertIn('.ndjson.gz', response['Content-Disposition'])
+		registros = [json.loads(linea) for linea in gzip.decompress(self._cuerpo(response)).decode('utf-8').splitlines()]
+		self.assertEqual([r['monto_operado'] for r in registros], ['10.00', '20.00'])
+		self.assertEqual({r['moneda'] for r in registros}, {'XTS'})
+
+	def test_formato_invalido(self):
+		response = self.client.get(self.url, {'formato': 'xml'})
+		self.assertEqual(response.status_code, 400)
+
+
+class CacheReporteTest(TestCase):
+	"""Los totales del reporte se reutilizan por filtros hasta que cambia una transacción."""
+
+	def setUp(self):
+		cache.clear()
+		self.cliente = Cliente.objects.create(nombre='Cliente Reporte', tipo='MIN')
+		self.moneda, _ = Moneda.objects.get_or_create(codigo='XTS', defaults={'nombre': 'Moneda de prueba'})
+		self.url = reverse('reporte_transacciones')
+		self.params = {'moneda': 'XTS', 'estado': ''}
+
+	def _crear(self):
+		return Transaccion.objects.create(
+			cliente=self.cliente, moneda=self.moneda, tipo=TipoTransaccionEnum.VENTA, monto_operado=Decimal('10'),
+			monto_pyg=Decimal('10'), tasa_aplicada=Decimal('1'), comision=Decimal('1'),
+		)
+
+	def _contar_consultas(self, params):
+		"""Consultas del reporte, sin contar las de la caché (su tabla y los savepoints de ``set``)."""
+		with CaptureQueriesContext(connection) as consultas:
+			response = self.client.get(self.url, params)
+		propias = [c for c in consultas if 'django_cache' not in c['sql'] and 'SAVEPOINT' not in c['sql']]
+		return len(propias), response
+
+	def test_clave_normalizada(self):
+		self.assertEqual(
+			cache_reporte.clave({'moneda': ' XTS ', 'tipo': '', 'estado': None}),
+			cache_reporte.clave({'moneda': 'XTS'}),
+		)
+		self.assertNotEqual(cache_reporte.clave({'moneda': 'XTS'}), cache_reporte.clave({'moneda': 'USD'}))
+
+	def test_lo_leido_de_la_replica_se_guarda_con_ttl_acotado(self):
+		calculos = []
+
+		def calcular():
+			calculos.append(1)
+			return {'total': len(calculos)}
+
+		with mock.patch.object(replicas, 'leyendo_de_replica', return_value=True), \
+				mock.patch.object(cache_reporte.cache, 'set', wraps=cache_reporte.cache.set) as guardar, \
+				override_settings(REPORTE_TRANSACCIONES_CACHE_SEGUNDOS=300, REPLICA_RETRASO_MAXIMO_SEGUNDOS=30):
+			cache_reporte.obtener(self.params, calcular)
+			self.assertEqual(cache_reporte.obtener(self.params, calcular), {'total': 1})
+		self.assertEqual(len(calculos), 1)
+		self.assertEqual(guardar.call_args.kwargs['timeout'], 30)
+
+	def test_generacion_perdida_no_se_reutiliza(self):
+		anterior = cache_reporte.generacion()
+		cache_reporte.invalidar()
+		cache.delete(cache_reporte.CLAVE_GENERACION)
+		self.assertGreater(cache_reporte.generacion(), anterior + 1)
+
+	def test_reutiliza_e_invalida(self):
+		self._crear()
+		sin_cache, response = self._contar_consultas(self.params)
+		self.assertEqual(json.loads(response.context['transacciones_por_tipo_torta']), [0, 1])
+		con_cache, response = self._contar_consultas({'estado': '', 'moneda': 'XTS '})
+		self.assertEqual(con_cache, sin_cache - 3)
+		self.assertEqual(json.loads(response.context['transacciones_por_tipo_torta']), [0, 1])
+
+		tx = self._crear()
+		_, response = self._contar_consultas(self.params)
+		self.assertEqual(json.loads(response.context['transacciones_por_tipo_torta']), [0, 2])
+		pendientes = response.context['total_pendientes']
+
+		# Las escrituras en bloque también invalidan
+		cancelar_transacciones([tx])
+		_, response = self._contar_consultas(self.params)
+		self.assertEqual(response.context['total_pendientes'], pendientes - 1)
+
+	def test_mismo_filtro_con_espacios_mismo_resultado(self):
+		self._crear()
+		_, response = self._contar_consultas({'moneda': ' XTS '})
+		self.assertEqual(json.loads(response.context['transacciones_por_tipo_torta']), [0, 1])
+		self.assertEqual(response.context['filtros']['moneda'], 'XTS')
+		self.assertEqual(len(response.context['detalle_transacciones']), 1)
+		_, response = self._contar_consultas({'moneda': 'XTS'})
+		self.assertEqual(json.loads(response.context['transacciones_por_tipo_torta']), [0, 1])
+
+
+class AnaliticaTest(TestCase):
+	"""Distribuciones sobre columnas cargadas de a bloques (transacciones en 2030)."""
+
+	def setUp(self):
+		minorista = Cliente.objects.create(nombre='Cliente MIN', tipo='MIN')
+		vip = Cliente.objects.create(nombre='Cliente VIP', tipo='VIP')
+		moneda, _ = Moneda.objects.get_or_create(codigo='USD', defaults={'nombre': 'Dólar'})
+		# (cliente, monto_pyg, comision, día): ganancia = monto_operado * comision
+		for cliente, monto, comision, dia in (
+			(minorista, '100', '1', 1), (minorista, '100', '3', 1), (vip, '200', '1', 3), (vip, '50', '2', 8),
+		):
+			tx = Transaccion.objects.create(
+				cliente=cliente, moneda=moneda, tipo=TipoTransaccionEnum.COMPRA, monto_operado=Decimal(monto),
+				monto_pyg=Decimal(monto), tasa_aplicada=Decimal('1'), comision=Decimal(comision),
+				estado=EstadoTransaccionEnum.PAGADA,
+			)
+			fecha = timezone.make_aware(datetime.combine(date(2030, 1, dia), time(12)))
+			Transaccion.objects.filter(pk=tx.pk).update(fecha=fecha)
+
+	def test_percentiles_e_histograma(self):
+		self.assertEqual(analitica.percentiles([4, 1, 3, 2], (0, 25, 50, 100)), {0: 1, 25: 1.75, 50: 2.5, 100: 4})
+		self.assertEqual(analitica.percentiles([]), {})
+		bordes, conteos = analitica.histograma([0, 1, 2, 3, 4], clases=4)
+		self.assertEqual(bordes, [0, 1, 2, 3, 4])
+		self.assertEqual(conteos, [1, 1, 1, 2])
+
+	def test_columnas_y_distribuciones(self):
+		columnas = analitica.cargar(date(2030, 1, 1), date(2030, 1, 31), chunk_size=2)
+		self.assertEqual(sorted(columnas.ganancia), [100.0, 100.0, 200.0, 300.0])
+		spreads = analitica.spread_por_segmento(columnas)
+		self.assertEqual(spreads['MIN']['cantidad'], 2)
+		self.assertEqual(spreads['MIN']['promedio'], 200.0)
+		self.assertEqual(spreads['VIP']['percentiles'][50], 150.0)
+		self.assertEqual(spreads['CORP'], {'cantidad': 0, 'promedio': None, 'percentiles': {}})
+
+		movil = analitica.volumen_movil(columnas, ventana=3)
+		self.assertEqual(len(movil), 8)
+		self.assertEqual(movil[0], (date(2030, 1, 1), 200.0, 200.0))
+		self.assertEqual(movil[2], (date(2030, 1, 3), 200.0, 400.0))
+		self.assertEqual(movil[3][2], 200.0)
+		self.assertEqual(movil[7], (date(2030, 1, 8), 50.0, 50.0))
+
+	def test_vista(self):
+		response = self.client.get(reverse('distribuciones_ganancias'), {
+			'start_date': '2030-01-01', 'end_date': '2030-01-31', 'clases': '2',
+		})
+		datos = response.json()
+		self.assertEqual(datos['cantidad'], 4)
+		self.assertEqual(datos['histograma_ganancia']['conteos'], [2, 2])
+		self.assertEqual(datos['percentiles']['ganancia']['50'], 150.0)
+		self.assertEqual(len(datos['volumen_movil']), 8)
+
+
+class SimuladorComisionesTest(TestCase):
+	"""El historial se recalcula por grupos con otro esquema de comisiones (transacciones en 2030)."""
+
+	def setUp(self):
+		self.moneda, _ = Moneda.objects.get_or_create(codigo='XTS', defaults={'nombre': 'Moneda de prueba'})
+		PrecioBaseComision.objects.update_or_create(
+			moneda=self.moneda, defaults={'precio_base': 7000, 'comision_compra': 50, 'comision_venta': 60},
+		)
+		cliente = Cliente.objects.create(nombre='Cliente VIP', tipo='VIP')
+		# Compras de 10 unidades cotizadas a 7000 + 60; ganancia = 10 * 60
+		for _ in range(2):
+			tx = Transaccion.objects.create(
+				cliente=cliente, moneda=self.moneda, tipo=TipoTransaccionEnum.COMPRA, monto_operado=Decimal('10'),
+				monto_pyg=Decimal('70600'), tasa_aplicada=Decimal('7060'), comision=Decimal('60'),
+				estado=EstadoTransaccionEnum.PAGADA,
+			)
+			fecha = timezone.make_aware(datetime.combine(date(2030, 1, 1), time(12)))
+			Transaccion.objects.filter(pk=tx.pk).update(fecha=fecha)
+		self.sin_descuentos = {'descuentos': {'VIP': 0}, 'porcentajes_metodo': {PaymentTypeEnum.EFECTIVO.value: 0}}
+
+	def _simular(self, **cambios):
+		esquema = simulador.escenario(**{**self.sin_descuentos, **cambios})
+		return simulador.simular(esquema, desde=date(2030, 1, 1))
+
+	def test_esquema_vigente_no_cambia_nada(self):
+		total = self._simular()['total']
+		self.assertEqual(total['cantidad'], 2)
+		self.assertEqual(total['ganancia_actual'], Decimal('1200'))
+		self.assertEqual(total['delta_ganancia'], 0)
+		self.assertEqual(total['delta_monto_pyg'], 0)
+
+	def test_deltas_por_moneda_y_segmento(self):
+		resultado = self._simular(
+			comisiones={'XTS': (50, 80)}, descuentos={'VIP': 50},
+			porcentajes_metodo={PaymentTypeEnum.EFECTIVO.value: 1},
+		)
+		# Comisión final 80 - 50% = 40: tasa 7040 y 1% del método sobre 70400
+		fila = dict(resultado['por_moneda'])['XTS']
+		self.assertEqual(fila['ganancia_simulada'], Decimal('800'))
+		self.assertEqual(fila['delta_ganancia'], Decimal('-400'))
+		self.assertEqual(fila['monto_pyg_simulado'], Decimal('142208'))
+		self.assertEqual(fila['delta_monto_pyg'], Decimal('1008'))
+		self.assertEqual(dict(resultado['por_segmento'])['VIP']['delta_ganancia'], Decimal('-400'))
+
+	def test_comando(self):
+		salida = io.StringIO()
+		call_command('simular_comisiones', '--comision', 'XTS=50:70', '--desde', '2030-01-01', stdout=salida)
+		self.assertIn('XTS: 2 transacciones', salida.getvalue())
@@ -4,5 +4,7 @@ from . import views
 
 urlpatterns = [
     path('dashboard/', views.dashboard, name='dashboard_ganancias'),
+    path('dashboard/distribuciones/', views.distribuciones_ganancias, name='distribuciones_ganancias'),
     path('reporte-transacciones/', views.reporte_transacciones, name='reporte_transacciones'),
+    path('reporte-transacciones/exportar/', views.exportar_transacciones, name='exportar_transacciones'),
 ]
\ No newline at end of file
@@ -1,3 +1,6 @@
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
 
 from django.utils import timezone
@@ -5,13 +8,30 @@ from datetime import timedelta, datetime
 from transaccion.models import Transaccion
 from commons.enums import EstadoTransaccionEnum, TipoTransaccionEnum
 
-from collections import defaultdict
 import json
-from collections import Counter, defaultdict
 from clientes.models import Cliente
-from transaccion.models import Transaccion
+from commons.replicas import lectura_en_replica
 from monedas.models import Moneda
+from . import agregados, analitica, cache_reporte, exportacion
+
+FILTROS_REPORTE = ('fecha_desde', 'fecha_hasta', 'tipo', 'estado', 'moneda', 'cliente')
+
+
+def _rango_fechas(request):
+	"""``(desde, hasta)`` de los parámetros ``start_date``/``end_date``; por defecto, del 2024-01-01 a hoy."""
+	today = timezone.now().date()
+	default_start = datetime(2024, 1, 1).date()
+	start_date = request.GET.get('start_date', default_start.strftime('%Y-%m-%d'))
+	end_date = request.GET.get('end_date', today.strftime('%Y-%m-%d'))
 
+	# Permitir cualquier rango de fechas
+	try:
+		return datetime.strptime(start_date, '%Y-%m-%d').date(), datetime.strptime(end_date, '%Y-%m-%d').date()
+	except Exception:
+		return default_start, today
+
+
+@lectura_en_replica
 def dashboard(request):
 	"""
 	Vista principal del dashboard de control de ganancias.
@@ -21,9 +41,12 @@ def dashboard(request):
 	- Ganancia total, por fecha, por moneda y por método de pago.
 	- Distribución de transacciones por tipo y por segmento de cliente.
 	- Conteo y montos de transacciones completadas y pagadas.
-	- Spread promedio aplicado.
 	- Detalle de transacciones para visualización en tabla.
     
+	Los totales y las series salen de ``control_ganancias.agregados`` sobre la tabla
+	resumen ``GananciaDiaria``: una consulta agrupada por dimensión, con las
+	ganancias en ``Decimal``.
+    
 	Los datos se envían al template para su visualización en gráficos y tablas.
     
 	:param request: Objeto HttpRequest de Django.
@@ -31,104 +54,30 @@ def dashboard(request):
 	:return: Página renderizada con los datos del dashboard de control de ganancias.
 	:rtype: HttpResponse
 	"""
-	# Filtro por rango de fechas (máx 1 año)
-	today = timezone.now().date()
-	default_start = datetime(2024, 1, 1).date()
-	start_date = request.GET.get('start_date', default_start.strftime('%Y-%m-%d'))
-	end_date = request.GET.get('end_date', today.strftime('%Y-%m-%d'))
+	start_dt, end_dt = _rango_fechas(request)
 
-	# Permitir cualquier rango de fechas
-	try:
-		start_dt = datetime.strptime(start_date, '%Y-%m-%d').date()
-		end_dt = datetime.strptime(end_date, '%Y-%m-%d').date()
-	except Exception:
-		start_dt = default_start
-		end_dt = today
-
-	# Filtrar transacciones por estado y rango de fechas
-	transacciones_completadas = Transaccion.objects.filter(
-		estado=EstadoTransaccionEnum.COMPLETADA,
-		fecha__date__gte=start_dt,
-		fecha__date__lte=end_dt
-	)
-	transacciones_pagadas = Transaccion.objects.filter(
-		estado=EstadoTransaccionEnum.PAGADA,
-		fecha__date__gte=start_dt,
-		fecha__date__lte=end_dt
-	)
-	# Todas las transacciones pagadas o completadas
-	transacciones = Transaccion.objects.filter(
-		estado__in=[EstadoTransaccionEnum.COMPLETADA, EstadoTransaccionEnum.PAGADA],
-		fecha__date__gte=start_dt,
-		fecha__date__lte=end_dt
-	)
+	# Los agregados se leen de la tabla resumen (una consulta agrupada cada uno);
+	# las transacciones pagadas y completadas del rango solo se usan para la tabla
+	transacciones = agregados.transacciones_con_ganancia(start_dt, end_dt)
+	resumen = agregados.ganancias_diarias(start_dt, end_dt)
+	resumen_estados = agregados.por_estado(resumen)
+	completadas = resumen_estados[EstadoTransaccionEnum.COMPLETADA]
+	pagadas = resumen_estados[EstadoTransaccionEnum.PAGADA]
+
+	# Gráfico de líneas: ganancia por fecha
+	ganancias_fecha = agregados.por_fecha(resumen)
+	fechas = [dia.strftime('%Y-%m-%d') for dia, _ in ganancias_fecha]
+	ganancias = [float(ganancia) for _, ganancia in ganancias_fecha]
 
-	# Para gráfico de torta de tipo de cliente (completadas y pagadas)
-
-	# Usar los tipos definidos en Cliente.SEGMENTOS para el orden y los labels
-	tipos_clientes = [label for _, label in Cliente.SEGMENTOS]
-	# Mapear display a valor interno para contar correctamente
-	tipo_display_map = {valor: label for valor, label in Cliente.SEGMENTOS}
-	# Contar por valor interno y luego mapear a display
-	clientes_tipo_completadas = Counter([tipo_display_map.get(t.cliente.tipo, t.cliente.get_tipo_display()) for t in transacciones_completadas])
-	clientes_tipo_pagadas = Counter([tipo_display_map.get(t.cliente.tipo, t.cliente.get_tipo_display()) for t in transacciones_pagadas])
-	# Sumar completadas y pagadas por tipo de cliente
-	transacciones_por_tipo_cliente = [clientes_tipo_completadas.get(tc, 0) + clientes_tipo_pagadas.get(tc, 0) for tc in tipos_clientes]
-
-	# Ganancia total de todas las transacciones pagadas y completadas
-	ganancia_total = sum([float(t.ganancia or 0) for t in transacciones])
-
-	# Ganancia de completadas
-	monto_completadas_total = sum([float(t.ganancia or 0) for t in transacciones_completadas])
-
-	# Ganancia de pagadas
-	monto_pagado_total = sum([float(t.ganancia or 0) for t in transacciones_pagadas])
-
-	# Ganancia por fecha (para gráfico de líneas)
-	ganancias_por_fecha = defaultdict(float)
-	for t in transacciones:
-		fecha_str = t.fecha.strftime('%Y-%m-%d')
-		ganancias_por_fecha[fecha_str] += float(t.ganancia or 0)
-	fechas = sorted(ganancias_por_fecha.keys())
-	ganancias = [ganancias_por_fecha[f] for f in fechas]
-
-	# Ganancia por moneda (para gráfico de barras)
-	ganancias_por_moneda = defaultdict(float)
-	monedas_set = set()
-	for t in transacciones:
-		if t.moneda:
-			codigo = t.moneda.codigo
-			monedas_set.add(codigo)
-			ganancias_por_moneda[codigo] += float(t.ganancia or 0)
-	monedas = sorted(monedas_set)
-	ganancias_monedas = [ganancias_por_moneda[m] for m in monedas]
-
-	# Ganancia por método de pago
-	ganancias_por_metodo = defaultdict(float)
-	for t in transacciones:
-		if t.medio_pago:
-			nombre = str(t.medio_pago)
-			ganancias_por_metodo[nombre] += float(t.ganancia or 0)
-
-	# Ganancia por tipo de transacción y conteo para gráfico de torta
-	ganancias_por_tipo = defaultdict(float)
-	transacciones_por_tipo = defaultdict(int)
-	for t in transacciones:
-		tipo = t.get_tipo_display() if hasattr(t, 'get_tipo_display') else t.tipo
-		ganancias_por_tipo[tipo] += float(t.ganancia or 0)
-		transacciones_por_tipo[tipo] += 1
-
-	# Spread promedio (simulado, puedes ajustar la lógica)
-	spread_promedio = None
-	spreads = [float(getattr(t, 'tasa_aplicada', 0)) for t in transacciones if getattr(t, 'tasa_aplicada', None)]
-	if spreads:
-		spread_promedio = f"{sum(spreads)/len(spreads):.2f}%"
-	else:
-		spread_promedio = "2.5%"
-
-	# Tipos para gráfico de torta
-	tipos = list(transacciones_por_tipo.keys())
-	transacciones_por_tipo_list = [transacciones_por_tipo[t] for t in tipos]
+	# Gráfico de barras: ganancia por moneda
+	ganancias_moneda = agregados.por_moneda(resumen)
+	monedas = [codigo for codigo, _ in ganancias_moneda]
+	ganancias_monedas = [float(ganancia) for _, ganancia in ganancias_moneda]
+
+	# Torta por tipo de transacción y por segmento de cliente
+	resumen_tipos = agregados.por_tipo(resumen)
+	tipos = list(resumen_tipos)
+	segmentos = agregados.por_segmento(resumen)
 
 	# Detalle de transacciones (opcional, para tabla)
 	detalle_transacciones = transacciones.select_related('moneda', 'medio_pago', 'cliente')
@@ -138,29 +87,131 @@ def dashboard(request):
 		'ganancias': json.dumps(ganancias),
 		'monedas': json.dumps(monedas),
 		'ganancias_monedas': json.dumps(ganancias_monedas),
-		'ganancia_total': ganancia_total,
-		'transacciones_completadas': transacciones_completadas.count(),
-		'monto_completadas_total': monto_completadas_total,
-		'transacciones_pagadas': transacciones_pagadas.count(),
-		'monto_pagado_total': monto_pagado_total,
-		'ganancias_por_metodo': dict(ganancias_por_metodo),
-		'ganancias_por_tipo': dict(ganancias_por_tipo),
+		'ganancia_total': completadas['ganancia'] + pagadas['ganancia'],
+		'transacciones_completadas': completadas['cantidad'],
+		'monto_completadas_total': completadas['ganancia'],
+		'transacciones_pagadas': pagadas['cantidad'],
+		'monto_pagado_total': pagadas['ganancia'],
+		'ganancias_por_metodo': agregados.por_medio_pago(resumen),
+		'ganancias_por_tipo': {tipo: datos['ganancia'] for tipo, datos in resumen_tipos.items()},
 		'tipos': json.dumps(tipos),
-		'transacciones_por_tipo': json.dumps(transacciones_por_tipo_list),
+		'transacciones_por_tipo': json.dumps([resumen_tipos[tipo]['cantidad'] for tipo in tipos]),
 		'detalle_transacciones': detalle_transacciones,
-		'tipos_clientes': json.dumps(tipos_clientes),
-		'transacciones_por_tipo_cliente': json.dumps(transacciones_por_tipo_cliente),
+		'tipos_clientes': json.dumps([etiqueta for etiqueta, _ in segmentos]),
+		'transacciones_por_tipo_cliente': json.dumps([cantidad for _, cantidad in segmentos]),
 		'start_date': start_dt.strftime('%Y-%m-%d'),
 		'end_date': end_dt.strftime('%Y-%m-%d'),
 	}
 	return render(request, 'control_ganancias/dashboard.html', context)
 
+@lectura_en_replica
+def distribuciones_ganancias(request):
+	"""
+	Distribuciones de las transacciones pagadas y completadas del rango
+	(``start_date``/``end_date``, como el dashboard), calculadas con
+	``control_ganancias.analitica``.
+
+	Parámetros GET adicionales:
+		- clases: Intervalos del histograma de ganancia (por defecto 20, máximo 100)
+		- ventana: Días de la ventana del volumen móvil (por defecto 7, máximo 366)
+
+	Retorna:
+		JsonResponse con percentiles de ganancia y monto en PYG, histograma de
+		ganancia, spread por segmento y volumen diario con su ventana móvil.
+	"""
+	start_dt, end_dt = _rango_fechas(request)
+	try:
+		clases = min(max(int(request.GET.get('clases', 20)), 1), 100)
+		ventana = min(max(int(request.GET.get('ventana', 7)), 1), 366)
+	except ValueError:
+		return JsonResponse({'error': 'Parámetros inválidos'}, status=400)
+
+	columnas = analitica.cargar(start_dt, end_dt)
+	bordes, conteos = analitica.histograma(columnas.ganancia, clases)
+	return JsonResponse({
+		'desde': start_dt.isoformat(),
+		'hasta': end_dt.isoformat(),
+		'cantidad': len(columnas.ganancia),
+		'percentiles': {
+			'ganancia': analitica.percentiles(columnas.ganancia),
+			'monto_pyg': analitica.percentiles(columnas.monto_pyg),
+		},
+		'histograma_ganancia': {'bordes': bordes, 'conteos': conteos},
+		'spread_por_segmento': analitica.spread_por_segmento(columnas),
+		'volumen_movil': [
+			{'fecha': fecha.isoformat(), 'volumen': volumen, 'ventana': acumulado}
+			for fecha, volumen, acumulado in analitica.volumen_movil(columnas, ventana)
+		],
+	})
+
+
+def _filtros_reporte(request):
+	"""
+	Filtros GET del reporte (fecha_desde, fecha_hasta, tipo, estado, moneda,
+	cliente) normalizados una sola vez: los mismos valores arman la clave de
+	``cache_reporte`` y filtran las transacciones.
+	"""
+	return cache_reporte.normalizar({nombre: request.GET.get(nombre) for nombre in FILTROS_REPORTE})
+
+
+def _transacciones_filtradas(filtros):
+	"""Transacciones con los filtros ya normalizados por ``_filtros_reporte``."""
+	transacciones = Transaccion.objects.all()
+	if filtros.get('fecha_desde'):
+		transacciones = transacciones.filter(fecha__date__gte=filtros['fecha_desde'])
+	if filtros.get('fecha_hasta'):
+		transacciones = transacciones.filter(fecha__date__lte=filtros['fecha_hasta'])
+	if filtros.get('tipo'):
+		transacciones = transacciones.filter(tipo=filtros['tipo'])
+	if filtros.get('estado'):
+		transacciones = transacciones.filter(estado=filtros['estado'])
+	if filtros.get('moneda'):
+		transacciones = transacciones.filter(moneda__codigo=filtros['moneda'])
+	if filtros.get('cliente'):
+		transacciones = transacciones.filter(cliente__id=filtros['cliente'])
+	return transacciones
+
+
+def _resumen_reporte(transacciones):
+	"""
+	Totales por estado (de todas las transacciones), cantidad por día y por
+	tipo (de las filtradas) con tres consultas agrupadas. Es lo que guarda
+	``cache_reporte``.
+	"""
+	por_estado = dict(
+		Transaccion.objects.order_by().values_list('estado').annotate(cantidad=Count('id'))
+	)
+	por_dia = (
+		transacciones.annotate(dia=TruncDate('fecha'))
+		.values_list('dia')
+		.annotate(cantidad=Count('id'))
+		.order_by('dia')
+	)
+	por_tipo = dict(transacciones.order_by().values_list('tipo').annotate(cantidad=Count('id')))
+	return {
+		'total_transacciones': sum(por_estado.values()),
+		'total_completadas': por_estado.get(EstadoTransaccionEnum.COMPLETADA, 0),
+		'total_pagadas': por_estado.get(EstadoTransaccionEnum.PAGADA, 0),
+		'total_pendientes': por_estado.get(EstadoTransaccionEnum.PENDIENTE, 0),
+		'total_canceladas': por_estado.get(EstadoTransaccionEnum.CANCELADA, 0),
+		'total_anuladas': por_estado.get(EstadoTransaccionEnum.ANULADA, 0),
+		'fechas_grafico': [dia.strftime('%d-%m-%Y') for dia, _ in por_dia],
+		'cantidades_grafico': [cantidad for _, cantidad in por_dia],
+		'transacciones_por_tipo_torta': [
+			por_tipo.get(tipo, 0) for tipo in (TipoTransaccionEnum.COMPRA, TipoTransaccionEnum.VENTA)
+		],
+	}
+
+
+@lectura_en_replica
 def reporte_transacciones(request):
 	"""
 	Vista para el reporte de transacciones.
 
 	Permite filtrar y visualizar transacciones por rango de fechas, tipo, estado, moneda y cliente.
 	Muestra totales por estado, gráficos de evolución diaria y por tipo de operación, y una tabla detallada exportable.
+	Los totales y las series se guardan en ``cache_reporte`` por combinación
+	de filtros hasta que cambia alguna transacción.
 
 	Parámetros GET:
 		- fecha_desde: Fecha inicial del filtro (YYYY-MM-DD)
@@ -181,52 +232,12 @@ def reporte_transacciones(request):
 		HttpResponse con el template 'control_ganancias/reporte_transacciones.html'
 	"""
 	# Filtros GET
-	fecha_desde = request.GET.get('fecha_desde')
-	fecha_hasta = request.GET.get('fecha_hasta')
-	tipo = request.GET.get('tipo')
-	estado = request.GET.get('estado')
-	moneda = request.GET.get('moneda')
-	cliente = request.GET.get('cliente')
-
-	# Totales para tarjetas (sin filtros)
-	total_transacciones = Transaccion.objects.count()
-	total_completadas = Transaccion.objects.filter(estado=EstadoTransaccionEnum.COMPLETADA).count()
-	total_pagadas = Transaccion.objects.filter(estado=EstadoTransaccionEnum.PAGADA).count()
-	total_pendientes = Transaccion.objects.filter(estado=EstadoTransaccionEnum.PENDIENTE).count()
-	total_canceladas = Transaccion.objects.filter(estado=EstadoTransaccionEnum.CANCELADA).count()
-	total_anuladas = Transaccion.objects.filter(estado=EstadoTransaccionEnum.ANULADA).count()
-
-	# Filtros para la tabla y gráfico
-	transacciones = Transaccion.objects.all()
-	if fecha_desde:
-		transacciones = transacciones.filter(fecha__date__gte=fecha_desde)
-	if fecha_hasta:
-		transacciones = transacciones.filter(fecha__date__lte=fecha_hasta)
-	if tipo:
-		transacciones = transacciones.filter(tipo=tipo)
-	if estado:
-		transacciones = transacciones.filter(estado=estado)
-	if moneda:
-		transacciones = transacciones.filter(moneda__codigo=moneda)
-	if cliente:
-		transacciones = transacciones.filter(cliente__id=cliente)
-
-	# Datos para gráfico de transacciones por día (según filtros)
-	transacciones_por_fecha = defaultdict(int)
-	for t in transacciones:
-		fecha_str = t.fecha.strftime('%d-%m-%Y')
-		transacciones_por_fecha[fecha_str] += 1
-	fechas_grafico = sorted(transacciones_por_fecha.keys(), key=lambda x: datetime.strptime(x, '%d-%m-%Y'))
-	cantidades_grafico = [transacciones_por_fecha[f] for f in fechas_grafico]
-	fechas_grafico_json = json.dumps(fechas_grafico)
-	cantidades_grafico_json = json.dumps(cantidades_grafico)
-
-	# Datos para gráfico de torta por tipo de transacción (compra/venta) según filtro de fecha
-	tipos_torta = [TipoTransaccionEnum.COMPRA, TipoTransaccionEnum.VENTA]
+	filtros = _filtros_reporte(request)
+	transacciones = _transacciones_filtradas(filtros)
+	resumen = cache_reporte.obtener(filtros, lambda: _resumen_reporte(transacciones))
+
 	tipos_torta_labels = ['Compra', 'Venta']
-	transacciones_por_tipo_torta = [transacciones.filter(tipo=tipo).count() for tipo in tipos_torta]
 	tipos_torta_json = json.dumps(tipos_torta_labels)
-	transacciones_por_tipo_torta_json = json.dumps(transacciones_por_tipo_torta)
 
 	# Opciones para selects
 	monedas = Moneda.objects.all()
@@ -236,26 +247,48 @@ def reporte_transacciones(request):
 	detalle_transacciones = transacciones.select_related('moneda', 'medio_pago', 'cliente')
 
 	context = {
-		'total_transacciones': total_transacciones,
-		'total_completadas': total_completadas,
-		'total_pagadas': total_pagadas,
-		'total_pendientes': total_pendientes,
-		'total_canceladas': total_canceladas,
-		'total_anuladas': total_anuladas,
+		'total_transacciones': resumen['total_transacciones'],
+		'total_completadas': resumen['total_completadas'],
+		'total_pagadas': resumen['total_pagadas'],
+		'total_pendientes': resumen['total_pendientes'],
+		'total_canceladas': resumen['total_canceladas'],
+		'total_anuladas': resumen['total_anuladas'],
 		'monedas': monedas,
 		'clientes': clientes,
 		'detalle_transacciones': detalle_transacciones,
-		'fechas_grafico': fechas_grafico_json,
-		'cantidades_grafico': cantidades_grafico_json,
+		'fechas_grafico': json.dumps(resumen['fechas_grafico']),
+		'cantidades_grafico': json.dumps(resumen['cantidades_grafico']),
 		'tipos_torta': tipos_torta_json,
-		'transacciones_por_tipo_torta': transacciones_por_tipo_torta_json,
-		'filtros': {
-			'fecha_desde': fecha_desde,
-			'fecha_hasta': fecha_hasta,
-			'tipo': tipo,
-			'estado': estado,
-			'moneda': moneda,
-			'cliente': cliente,
-		}
+		'transacciones_por_tipo_torta': json.dumps(resumen['transacciones_por_tipo_torta']),
+		'filtros': {nombre: filtros.get(nombre) for nombre in FILTROS_REPORTE},
 	}
 	return render(request, 'control_ganancias/reporte_transacciones.html', context)
+
+
+@lectura_en_replica
+def exportar_transacciones(request):
+	"""
+	Exporta por partes las transacciones con los mismos filtros que
+	``reporte_transacciones``.
+
+	Parámetros GET adicionales:
+		- formato: 'csv' (por defecto) o 'ndjson'
+		- gzip: '1' para descargar el archivo comprimido
+
+	Retorna:
+		StreamingHttpResponse con el archivo como adjunto.
+	"""
+	formato = request.GET.get('formato') or 'csv'
+	if formato not in exportacion.FORMATOS:
+		return JsonResponse({'error': 'Formato inválido'}, status=400)
+	comprimir = request.GET.get('gzip') in ('1', 'true')
+	tipo_contenido, extension = exportacion.FORMATOS[formato]
+	nombre = f'transacciones_{timezone.localdate():%Y%m%d}.{extension}'
+	if comprimir:
+		tipo_contenido = 'application/gzip'
+		nombre += '.gz'
+
+	cuerpo = exportacion.contenido(_transacciones_filtradas(_filtros_reporte(request)), formato, comprimir)
+	response = StreamingHttpResponse(cuerpo, content_type=tipo_contenido)
+	response['Content-Disposition'] = f'attachment; filename="{nombre}"'
+	return response
@@ -16,6 +16,15 @@ echo "PostgreSQL está disponible"
 echo "Ejecutando migraciones..."
 python manage.py migrate --noinput
 
+# La migración usuarios/0021 ya crea la tabla de la caché compartida; esto
+# solo hace falta si se cambió CACHE_TABLA (no hace nada si ya existe)
+echo "Creando tabla de caché..."
+python manage.py createcachetable
+
+# Carga el historial en la tabla de ganancias diarias la primera vez (el dashboard lee de ella)
+echo "Verificando ganancias diarias..."
+python manage.py reconstruir_ganancias_diarias --si-vacia
+
 # Insertar configuración de facturación desde variables de entorno
 echo "Insertando configuración de facturación..."
 python manage.py shell << EOF
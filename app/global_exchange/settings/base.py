@@ -84,6 +84,25 @@ DATABASES = {
     }
 }
 
+# Réplica de solo lectura para reportes y tableros (ver commons/replicas.py).
+# Sin DB_REPLICA_NAME todas las lecturas van a "default".
+if os.getenv("DB_REPLICA_NAME"):
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "NAME": os.getenv("DB_REPLICA_NAME"),
+        "USER": os.getenv("DB_REPLICA_USER", os.getenv("DB_USER")),
+        "PASSWORD": os.getenv("DB_REPLICA_PASSWORD", os.getenv("DB_PASSWORD")),
+        "HOST": os.getenv("DB_REPLICA_HOST", os.getenv("DB_HOST")),
+        "PORT": os.getenv("DB_REPLICA_PORT", os.getenv("DB_PORT")),
+        "TEST": {"MIRROR": "default"},
+    }
+DATABASE_ROUTERS = ["commons.replicas.RouterReplica"]
+
+# Segundos de atraso tolerados en la réplica antes de volver a leer del primario,
+# y cada cuántos segundos se vuelve a consultar ese atraso
+REPLICA_RETRASO_MAXIMO_SEGUNDOS = int(os.getenv("REPLICA_RETRASO_MAXIMO_SEGUNDOS", "30"))
+REPLICA_VERIFICACION_SEGUNDOS = int(os.getenv("REPLICA_VERIFICACION_SEGUNDOS", "5"))
+
 AUTH_PASSWORD_VALIDATORS = [
     {"NAME":"django.contrib.auth.password_validation.UserAttributeSimilarityValidator"},
     {"NAME":"django.contrib.auth.password_validation.MinimumLengthValidator"},
@@ -109,6 +128,57 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 # Tiempo (min) que permanece vigente una transacción pendiente antes de expirar
 TRANSACCION_EXPIRACION_MINUTOS = int(os.getenv("TRANSACCION_EXPIRACION_MINUTOS", "15"))
 
+# Segundos que una entrada de la caché de precios (por proceso) sigue vigente
+# aunque no llegue ninguna señal de invalidación
+CACHE_PRECIOS_TTL_SEGUNDOS = int(os.getenv("CACHE_PRECIOS_TTL_SEGUNDOS", "300"))
+
+# Segundos durante los que se respeta una cotización garantizada (token del calculador)
+COTIZACION_GARANTIZADA_SEGUNDOS = int(os.getenv("COTIZACION_GARANTIZADA_SEGUNDOS", "120"))
+
+# Filas por página del historial de transacciones (?por_pagina= permite cambiarlo hasta el máximo)
+TRANSACCIONES_POR_PAGINA = int(os.getenv("TRANSACCIONES_POR_PAGINA", "25"))
+TRANSACCIONES_POR_PAGINA_MAX = 200
+
+# Filas por página del historial de movimientos de stock de un Tauser
+MOVIMIENTOS_TAUSER_POR_PAGINA = int(os.getenv("MOVIMIENTOS_TAUSER_POR_PAGINA", "50"))
+
+# Criterio para desglosar montos en denominaciones del Tauser: "menos_billetes" o "preservar_escasos"
+TAUSER_OBJETIVO_DESGLOSE = os.getenv("TAUSER_OBJETIVO_DESGLOSE", "menos_billetes")
+
+# Segundos tras los que cada proceso relee el catálogo de denominaciones
+# (las señales solo invalidan la copia del proceso que escribió)
+TAUSER_CATALOGO_TTL_SEGUNDOS = int(os.getenv("TAUSER_CATALOGO_TTL_SEGUNDOS", "300"))
+
+# Segundos tras los que cada proceso relee el stock usado para sugerir Tauser
+TAUSER_ENRUTADOR_TTL_SEGUNDOS = int(os.getenv("TAUSER_ENRUTADOR_TTL_SEGUNDOS", "30"))
+
+# Plan de reposición de efectivo: piezas por viaje (bóveda de traslado) y por casete de un Tauser
+TAUSER_CAPACIDAD_VIAJE = int(os.getenv("TAUSER_CAPACIDAD_VIAJE", "5000"))
+TAUSER_CAPACIDAD_CASETE = int(os.getenv("TAUSER_CAPACIDAD_CASETE", "2000"))
+
+# Caché de Django compartida por todos los procesos (workers de gunicorn y el
+# barrido de expiración): una tabla en la base, creada por la migración
+# usuarios/0021_tabla_cache (``migrate`` alcanza). Así una invalidación hecha por señal en un proceso la ven
+# todos los demás (resumen de la flota, reporte de transacciones, contadores).
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": os.getenv("CACHE_TABLA", "django_cache"),
+        "OPTIONS": {"MAX_ENTRIES": int(os.getenv("CACHE_MAX_ENTRADAS", "10000"))},
+    }
+}
+
+# Segundos que se guarda en caché el resumen de stock de la flota (se invalida al cambiar stock o reservas)
+TAUSER_RESUMEN_FLOTA_SEGUNDOS = int(os.getenv("TAUSER_RESUMEN_FLOTA_SEGUNDOS", "60"))
+
+# Segundos que se guardan los totales del reporte de transacciones por combinación de filtros
+# (cualquier cambio en una transacción los descarta antes)
+REPORTE_TRANSACCIONES_CACHE_SEGUNDOS = int(os.getenv("REPORTE_TRANSACCIONES_CACHE_SEGUNDOS", "300"))
+
+# Segundos tras los que se vuelve a contar cada contador del dashboard principal
+# (entre medio lo mantienen las señales)
+DASHBOARD_CONTADORES_SEGUNDOS = int(os.getenv("DASHBOARD_CONTADORES_SEGUNDOS", "600"))
+
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 # MFA defaults
@@ -0,0 +1,9 @@
+from .dev import *
+
+# Configuración para correr los tests:
+#   DJANGO_SETTINGS_MODULE=global_exchange.settings.test python manage.py test
+#
+# Sin DB_REPLICA_NAME se declara igual una "réplica": otra conexión espejo de la
+# base de pruebas (TEST MIRROR), para probar commons.replicas contra un segundo
+# alias real. Con DB_REPLICA_NAME se usa la réplica definida en base.py.
+DATABASES.setdefault("replica", {**DATABASES["default"], "TEST": {"MIRROR": "default"}})
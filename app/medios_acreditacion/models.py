@@ -1,8 +1,9 @@
 from django.db import models
 from clientes.models import Cliente
+from commons.campos_precio import CamposPrecioMixin
 from commons.enums import TipoMedioAcreditacionEnum
 
-class MedioAcreditacion(models.Model):
+class MedioAcreditacion(CamposPrecioMixin, models.Model):
     """
     Representa un medio de acreditación asociado a un cliente.
 
@@ -65,6 +66,9 @@ class MedioAcreditacion(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # En una venta el tipo de medio define la comisión (ver commons/campos_precio.py)
+    CAMPOS_PRECIO = ("tipo_medio",)
+
     class Meta:
         """
         Clase interna de Django para definir metadatos del modelo, como opciones de ordenamiento, nombres legibles y restricciones.
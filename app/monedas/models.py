@@ -19,7 +19,7 @@ from decimal import Decimal
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator, MinValueValidator, MaxValueValidator
 from django.db import models, transaction
-from django.db.models import Max
+from django.db.models import Max, OuterRef, Subquery
 import datetime
 # Validador de código ISO 4217
 ISO4217 = RegexValidator(
@@ -164,6 +164,24 @@ class TasaCambio(models.Model):
         ).order_by('fecha_creacion__date')
         ids = [d['last_id'] for d in diarios]
         return cls.objects.filter(id__in=ids).order_by('fecha_creacion')
+
+    @classmethod
+    def ultimas_activas(cls, monedas):
+        """
+        Devuelve en una sola consulta la última cotización activa de cada
+        moneda de ``monedas`` (queryset o ids), con la moneda cargada y
+        ordenadas por código.
+        """
+        ultima = (
+            cls.objects.filter(moneda=OuterRef('moneda'), activa=True)
+            .order_by('-fecha_creacion', '-id')
+            .values('id')[:1]
+        )
+        return (
+            cls.objects.filter(moneda__in=monedas, activa=True, id=Subquery(ultima))
+            .select_related('moneda')
+            .order_by('moneda__codigo')
+        )
     """
     Modelo de cotización por moneda.
 
@@ -28,15 +28,16 @@ from django.db import transaction
 from django.shortcuts import render, get_object_or_404, redirect
 from .forms import MonedaForm, TasaCambioForm, PrecioBaseComisionForm
 from .models import Moneda, TasaCambio, PrecioBaseComision
-from clientes.models import TasaComision
 from usuarios.decorators import role_required
 from django.http import JsonResponse
 from django.core import serializers
 from django.views.decorators.csrf import csrf_exempt
 from datetime import date, timedelta
 from django.views.decorators.http import require_GET
+from commons.replicas import lectura_en_replica
 
 @require_GET
+@lectura_en_replica
 def evolucion_tasas_json(request):
     """
     Devuelve la evolución diaria de la tasa de una moneda en formato JSON.
@@ -106,6 +107,7 @@ def evolucion_tasas_json(request):
 # -----------------------------
 # Endpoints JSON
 # -----------------------------
+@lectura_en_replica
 def cotizaciones_json(request):
     from .models import TasaCambio
     """
@@ -174,11 +176,13 @@ def tasas_comisiones_json(request):
     :return: JsonResponse con las tasas de descuento por tipo de cliente
     :rtype: JsonResponse
     """
+    from transaccion.matriz_precios import matriz_precios
+
     tipos = ["MIN", "CORP", "VIP"]
+    descuentos = matriz_precios.descuentos()
     tasas = {}
     for tipo in tipos:
-        tc = TasaComision.vigente_para_tipo(tipo)
-        tasas[tipo.lower()] = {"tasa_descuento": float(tc.porcentaje) if tc else 0}
+        tasas[tipo.lower()] = {"tasa_descuento": float(descuentos.get(tipo, 0))}
     return JsonResponse({"tasas": tasas})
 
 
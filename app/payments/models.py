@@ -1,6 +1,7 @@
 
 from django.db import models
 from clientes.models import Cliente
+from commons.campos_precio import CamposPrecioMixin
 from commons.enums import PaymentTypeEnum
 
 class ComisionMetodoPago(models.Model):
@@ -24,7 +25,7 @@ class ComisionMetodoPago(models.Model):
         verbose_name = "Comisión por método de pago"
         verbose_name_plural = "Comisiones por método de pago"
 
-class PaymentMethod(models.Model):
+class PaymentMethod(CamposPrecioMixin, models.Model):
     """
     Modelo que representa un método de pago en el sistema.
     
@@ -54,6 +55,9 @@ class PaymentMethod(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # El tipo define la comisión por método de pago (ver commons/campos_precio.py)
+    CAMPOS_PRECIO = ("payment_type",)
+
     class Meta:
         verbose_name = "Método de Pago"
         verbose_name_plural = "Métodos de Pago"
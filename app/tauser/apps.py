@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class TauserConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tauser'
+
+    def ready(self):
+        from . import signals
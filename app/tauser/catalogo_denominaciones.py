@@ -0,0 +1,125 @@
+"""
+Catálogo en memoria de denominaciones (billetes y monedas) por divisa.
+
+Se carga de forma perezosa en cada proceso combinando ``denominaciones.json``
+con la tabla ``Denominacion``: por divisa se unen las entradas de ambas fuentes
+por ``(value, type)``, así una divisa con solo algunas filas en la tabla sigue
+ofreciendo el resto de las denominaciones del JSON. Para cada divisa se precalculan la lista de denominaciones (con la misma forma
+que las entradas del JSON: ``currency``, ``value``, ``type``) y la tupla de
+valores distintos ordenada de mayor a menor, que es lo que usan el redondeo de
+PYG y las vistas del Tauser.
+
+Las señales de ``tauser/signals.py`` invalidan el catálogo cuando se crea,
+modifica o elimina una ``Denominacion``; la siguiente consulta lo recarga.
+Como eso solo alcanza al proceso que escribió, el catálogo se vuelve a leer
+además cada ``TAUSER_CATALOGO_TTL_SEGUNDOS`` segundos.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import DatabaseError
+
+logger = logging.getLogger(__name__)
+
+RUTA_JSON = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'denominaciones.json')
+
+
+def _normalizar_valor(valor):
+    """Devuelve int para valores enteros (como en el JSON) y Decimal para el resto."""
+    valor = Decimal(str(valor))
+    if valor == valor.to_integral_value():
+        return int(valor)
+    return valor.normalize()
+
+
+class CatalogoDenominaciones:
+    """
+    Registro de denominaciones por código de moneda, cargado de forma perezosa.
+    """
+
+    def __init__(self, ruta_json=RUTA_JSON):
+        self.ruta_json = ruta_json
+        self._lock = threading.Lock()
+        self._entradas = None
+        self._valores = None
+        self._construido_en = 0.0
+
+    @staticmethod
+    def _ttl():
+        return getattr(settings, "TAUSER_CATALOGO_TTL_SEGUNDOS", 300)
+
+    def _leer_json(self):
+        with open(self.ruta_json, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _leer_bd(self):
+        from .models import Denominacion
+        return [
+            {'currency': codigo, 'value': value, 'type': tipo}
+            for codigo, value, tipo in Denominacion.objects.values_list('moneda__codigo', 'value', 'type')
+        ]
+
+    def _construir(self):
+        """Arma las estructuras por moneda uniendo JSON y base de datos por ``(value, type)``."""
+        por_moneda = {}  # codigo -> {(valor, tipo): entrada}
+
+        def agregar(d):
+            valor = _normalizar_valor(d['value'])
+            por_moneda.setdefault(d['currency'], {}).setdefault(
+                (Decimal(str(valor)), d['type']),
+                {'currency': d['currency'], 'value': valor, 'type': d['type']},
+            )
+
+        for d in self._leer_json():
+            agregar(d)
+        try:
+            for d in self._leer_bd():
+                agregar(d)
+        except DatabaseError:
+            logger.warning("No se pudo leer la tabla Denominacion; se usa solo %s", self.ruta_json)
+
+        entradas = {}
+        valores = {}
+        for codigo, por_clave in por_moneda.items():
+            normalizadas = [por_clave[clave] for clave in sorted(por_clave, reverse=True)]
+            entradas[codigo] = tuple(normalizadas)
+            valores[codigo] = tuple(sorted({Decimal(str(d['value'])) for d in normalizadas}, reverse=True))
+        return entradas, valores
+
+    def _vencido(self):
+        return self._entradas is None or time.monotonic() - self._construido_en > self._ttl()
+
+    def _asegurar_cargado(self):
+        if self._vencido():
+            with self._lock:
+                if self._vencido():
+                    self._entradas, self._valores = self._construir()
+                    self._construido_en = time.monotonic()
+
+    def denominaciones(self, codigo_moneda):
+        """
+        Lista de denominaciones de la moneda, de mayor a menor valor.
+        Cada elemento es un dict ``{'currency', 'value', 'type'}``.
+        """
+        self._asegurar_cargado()
+        return list(self._entradas.get(codigo_moneda, ()))
+
+    def valores(self, codigo_moneda):
+        """Tupla de valores (Decimal) distintos de la moneda, de mayor a menor."""
+        self._asegurar_cargado()
+        return self._valores.get(codigo_moneda, ())
+
+    def invalidar(self):
+        """Descarta lo cargado; la próxima consulta vuelve a leer la tabla."""
+        with self._lock:
+            self._entradas = None
+            self._valores = None
+
+
+#: Instancia única por proceso.
+catalogo_denominaciones = CatalogoDenominaciones()
@@ -0,0 +1,241 @@
+"""
+Desglose de un monto en denominaciones con stock limitado (cambio con
+cantidades acotadas).
+
+El recorrido voraz de mayor a menor falla cuando el stock es desparejo: con
+billetes de 50 y 20, para 60 toma un 50 y le faltan 10, aunque 20 × 3 cerraba. Aquí
+se resuelve el problema exacto con búsqueda en profundidad + memoización sobre
+``(denominación, resto)`` y poda por cota inferior:
+
+* los montos se pasan a enteros (se escala por la mayor cantidad de decimales
+  y se divide por el MCD de todos los valores), así las claves de la memo son
+  chicas aunque el monto sea de millones de PYG;
+* para cada sufijo de denominaciones se precalcula, como bits de un entero,
+  qué restos puede formar exactamente (mochila acotada con descomposición
+  binaria de las cantidades); una rama solo se explora si su resto es
+  alcanzable, así la búsqueda no entra en callejones sin salida;
+* dentro de cada nodo, las cantidades se prueban de mayor a menor y se
+  descartan las que no pueden mejorar la mejor solución del nodo según la
+  cota de la relajación fraccionaria (llenar el resto con las denominaciones
+  de menor costo por unidad, respetando su stock). La cota es convexa en la
+  cantidad, así que cuando empieza a crecer se corta el recorrido;
+* la búsqueda tiene un presupuesto de ``MAX_PASOS``; si se agota, se devuelve
+  la mejor solución encontrada (exacta, no necesariamente óptima).
+
+Objetivos (``OBJETIVOS``):
+
+* ``menos_billetes``: minimiza la cantidad de piezas entregadas.
+* ``preservar_escasos``: cada pieza pesa más cuanto menos stock queda de su
+  denominación, así se reservan primero las abundantes.
+
+Lo usan ``tauser.services.validar_stock_tauser_para_transaccion`` y
+``transaccion.services.reservar_stock_tauser_para_transaccion``.
+"""
+from decimal import Decimal
+from math import gcd
+
+from django.conf import settings
+
+#: Por encima de esta cantidad de unidades (monto / MCD) no se arman los bits
+#: de alcanzables y la poda queda solo por capacidad y MCD.
+MAX_UNIDADES_ALCANZABLES = 20_000_000
+
+#: Iteraciones máximas de la búsqueda. Al agotarse se completa la mejor rama
+#: en curso: el desglose sigue siendo exacto, aunque puede no ser el óptimo.
+MAX_PASOS = 100_000
+
+#: Resolución de los pesos enteros de ``preservar_escasos``.
+ESCALA_PESOS = 100
+
+MENOS_BILLETES = 'menos_billetes'
+PRESERVAR_ESCASOS = 'preservar_escasos'
+OBJETIVOS = (MENOS_BILLETES, PRESERVAR_ESCASOS)
+
+
+def objetivo_configurado():
+    """Objetivo por defecto (``TAUSER_OBJETIVO_DESGLOSE``)."""
+    return getattr(settings, 'TAUSER_OBJETIVO_DESGLOSE', MENOS_BILLETES)
+
+
+def _pesos(disponibles, objetivo):
+    """Costo entero por pieza de cada denominación según el objetivo."""
+    if objetivo == MENOS_BILLETES:
+        return [1] * len(disponibles)
+    if objetivo == PRESERVAR_ESCASOS:
+        mayor = max(cantidad for _, _, cantidad in disponibles)
+        return [ESCALA_PESOS + ESCALA_PESOS * mayor // cantidad for _, _, cantidad in disponibles]
+    raise ValueError(f"Objetivo de desglose desconocido: {objetivo}")
+
+
+def _a_enteros(monto, valores):
+    """Escala monto y valores a enteros; devuelve ``(monto, valores)`` enteros."""
+    exponente = max(-min(Decimal(v).as_tuple().exponent, 0) for v in (monto, *valores))
+    escala = 10 ** exponente
+    monto_e = Decimal(monto) * escala
+    valores_e = [int(Decimal(v) * escala) for v in valores]
+    if monto_e != monto_e.to_integral_value():
+        return None, valores_e
+    return int(monto_e), valores_e
+
+
+def _alcanzables(valores, stock, tope):
+    """
+    Para cada sufijo ``i`` devuelve un ``bytes`` cuyo bit ``r`` (orden
+    little-endian) vale 1 si ``valores[i:]`` (con su stock) suman exactamente
+    ``r`` (``r <= tope``). Se arma con enteros y se pasa a bytes para consultar
+    un bit sin desplazar el entero completo.
+    """
+    mascara = (1 << (tope + 1)) - 1
+    bits = [0] * (len(valores) + 1)
+    bits[-1] = actual = 1
+    for i in range(len(valores) - 1, -1, -1):
+        valor, restantes, parte = valores[i], stock[i], 1
+        # Descomposición binaria: 1, 2, 4, ..., resto  (cubre 0..stock sin repetir)
+        while restantes > 0 and valor <= tope:
+            usar = min(parte, restantes)
+            actual = (actual | (actual << (usar * valor))) & mascara
+            restantes -= usar
+            parte <<= 1
+        bits[i] = actual
+    largo = tope // 8 + 1
+    return [b.to_bytes(largo, 'little') for b in bits]
+
+
+def _alcanza(bits, resto):
+    return bits[resto >> 3] >> (resto & 7) & 1
+
+
+def resolver_desglose(monto, disponibles, objetivo=None):
+    """
+    Busca el desglose exacto de ``monto`` que optimiza ``objetivo``.
+
+    Args:
+        monto: Decimal a entregar.
+        disponibles: iterable de ``(clave, valor, cantidad_disponible)``; la
+            clave se devuelve tal cual (id, instancia, etc.).
+        objetivo: uno de ``OBJETIVOS``; por defecto ``objetivo_configurado()``.
+
+    Returns:
+        list | None: ``[(clave, valor, cantidad), ...]`` de mayor a menor valor
+        con cantidad > 0, o None si el monto no puede entregarse exacto.
+    """
+    objetivo = objetivo or objetivo_configurado()
+    monto = Decimal(monto)
+    items = sorted(
+        ((clave, Decimal(valor), int(cantidad)) for clave, valor, cantidad in disponibles
+         if cantidad > 0 and Decimal(valor) > 0),
+        key=lambda item: item[1],
+        reverse=True,
+    )
+    if monto == 0:
+        return []
+    if monto < 0 or not items:
+        return None
+
+    objetivo_e, valores = _a_enteros(monto, [valor for _, valor, _ in items])
+    if objetivo_e is None:
+        return None
+    divisor = 0
+    for v in valores:
+        divisor = gcd(divisor, v)
+    if objetivo_e % divisor:
+        return None
+    objetivo_e //= divisor
+    valores = [v // divisor for v in valores]
+    stock = [cantidad for _, _, cantidad in items]
+    pesos = _pesos(items, objetivo)
+    n = len(items)
+
+    # Sufijos: capacidad, MCD y denominaciones ordenadas por costo por unidad de monto
+    capacidad = [0] * (n + 1)
+    mcd = [0] * (n + 1)
+    por_costo = [()] * (n + 1)
+    for i in range(n - 1, -1, -1):
+        capacidad[i] = capacidad[i + 1] + valores[i] * stock[i]
+        mcd[i] = gcd(mcd[i + 1], valores[i])
+        por_costo[i] = tuple(sorted(
+            por_costo[i + 1] + ((pesos[i] / valores[i], valores[i] * stock[i]),)
+        ))
+
+    if capacidad[0] < objetivo_e:
+        return None
+
+    alcanzables = _alcanzables(valores, stock, objetivo_e) if objetivo_e <= MAX_UNIDADES_ALCANZABLES else None
+    if alcanzables is not None and not _alcanza(alcanzables[0], objetivo_e):
+        return None
+
+    def cota(i, resto):
+        """Costo mínimo fraccionario de cubrir ``resto`` con las denominaciones i.."""
+        total = 0.0
+        for costo_unidad, cap in por_costo[i]:
+            if resto <= cap:
+                return total + resto * costo_unidad
+            total += cap * costo_unidad
+            resto -= cap
+        return total if resto == 0 else float('inf')
+
+    memo = {}
+    pasos = [0]
+
+    def buscar(i, resto):
+        """Mejor ``(costo, cantidades)`` para cubrir ``resto`` con las denominaciones i.., o None."""
+        if resto == 0:
+            return (0, ())
+        if i == n or capacidad[i] < resto or resto % mcd[i]:
+            return None
+        if alcanzables is not None and not _alcanza(alcanzables[i], resto):
+            return None
+        clave = (i, resto)
+        if clave in memo:
+            return memo[clave]
+
+        valor, peso = valores[i], pesos[i]
+        mejor = None
+        anterior = None
+        for c in range(min(stock[i], resto // valor), -1, -1):
+            resto_c = resto - c * valor
+            if capacidad[i + 1] < resto_c:
+                break  # con menos piezas de i el resto solo crece
+            pasos[0] += 1
+            if mejor is not None:
+                if pasos[0] > MAX_PASOS:
+                    break
+                # Los costos son enteros: solo sirve una rama que llegue a mejor - 1
+                acotado = peso * c + cota(i + 1, resto_c)
+                if acotado > mejor[0] - 1 + 1e-9:
+                    if anterior is not None and acotado >= anterior:
+                        break  # cota convexa y ya creciendo
+                    anterior = acotado
+                    continue
+                anterior = acotado
+            sub = buscar(i + 1, resto_c)
+            if sub is not None:
+                costo = peso * c + sub[0]
+                if mejor is None or costo < mejor[0]:
+                    mejor = (costo, ((i, c),) + sub[1] if c else sub[1])
+        memo[clave] = mejor
+        return mejor
+
+    resultado = buscar(0, objetivo_e)
+    if resultado is None:
+        return None
+    return [(items[i][0], items[i][1], c) for i, c in resultado[1]]
+
+
+def desglose_voraz(monto, disponibles):
+    """
+    Recorrido de mayor a menor (sin búsqueda). Solo se usa para informar qué se
+    podría entregar y cuánto falta cuando ``resolver_desglose`` no encuentra solución.
+
+    Returns:
+        tuple: ``([(clave, valor, cantidad), ...], faltante)``
+    """
+    restante = Decimal(monto)
+    usado = []
+    for clave, valor, cantidad in sorted(disponibles, key=lambda item: Decimal(item[1]), reverse=True):
+        valor = Decimal(valor)
+        usar = min(int(restante // valor), int(cantidad))
+        if usar > 0:
+            usado.append((clave, valor, usar))
+            restante -= valor * usar
+    return usado, restante
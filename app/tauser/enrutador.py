@@ -0,0 +1,170 @@
+"""
+Sugerencia de Tauser para entregar un monto.
+
+Mantiene en memoria, por moneda, un vector compacto del stock de cada Tauser
+activo: la tupla ``(stock_id, valor, cantidad)`` de sus denominaciones con
+piezas, más la capacidad total (suma de valor × cantidad). Con eso, dado
+``(moneda, monto)`` se recorren todos los Tausers en una sola pasada sin ORM:
+
+* los que no llegan al monto con su capacidad se descartan sin resolver nada;
+* al resto se le aplica ``tauser.desglose.resolver_desglose`` y se calcula un
+  costo: piezas entregadas más ``PESO_ESCASEZ`` por cada denominación que el
+  desglose agotaría (proporcional a la fracción de su stock que consume).
+
+El resultado queda ordenado: primero los que pueden entregar exacto, de menor
+a mayor costo.
+
+La recarga es incremental como en ``transaccion.matriz_precios``: las señales
+de ``tauser/signals.py`` marcan los Tausers cuyo stock cambió (también las
+actualizaciones en bloque de reservas y del ledger, que avisan con
+``stock_modificado``) y en la siguiente consulta se vuelven a leer solo sus
+filas. Como el vector es local a cada proceso, se reconstruye entero a los
+``TAUSER_ENRUTADOR_TTL_SEGUNDOS`` segundos. Es una sugerencia: la reserva
+vuelve a validar el stock con las filas bloqueadas.
+"""
+import threading
+import time
+from collections import namedtuple
+from decimal import Decimal
+
+from django.conf import settings
+
+from .desglose import resolver_desglose
+
+#: Costo de agotar por completo una denominación, en piezas equivalentes.
+PESO_ESCASEZ = 10
+
+#: Stock de un Tauser en una moneda.
+VectorStock = namedtuple("VectorStock", ["denominaciones", "capacidad"])
+
+#: Fila del ranking que devuelve ``rankear``.
+OpcionTauser = namedtuple(
+    "OpcionTauser",
+    ["tauser_id", "nombre", "ubicacion", "ok", "piezas", "costo", "entregado"],
+)
+
+
+class EnrutadorTausers:
+    """
+    Vectores de stock por moneda y Tauser, con recarga incremental y segura para hilos.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self._tausers = {}  # tauser_id -> (nombre, ubicacion)
+        self._vectores = {}  # moneda_id -> {tauser_id: VectorStock}
+        self._completo = False
+        self._sucios = set()
+        self._construido_en = 0.0
+
+    @staticmethod
+    def _ttl():
+        return getattr(settings, "TAUSER_ENRUTADOR_TTL_SEGUNDOS", 30)
+
+    # -------- Marcado (lo llaman las señales) --------
+    def marcar_tausers(self, tauser_ids):
+        with self._lock:
+            self._sucios.update(tauser_ids)
+
+    def invalidar(self):
+        """Descarta todo; la próxima consulta vuelve a leer el stock completo."""
+        with self._lock:
+            self._reiniciar()
+
+    # -------- Recarga --------
+    def _leer(self, tauser_ids=None):
+        """Lee los Tausers activos y su stock con piezas (dos consultas)."""
+        from .models import Tauser, TauserStock
+
+        tausers = Tauser.objects.filter(estado="activo")
+        stock = TauserStock.objects.filter(tauser__estado="activo", quantity__gt=0)
+        if tauser_ids is not None:
+            tausers = tausers.filter(id__in=tauser_ids)
+            stock = stock.filter(tauser_id__in=tauser_ids)
+
+        activos = {tauser_id: (nombre, ubicacion) for tauser_id, nombre, ubicacion in tausers.values_list("id", "nombre", "ubicacion")}
+        filas = {}
+        for stock_id, tauser_id, moneda_id, valor, cantidad in stock.order_by("id").values_list(
+            "id", "tauser_id", "denominacion__moneda_id", "denominacion__value", "quantity"
+        ):
+            filas.setdefault(moneda_id, {}).setdefault(tauser_id, []).append((stock_id, Decimal(valor), cantidad))
+
+        vectores = {
+            moneda_id: {
+                tauser_id: VectorStock(tuple(denominaciones), sum(valor * cantidad for _, valor, cantidad in denominaciones))
+                for tauser_id, denominaciones in por_tauser.items()
+            }
+            for moneda_id, por_tauser in filas.items()
+        }
+        return activos, vectores
+
+    def _actualizar(self):
+        if self._completo and time.monotonic() - self._construido_en > self._ttl():
+            self._reiniciar()
+        if not self._completo:
+            self._tausers, self._vectores = self._leer()
+            self._construido_en = time.monotonic()
+        elif self._sucios:
+            activos, vectores = self._leer(self._sucios)
+            for tauser_id in self._sucios:
+                self._tausers.pop(tauser_id, None)
+                for por_tauser in self._vectores.values():
+                    por_tauser.pop(tauser_id, None)
+            self._tausers.update(activos)
+            for moneda_id, por_tauser in vectores.items():
+                self._vectores.setdefault(moneda_id, {}).update(por_tauser)
+        self._sucios.clear()
+        self._completo = True
+
+    # -------- Lectura --------
+    def vectores(self, moneda_id):
+        """``{tauser_id: VectorStock}`` de los Tausers activos con stock en la moneda."""
+        with self._lock:
+            self._actualizar()
+            return dict(self._vectores.get(moneda_id, {}))
+
+    def rankear(self, moneda_id, monto, objetivo=None):
+        """
+        Ordena todos los Tausers activos según puedan entregar ``monto`` exacto
+        en ``moneda_id`` y, entre los que pueden, por costo.
+
+        Returns:
+            list[OpcionTauser]: ``entregado`` es ``[(valor, cantidad), ...]`` de
+            mayor a menor valor (vacío si el Tauser no puede entregar).
+        """
+        monto = Decimal(monto)
+        with self._lock:
+            self._actualizar()
+            tausers = dict(self._tausers)
+            por_tauser = dict(self._vectores.get(moneda_id, {}))
+
+        opciones = []
+        for tauser_id, (nombre, ubicacion) in tausers.items():
+            vector = por_tauser.get(tauser_id)
+            desglose = None
+            if vector is not None and vector.capacidad >= monto:
+                desglose = resolver_desglose(monto, vector.denominaciones, objetivo)
+            if desglose is None:
+                opciones.append(OpcionTauser(tauser_id, nombre, ubicacion, False, 0, None, []))
+                continue
+            disponibles = {stock_id: cantidad for stock_id, _, cantidad in vector.denominaciones}
+            piezas = sum(usar for _, _, usar in desglose)
+            escasez = sum(Decimal(usar) / disponibles[stock_id] for stock_id, _, usar in desglose)
+            entregado = {}
+            for _, valor, usar in desglose:
+                entregado[valor] = entregado.get(valor, 0) + usar
+            opciones.append(OpcionTauser(
+                tauser_id, nombre, ubicacion, True, piezas,
+                (piezas + PESO_ESCASEZ * escasez).quantize(Decimal("0.0001")),
+                sorted(entregado.items(), reverse=True),
+            ))
+
+        opciones.sort(key=lambda o: (not o.ok, o.costo if o.ok else 0, o.tauser_id))
+        return opciones
+
+
+#: Instancia única por proceso.
+enrutador_tausers = EnrutadorTausers()
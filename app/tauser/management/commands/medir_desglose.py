@@ -0,0 +1,61 @@
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from tauser.desglose import OBJETIVOS, desglose_voraz, resolver_desglose
+
+# Denominaciones de PYG (denominaciones.json)
+VALORES_PYG = (100000, 50000, 20000, 10000, 5000, 2000, 1000, 500, 100, 50)
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide el desglose de montos en PYG (millones) con stock aleatorio por denominación, '
+        'comparando el solver exacto con el recorrido de mayor a menor. Todos los montos '
+        'generados son entregables. No usa la base de datos.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--casos', type=int, default=200, help='Cantidad de montos a resolver')
+        parser.add_argument('--stock-max', type=int, default=2000, help='Piezas máximas por denominación')
+        parser.add_argument('--semilla', type=int, default=0)
+
+    def handle(self, *args, **options):
+        azar = random.Random(options['semilla'])
+        casos = []
+        for _ in range(options['casos']):
+            # Stock desparejo: algunas denominaciones casi agotadas
+            stock = [
+                (valor, valor, azar.choice((0, 1, 3, azar.randint(0, options['stock_max']))))
+                for valor in VALORES_PYG
+            ]
+            # Monto armado con parte del stock: siempre tiene desglose exacto
+            monto = Decimal(sum(valor * azar.randint(0, cantidad) for _, valor, cantidad in stock))
+            if monto:
+                casos.append((monto, stock))
+
+        self.stdout.write(f'{len(casos)} montos, hasta {max(m for m, _ in casos):,.0f} PYG')
+        inicio = time.perf_counter()
+        voraz_ok = sum(1 for monto, stock in casos if desglose_voraz(monto, stock)[1] == 0)
+        voraz_ms = (time.perf_counter() - inicio) * 1000
+        self.stdout.write(f'voraz: {voraz_ok}/{len(casos)} exactos, {voraz_ms / len(casos):.3f} ms/caso')
+
+        for objetivo in OBJETIVOS:
+            tiempos = []
+            exactos = 0
+            piezas = 0
+            for monto, stock in casos:
+                inicio = time.perf_counter()
+                desglose = resolver_desglose(monto, stock, objetivo)
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+                if desglose is not None:
+                    exactos += 1
+                    piezas += sum(cantidad for _, _, cantidad in desglose)
+            tiempos.sort()
+            self.stdout.write(self.style.SUCCESS(
+                f'{objetivo}: {exactos}/{len(casos)} exactos, {piezas} piezas, '
+                f'mediana {tiempos[len(tiempos) // 2]:.3f} ms, p99 {tiempos[int(len(tiempos) * 0.99)]:.3f} ms, '
+                f'máx {tiempos[-1]:.3f} ms'
+            ))
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tauser.pronostico import (
+    TAMANO_LOTE_HISTORIAL,
+    VENTANA_CORTA_DIAS,
+    VENTANA_DIAS,
+    planificar_reposicion,
+    pronosticar,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Estima, a partir del historial de retiros, cuándo se queda sin cada denominación '
+        'cada Tauser activo y arma los viajes de reposición para el horizonte indicado.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horizonte', type=int, default=7, help='Días hacia adelante a cubrir')
+        parser.add_argument('--cobertura', type=int, default=14, help='Días de demanda que deja cada reposición')
+        parser.add_argument('--ventana', type=int, default=VENTANA_DIAS, help='Días de historial a considerar')
+        parser.add_argument('--ventana-corta', type=int, default=VENTANA_CORTA_DIAS,
+                            help='Días finales con los que se detecta un aumento de la demanda')
+        parser.add_argument('--capacidad-viaje', type=int, default=None,
+                            help='Piezas por viaje (por defecto TAUSER_CAPACIDAD_VIAJE)')
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE_HISTORIAL, help='Filas por lote al leer el historial')
+
+    def handle(self, *args, **options):
+        for opcion in ('horizonte', 'cobertura', 'ventana', 'ventana_corta', 'capacidad_viaje', 'lote'):
+            if options[opcion] is not None and options[opcion] < 1:
+                raise CommandError(f'--{opcion.replace("_", "-")} debe ser mayor a cero')
+
+        pronosticos = pronosticar(
+            ventana=options['ventana'], ventana_corta=options['ventana_corta'], tamano_lote=options['lote'],
+        )
+        en_riesgo = [p for p in pronosticos if p.dias_restantes is not None and p.dias_restantes < options['horizonte']]
+        for p in en_riesgo:
+            self.stdout.write(
+                f'{p.tauser}: {p.moneda} {p.valor} ({p.tipo}) stock {p.stock}, '
+                f'{p.tasa_diaria}/día, se agota el {p.fecha_agotamiento:%Y-%m-%d}'
+            )
+
+        viajes = planificar_reposicion(
+            pronosticos, horizonte=options['horizonte'], cobertura=options['cobertura'],
+            capacidad_viaje=options['capacidad_viaje'],
+        )
+        for viaje in viajes:
+            destinos = sorted({e.tauser for e in viaje.entregas})
+            self.stdout.write(
+                f'Viaje {viaje.numero} (antes del {viaje.fecha_limite:%Y-%m-%d}): '
+                f'{viaje.piezas} piezas a {", ".join(destinos)}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Denominaciones en riesgo: {len(en_riesgo)}. Viajes de reposición: {len(viajes)}'
+        ))
@@ -0,0 +1,187 @@
+"""
+Pronóstico de agotamiento del efectivo de los Tausers y plan de reposición.
+
+1. **Tasas de retiro.** Se recorre el historial de ``TauserStockMovimiento``
+   (solo SALIDA de transacciones: los descuentos manuales no son demanda)
+   agrupado en la base por Tauser, denominación y día, con ``iterator()`` en
+   lotes: la memoria depende de cuántas combinaciones y días haya, no de
+   cuántos movimientos. Por cada (Tauser, denominación) se arma la serie
+   diaria de la ventana (los días sin retiros cuentan como cero) y la tasa es
+   el mayor promedio entre la ventana completa y la ventana corta final, para
+   que un aumento reciente de la demanda se note enseguida.
+2. **Agotamiento.** Con el stock actual (ya descontadas las reservas) se
+   estima cuántos días dura cada denominación y en qué fecha se acaba.
+3. **Reposición.** Las denominaciones que se agotan dentro del horizonte se
+   reponen hasta cubrir ``cobertura`` días, sin pasar la capacidad del casete.
+   Lo que se lleva a cada Tauser se reparte en viajes de hasta
+   ``capacidad_viaje`` piezas (límite de la bóveda de traslado) con
+   *first-fit decreasing*: cada Tauser se visita una sola vez salvo que su
+   entrega no quepa en una bóveda, y los viajes se ordenan por urgencia.
+
+Lo usan el comando ``pronosticar_reposicion`` y la vista
+``tauser.views.pronostico_reposicion``.
+"""
+import math
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import TauserStock, TauserStockMovimiento
+
+#: Días de historial usados para estimar la demanda.
+VENTANA_DIAS = 28
+#: Días finales de la ventana con los que se detecta un aumento reciente.
+VENTANA_CORTA_DIAS = 7
+#: Filas por lote al recorrer el historial agrupado.
+TAMANO_LOTE_HISTORIAL = 2000
+
+Pronostico = namedtuple(
+    "Pronostico",
+    [
+        "tauser_id", "tauser", "denominacion_id", "moneda", "valor", "tipo",
+        "stock", "tasa_diaria", "dias_restantes", "fecha_agotamiento",
+    ],
+)
+Entrega = namedtuple("Entrega", ["tauser_id", "tauser", "denominacion_id", "moneda", "valor", "tipo", "cantidad", "fecha_limite"])
+Viaje = namedtuple("Viaje", ["numero", "fecha_limite", "piezas", "entregas"])
+
+
+def capacidad_viaje_configurada():
+    """Piezas que entran en una bóveda de traslado (``TAUSER_CAPACIDAD_VIAJE``)."""
+    return getattr(settings, "TAUSER_CAPACIDAD_VIAJE", 5000)
+
+
+def capacidad_casete_configurada():
+    """Piezas máximas por denominación en un Tauser (``TAUSER_CAPACIDAD_CASETE``)."""
+    return getattr(settings, "TAUSER_CAPACIDAD_CASETE", 2000)
+
+
+def tasas_de_retiro(hoy=None, ventana=VENTANA_DIAS, ventana_corta=VENTANA_CORTA_DIAS, tamano_lote=TAMANO_LOTE_HISTORIAL):
+    """
+    Piezas retiradas por día para cada ``(tauser_id, denominacion_id)`` con
+    retiros en los últimos ``ventana`` días (sin contar ``hoy``, que está incompleto).
+
+    Returns:
+        dict: ``{(tauser_id, denominacion_id): float}``
+    """
+    hoy = hoy or timezone.localdate()
+    desde = hoy - timedelta(days=ventana)
+    por_dia = (
+        TauserStockMovimiento.objects.filter(
+            tipo_movimiento=TauserStockMovimiento.SALIDA,
+            transaccion__isnull=False,
+            fecha__date__gte=desde,
+            fecha__date__lt=hoy,
+        )
+        .annotate(dia=TruncDate("fecha"))
+        .values("tauser_id", "denominacion_id", "dia")
+        .annotate(total=Sum("cantidad"))
+        .order_by()
+    )
+
+    series = {}
+    for fila in por_dia.iterator(chunk_size=tamano_lote):
+        serie = series.setdefault((fila["tauser_id"], fila["denominacion_id"]), [0] * ventana)
+        serie[(fila["dia"] - desde).days] += fila["total"]
+
+    corta = min(ventana_corta, ventana)
+    return {
+        clave: max(sum(serie) / ventana, sum(serie[-corta:]) / corta)
+        for clave, serie in series.items()
+    }
+
+
+def pronosticar(hoy=None, ventana=VENTANA_DIAS, ventana_corta=VENTANA_CORTA_DIAS, tamano_lote=TAMANO_LOTE_HISTORIAL):
+    """
+    Pronóstico por (Tauser activo, denominación) con stock o con demanda, de
+    la denominación que se agota antes a la que dura más. Las que no tienen
+    retiros en la ventana quedan al final con ``dias_restantes`` None.
+    """
+    hoy = hoy or timezone.localdate()
+    tasas = tasas_de_retiro(hoy, ventana, ventana_corta, tamano_lote)
+    stock = (
+        TauserStock.objects.filter(tauser__estado="activo")
+        .values_list(
+            "tauser_id", "tauser__nombre", "denominacion_id", "denominacion__moneda__codigo",
+            "denominacion__value", "denominacion__type", "quantity",
+        )
+        .order_by("tauser_id", "denominacion_id")
+    )
+
+    pronosticos = []
+    for tauser_id, nombre, denominacion_id, moneda, valor, tipo, cantidad in stock.iterator(chunk_size=tamano_lote):
+        tasa = tasas.get((tauser_id, denominacion_id), 0.0)
+        if cantidad <= 0 and not tasa:
+            continue
+        cantidad = max(cantidad, 0)
+        dias = cantidad / tasa if tasa else None
+        pronosticos.append(Pronostico(
+            tauser_id, nombre, denominacion_id, moneda, valor, tipo, cantidad, round(tasa, 2),
+            round(dias, 1) if dias is not None else None,
+            hoy + timedelta(days=math.floor(dias)) if dias is not None else None,
+        ))
+
+    pronosticos.sort(key=lambda p: (p.dias_restantes is None, p.dias_restantes or 0, p.tauser_id, p.denominacion_id))
+    return pronosticos
+
+
+def planificar_reposicion(pronosticos, horizonte=7, cobertura=14, capacidad_viaje=None, capacidad_casete=None):
+    """
+    Arma los viajes para reponer las denominaciones que se agotan dentro de
+    ``horizonte`` días, llevándolas a ``cobertura`` días de demanda.
+
+    Returns:
+        list[Viaje]: ordenados por ``fecha_limite`` (el agotamiento más próximo
+        entre sus entregas).
+    """
+    capacidad_viaje = capacidad_viaje or capacidad_viaje_configurada()
+    capacidad_casete = capacidad_casete or capacidad_casete_configurada()
+
+    por_tauser = {}
+    for p in pronosticos:
+        if p.dias_restantes is None or p.dias_restantes >= horizonte:
+            continue
+        objetivo = min(math.ceil(p.tasa_diaria * cobertura), capacidad_casete)
+        cantidad = objetivo - p.stock
+        if cantidad > 0:
+            por_tauser.setdefault(p.tauser_id, []).append(Entrega(
+                p.tauser_id, p.tauser, p.denominacion_id, p.moneda, p.valor, p.tipo, cantidad, p.fecha_agotamiento,
+            ))
+
+    # Paquetes por Tauser; si uno no entra en una bóveda se parte en bóvedas llenas
+    paquetes = []
+    for entregas in por_tauser.values():
+        actual, piezas = [], 0
+        for entrega in entregas:
+            restante = entrega.cantidad
+            while restante:
+                parte = min(restante, capacidad_viaje - piezas)
+                actual.append(entrega._replace(cantidad=parte))
+                piezas += parte
+                restante -= parte
+                if piezas == capacidad_viaje:
+                    paquetes.append((piezas, actual))
+                    actual, piezas = [], 0
+        if actual:
+            paquetes.append((piezas, actual))
+
+    # First-fit decreasing
+    viajes = []
+    for piezas, entregas in sorted(paquetes, key=lambda paquete: paquete[0], reverse=True):
+        for viaje in viajes:
+            if viaje[0] + piezas <= capacidad_viaje:
+                viaje[0] += piezas
+                viaje[1].extend(entregas)
+                break
+        else:
+            viajes.append([piezas, list(entregas)])
+
+    viajes.sort(key=lambda viaje: min(e.fecha_limite for e in viaje[1]))
+    return [
+        Viaje(numero, min(e.fecha_limite for e in entregas), piezas, entregas)
+        for numero, (piezas, entregas) in enumerate(viajes, start=1)
+    ]
@@ -0,0 +1,97 @@
+"""
+Resumen del stock de toda la flota de Tausers.
+
+Para cada Tauser y moneda: valor y piezas disponibles (``TauserStock``, que ya
+tiene descontado lo reservado) y piezas y valor reservados por transacciones
+pendientes (``ReservaDenominacionTauser``). Se arma con dos consultas
+agrupadas por (Tauser, moneda) sobre el stock y las reservas unidos a
+``Denominacion``, más la lista de Tausers, sin importar cuántos haya.
+
+El resultado se guarda en la caché de Django (``CLAVE_CACHE``) durante
+``TAUSER_RESUMEN_FLOTA_SEGUNDOS``; las señales de ``tauser/signals.py`` lo
+borran cuando cambian el stock, las reservas (vía ``stock_modificado``), los
+Tausers o el estado de una transacción con Tauser. La caché es compartida
+(``CACHES`` en la base de datos), así que el borrado vale para todos los
+workers; el TTL solo acota escrituras en bloque que no disparan señales.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import DecimalField, F, Sum
+
+from commons.enums import EstadoTransaccionEnum
+from .models import ReservaDenominacionTauser, Tauser, TauserStock
+
+CLAVE_CACHE = 'tauser:resumen_flota'
+CAMPOS = ('piezas_disponibles', 'valor_disponible', 'piezas_reservadas', 'valor_reservado')
+
+
+def _ttl():
+    return getattr(settings, 'TAUSER_RESUMEN_FLOTA_SEGUNDOS', 60)
+
+
+def _agrupado(queryset, campo_cantidad):
+    """``{(tauser_id, moneda_codigo): (piezas, valor)}`` agrupando en la base."""
+    filas = (
+        queryset.values('tauser_id', 'denominacion__moneda__codigo')
+        .annotate(
+            piezas=Sum(campo_cantidad),
+            valor=Sum(F(campo_cantidad) * F('denominacion__value'), output_field=DecimalField(max_digits=20, decimal_places=2)),
+        )
+        .order_by()
+    )
+    return {
+        (fila['tauser_id'], fila['denominacion__moneda__codigo']): (fila['piezas'] or 0, fila['valor'] or Decimal('0'))
+        for fila in filas
+    }
+
+
+def _calcular():
+    disponible = _agrupado(TauserStock.objects.filter(quantity__gt=0), 'quantity')
+    reservado = _agrupado(
+        ReservaDenominacionTauser.objects.filter(transaccion__estado=EstadoTransaccionEnum.PENDIENTE),
+        'cantidad',
+    )
+
+    por_tauser = {}
+    totales = {}
+    for clave in sorted(set(disponible) | set(reservado)):
+        tauser_id, moneda = clave
+        piezas, valor = disponible.get(clave, (0, Decimal('0')))
+        piezas_reservadas, valor_reservado = reservado.get(clave, (0, Decimal('0')))
+        fila = {
+            'moneda': moneda,
+            'piezas_disponibles': piezas,
+            'valor_disponible': valor,
+            'piezas_reservadas': piezas_reservadas,
+            'valor_reservado': valor_reservado,
+        }
+        por_tauser.setdefault(tauser_id, []).append(fila)
+        total = totales.setdefault(moneda, dict.fromkeys(CAMPOS, 0))
+        for campo in CAMPOS:
+            total[campo] += fila[campo]
+
+    tausers = [
+        {'id': tauser_id, 'nombre': nombre, 'ubicacion': ubicacion, 'estado': estado, 'monedas': por_tauser.get(tauser_id, [])}
+        for tauser_id, nombre, ubicacion, estado in Tauser.objects.order_by('id').values_list('id', 'nombre', 'ubicacion', 'estado')
+    ]
+    return {'tausers': tausers, 'totales': [{'moneda': codigo, **totales[codigo]} for codigo in sorted(totales)]}
+
+
+def resumen_flota():
+    """
+    Devuelve ``{'tausers': [...], 'totales': [...]}``. Cada Tauser trae
+    ``id``, ``nombre``, ``ubicacion``, ``estado`` y ``monedas``: una fila por
+    moneda con ``piezas_disponibles``, ``valor_disponible``,
+    ``piezas_reservadas`` y ``valor_reservado``. ``totales`` suma esas filas por moneda.
+    """
+    resumen = cache.get(CLAVE_CACHE)
+    if resumen is None:
+        resumen = _calcular()
+        cache.set(CLAVE_CACHE, resumen, timeout=_ttl())
+    return resumen
+
+
+def invalidar_resumen_flota():
+    cache.delete(CLAVE_CACHE)
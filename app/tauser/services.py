@@ -1,15 +1,22 @@
 from decimal import Decimal
 
-from .models import Tauser, Denominacion
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+from .catalogo_denominaciones import catalogo_denominaciones
+from .desglose import desglose_voraz, resolver_desglose
+from .models import Tauser, Denominacion, ReservaDenominacionTauser, TauserStock, TauserStockMovimiento
+from .signals import stock_modificado
 from monedas.models import Moneda
 
-def validar_stock_tauser_para_transaccion(tauser_id, monto, moneda_id):
+def validar_stock_tauser_para_transaccion(tauser_id, monto, moneda_id, objetivo=None):
     """
     Verifica si el Tauser puede entregar el monto exacto usando su stock de denominaciones.
     Recibe:
       - tauser_id: ID del Tauser
       - monto: Decimal (monto a entregar)
       - moneda_id: ID de la moneda a entregar
+      - objetivo: criterio del desglose (ver ``tauser.desglose.OBJETIVOS``)
     Retorna un diccionario con:
       - 'ok': True/False
       - 'faltante': monto faltante (Decimal, si aplica)
@@ -26,31 +33,151 @@ def validar_stock_tauser_para_transaccion(tauser_id, monto, moneda_id):
     except Moneda.DoesNotExist:
         return {'ok': False, 'mensaje': 'Moneda no encontrada.'}
 
-    stock_qs = tauser.stocks.filter(denominacion__moneda=moneda_entrega, quantity__gt=0).select_related('denominacion').order_by('-denominacion__value')
-    stock_list = [(s.denominacion.value, s.quantity) for s in stock_qs]
-
-    monto_restante = Decimal(monto)
-    entregado = []
-    for valor, cantidad in stock_list:
-        valor = Decimal(valor)
-        max_billetes = int(monto_restante // valor)
-        usar = min(max_billetes, cantidad)
-        if usar > 0:
-            entregado.append((valor, usar))
-            monto_restante -= valor * usar
-    if monto_restante == 0:
+    stock_qs = tauser.stocks.filter(denominacion__moneda=moneda_entrega, quantity__gt=0).select_related('denominacion')
+    disponibles = [(s.id, s.denominacion.value, s.quantity) for s in stock_qs]
+
+    monto = Decimal(monto)
+    desglose = resolver_desglose(monto, disponibles, objetivo)
+    if desglose is not None:
         return {
             'ok': True,
             'faltante': Decimal('0'),
             'moneda': str(moneda_entrega),
-            'entregado': entregado,
+            'entregado': _agrupar_por_valor(desglose),
             'mensaje': 'Stock suficiente: el Tauser puede entregar el monto exacto usando las denominaciones disponibles.'
         }
-    else:
-        return {
-            'ok': False,
-            'faltante': monto_restante,
-            'moneda': str(moneda_entrega),
-            'entregado': entregado,
-            'mensaje': f'Stock insuficiente: el Tauser no puede entregar el monto exacto con las denominaciones disponibles. Faltante: {monto_restante} {moneda_entrega.codigo}.'
-        }
+
+    # Sin solución exacta: se informa lo que cubriría el recorrido de mayor a menor
+    parcial, faltante = desglose_voraz(monto, disponibles)
+    return {
+        'ok': False,
+        'faltante': faltante,
+        'moneda': str(moneda_entrega),
+        'entregado': _agrupar_por_valor(parcial),
+        'mensaje': f'Stock insuficiente: el Tauser no puede entregar el monto exacto con las denominaciones disponibles. Faltante: {faltante} {moneda_entrega.codigo}.'
+    }
+
+
+def _agrupar_por_valor(desglose):
+    """Convierte ``[(clave, valor, cantidad)]`` en ``[(valor, cantidad)]`` sumando valores repetidos (billete y moneda)."""
+    por_valor = {}
+    for _, valor, cantidad in desglose:
+        por_valor[valor] = por_valor.get(valor, 0) + cantidad
+    return sorted(por_valor.items(), reverse=True)
+
+
+class TauserLedger:
+    """
+    Asienta en el stock de un tauser las entradas y salidas de efectivo de una
+    transacción, en pocas sentencias sin importar cuántas denominaciones haya.
+
+    * ``registrar_entrada`` recibe un mapa ``{(tipo, valor): cantidad}`` (lo que
+      el cliente depositó): resuelve las denominaciones con una consulta,
+      bloquea las filas de stock en orden de id, suma con un único ``UPDATE``
+      y crea stock y movimientos con ``bulk_create``.
+    * ``registrar_salida_reservas`` asienta como SALIDA las reservas de la
+      transacción (el stock ya se descontó al reservar) con un ``bulk_create``.
+    """
+
+    def __init__(self, tauser, transaccion=None):
+        self.tauser = tauser
+        self.transaccion = transaccion
+
+    def _denominaciones(self, moneda, claves):
+        """Devuelve ``{(tipo, valor): denominacion_id}`` creando las que falten."""
+        def leer():
+            return {
+                (tipo, valor): den_id
+                for den_id, tipo, valor in Denominacion.objects.filter(
+                    moneda=moneda, value__in={valor for _, valor in claves}
+                ).values_list('id', 'type', 'value')
+            }
+
+        encontradas = leer()
+        faltantes = [clave for clave in claves if clave not in encontradas]
+        if faltantes:
+            Denominacion.objects.bulk_create(
+                [Denominacion(moneda=moneda, type=tipo, value=valor) for tipo, valor in faltantes],
+                ignore_conflicts=True,
+            )
+            # bulk_create no dispara post_save: se invalida el catálogo a mano
+            catalogo_denominaciones.invalidar()
+            encontradas = leer()
+        return encontradas
+
+    def registrar_entrada(self, moneda, denominaciones):
+        """
+        Suma al stock las piezas recibidas y registra un movimiento ENTRADA por
+        denominación. ``denominaciones`` es ``{(tipo, valor): cantidad}``; el
+        valor puede venir como float del formulario.
+
+        Returns:
+            int: cantidad total de piezas ingresadas.
+        """
+        cantidades = {}
+        for (tipo, valor), cantidad in denominaciones.items():
+            if cantidad > 0:
+                clave = (tipo, Decimal(str(valor)).quantize(Decimal('0.01')))
+                cantidades[clave] = cantidades.get(clave, 0) + cantidad
+        if not cantidades:
+            return 0
+
+        with transaction.atomic():
+            ids = self._denominaciones(moneda, list(cantidades))
+            por_denominacion = {}
+            for clave, cantidad in cantidades.items():
+                por_denominacion[ids[clave]] = por_denominacion.get(ids[clave], 0) + cantidad
+
+            existentes = dict(
+                TauserStock.objects.select_for_update()
+                .filter(tauser=self.tauser, denominacion_id__in=por_denominacion)
+                .order_by('id')
+                .values_list('denominacion_id', 'id')
+            )
+            if existentes:
+                TauserStock.objects.filter(id__in=existentes.values()).update(
+                    quantity=F('quantity') + Case(
+                        *(When(id=stock_id, then=Value(por_denominacion[den_id])) for den_id, stock_id in existentes.items()),
+                        output_field=IntegerField(),
+                    )
+                )
+            TauserStock.objects.bulk_create([
+                TauserStock(tauser=self.tauser, denominacion_id=den_id, quantity=cantidad)
+                for den_id, cantidad in por_denominacion.items()
+                if den_id not in existentes
+            ])
+            TauserStockMovimiento.objects.bulk_create([
+                TauserStockMovimiento(
+                    tauser=self.tauser,
+                    denominacion_id=den_id,
+                    cantidad=cantidad,
+                    tipo_movimiento=TauserStockMovimiento.ENTRADA,
+                    transaccion=self.transaccion,
+                )
+                for den_id, cantidad in por_denominacion.items()
+            ])
+            stock_modificado.send(sender=TauserStock, tauser_ids=[self.tauser.pk])
+        return sum(por_denominacion.values())
+
+    def registrar_salida_reservas(self, moneda=None):
+        """
+        Registra un movimiento SALIDA por cada reserva de la transacción
+        (opcionalmente solo las de ``moneda``).
+
+        Returns:
+            int: cantidad de movimientos creados.
+        """
+        reservas = ReservaDenominacionTauser.objects.filter(transaccion=self.transaccion)
+        if moneda is not None:
+            reservas = reservas.filter(denominacion__moneda=moneda)
+        movimientos = TauserStockMovimiento.objects.bulk_create([
+            TauserStockMovimiento(
+                tauser_id=tauser_id,
+                denominacion_id=denominacion_id,
+                cantidad=cantidad,
+                tipo_movimiento=TauserStockMovimiento.SALIDA,
+                transaccion=self.transaccion,
+            )
+            for tauser_id, denominacion_id, cantidad in reservas.values_list('tauser_id', 'denominacion_id', 'cantidad')
+        ])
+        return len(movimientos)
@@ -0,0 +1,64 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import Signal, receiver
+
+from .catalogo_denominaciones import catalogo_denominaciones
+from .enrutador import enrutador_tausers
+from .models import Denominacion, Tauser, TauserStock
+from .resumen_flota import invalidar_resumen_flota
+
+#: Lo envían las escrituras de stock en bloque (``update()``/``bulk_create``, que
+#: no disparan ``post_save``) con ``tauser_ids``: los Tausers afectados.
+stock_modificado = Signal()
+
+
+@receiver(post_save, sender=Denominacion)
+@receiver(post_delete, sender=Denominacion)
+def invalidar_catalogo_denominaciones(sender, **kwargs):
+    """Fuerza la recarga del catálogo de denominaciones tras cualquier cambio."""
+    catalogo_denominaciones.invalidar()
+    transaction.on_commit(catalogo_denominaciones.invalidar)
+    enrutador_tausers.invalidar()
+    transaction.on_commit(enrutador_tausers.invalidar)
+    invalidar_resumen_flota()
+    transaction.on_commit(invalidar_resumen_flota)
+
+
+def _marcar_en_commit(tauser_ids):
+    """
+    Marca los Tausers en el enrutador y borra el resumen de la flota, ahora y
+    otra vez al confirmar la transacción de BD.
+    """
+    tauser_ids = set(tauser_ids)
+
+    def marcar():
+        enrutador_tausers.marcar_tausers(tauser_ids)
+        invalidar_resumen_flota()
+
+    marcar()
+    transaction.on_commit(marcar)
+
+
+@receiver(post_save, sender=TauserStock)
+@receiver(post_delete, sender=TauserStock)
+def marcar_stock_tauser(sender, instance, **kwargs):
+    _marcar_en_commit([instance.tauser_id])
+
+
+@receiver(post_save, sender=Tauser)
+@receiver(post_delete, sender=Tauser)
+def marcar_tauser(sender, instance, **kwargs):
+    _marcar_en_commit([instance.pk])
+
+
+@receiver(stock_modificado)
+def marcar_stock_en_bloque(sender, tauser_ids, **kwargs):
+    _marcar_en_commit(tauser_ids)
+
+
+@receiver(post_save, sender='transaccion.Transaccion')
+def invalidar_resumen_por_transaccion(sender, instance, **kwargs):
+    """Al cerrarse una transacción con Tauser sus reservas dejan de contar como reservadas."""
+    if instance.tauser_id:
+        invalidar_resumen_flota()
+        transaction.on_commit(invalidar_resumen_flota)
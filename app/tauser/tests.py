@@ -1,4 +1,4 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from unittest.mock import patch, MagicMock
 from .utils import obtener_datos_transaccion
 from .views import tramitar_transacciones, nuevo_tauser, lista_tausers
@@ -8,6 +8,10 @@ from monedas.models import Moneda
 from .services import validar_stock_tauser_para_transaccion
 from django.urls import reverse
 from django.test import Client
+import os
+from commons.redondeo import redondear_a_denom_py
+from .catalogo_denominaciones import catalogo_denominaciones
+from .desglose import MENOS_BILLETES, PRESERVAR_ESCASOS, desglose_voraz, resolver_desglose
 
 class TauserUtilsTests(TestCase):
 	@patch('tauser.utils.Transaccion')
@@ -95,3 +99,412 @@ class TauserViewsSimpleTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn('mensaje', response.context)
         self.assertTrue(Tauser.objects.filter(ubicacion='Sucursal nueva').exists())
+
+
+class CatalogoDenominacionesTests(TestCase):
+    def setUp(self):
+        catalogo_denominaciones.invalidar()
+        self.addCleanup(catalogo_denominaciones.invalidar)
+        self.moneda, _ = Moneda.objects.get_or_create(codigo='USD', defaults={'nombre': 'Dólar', 'simbolo': '$', 'decimales': 2})
+
+    def test_valores_ordenados_de_mayor_a_menor(self):
+        valores = catalogo_denominaciones.valores('PYG')
+        self.assertTrue(valores)
+        self.assertEqual(list(valores), sorted(valores, reverse=True))
+        self.assertTrue(all(isinstance(v, Decimal) for v in valores))
+
+    def test_segunda_consulta_sin_queries(self):
+        catalogo_denominaciones.valores('USD')
+        with self.assertNumQueries(0):
+            catalogo_denominaciones.valores('USD')
+            catalogo_denominaciones.denominaciones('PYG')
+            redondear_a_denom_py(Decimal('12345'))
+
+    def test_recarga_al_crear_denominacion(self):
+        catalogo_denominaciones.valores('USD')
+        Denominacion.objects.create(moneda=self.moneda, value=Decimal('0.25'), type='coin')
+        self.assertIn(Decimal('0.25'), catalogo_denominaciones.valores('USD'))
+        nuevas = [d for d in catalogo_denominaciones.denominaciones('USD') if d['value'] == Decimal('0.25')]
+        self.assertEqual(nuevas, [{'currency': 'USD', 'value': Decimal('0.25'), 'type': 'coin'}])
+
+    def test_filas_de_la_tabla_se_suman_al_json(self):
+        del_json = set(catalogo_denominaciones.valores('USD'))
+        self.assertTrue(del_json)
+        Denominacion.objects.get_or_create(moneda=self.moneda, value=Decimal('0.25'), type='coin')
+        catalogo_denominaciones.invalidar()
+        self.assertEqual(set(catalogo_denominaciones.valores('USD')), del_json | {Decimal('0.25')})
+        claves = [(d['value'], d['type']) for d in catalogo_denominaciones.denominaciones('USD')]
+        self.assertEqual(len(claves), len(set(claves)))
+
+    def test_otro_proceso_se_ve_al_vencer_el_ttl(self):
+        catalogo_denominaciones.valores('USD')
+        # Alta sin señal, como la vería un worker distinto del que escribió
+        Denominacion.objects.bulk_create([Denominacion(moneda=self.moneda, value=Decimal('0.25'), type='coin')])
+        self.assertNotIn(Decimal('0.25'), catalogo_denominaciones.valores('USD'))
+        with override_settings(TAUSER_CATALOGO_TTL_SEGUNDOS=-1):
+            self.assertIn(Decimal('0.25'), catalogo_denominaciones.valores('USD'))
+
+    def test_redondeo_igual_al_json(self):
+        ruta = os.path.join(os.path.dirname(__file__), 'denominaciones.json')
+        for monto in ('0', '49', '51', '12345', '999999.99', '1234567'):
+            self.assertEqual(
+                redondear_a_denom_py(Decimal(monto)),
+                redondear_a_denom_py(Decimal(monto), denominaciones_path=ruta),
+            )
+
+
+class DesgloseTests(TestCase):
+    def test_encuentra_combinacion_que_el_voraz_no_ve(self):
+        disponibles = [('50', Decimal('50'), 5), ('20', Decimal('20'), 5)]
+        self.assertEqual(desglose_voraz(Decimal('60'), disponibles)[1], Decimal('10'))
+        self.assertEqual(resolver_desglose(Decimal('60'), disponibles), [('20', Decimal('20'), 3)])
+
+    def test_respeta_stock_y_minimiza_piezas(self):
+        disponibles = [('50', 50, 1), ('20', 20, 10), ('10', 10, 10)]
+        self.assertEqual(
+            resolver_desglose(Decimal('110'), disponibles, MENOS_BILLETES),
+            [('50', Decimal('50'), 1), ('20', Decimal('20'), 3)],
+        )
+        self.assertIsNone(resolver_desglose(Decimal('400'), disponibles))
+        self.assertIsNone(resolver_desglose(Decimal('15'), disponibles))
+
+    def test_preservar_escasos_evita_denominacion_agotada(self):
+        disponibles = [('100', 100, 1), ('50', 50, 40)]
+        self.assertEqual(resolver_desglose(Decimal('100'), disponibles, MENOS_BILLETES), [('100', Decimal('100'), 1)])
+        self.assertEqual(resolver_desglose(Decimal('100'), disponibles, PRESERVAR_ESCASOS), [('50', Decimal('50'), 2)])
+
+    def test_montos_con_decimales(self):
+        disponibles = [('q', Decimal('0.25'), 4), ('d', Decimal('0.10'), 3)]
+        self.assertEqual(resolver_desglose(Decimal('0.30'), disponibles), [('d', Decimal('0.10'), 3)])
+        self.assertIsNone(resolver_desglose(Decimal('0.05'), disponibles))
+
+    def test_pyg_millones(self):
+        disponibles = [(v, v, 500) for v in (100000, 50000, 20000, 10000, 5000, 2000, 1000, 500, 100, 50)]
+        desglose = resolver_desglose(Decimal('12345650'), disponibles)
+        self.assertEqual(sum(valor * cantidad for _, valor, cantidad in desglose), Decimal('12345650'))
+        self.assertEqual(desglose[0], (100000, Decimal('100000'), 123))
+
+    def test_validar_stock_usa_el_solver(self):
+        moneda, _ = Moneda.objects.get_or_create(codigo='USD', defaults={'nombre': 'Dólar', 'simbolo': '$', 'decimales': 2})
+        tauser = Tauser.objects.create(ubicacion='Sucursal desglose')
+        for valor in ('50', '20'):
+            den, _ = Denominacion.objects.get_or_create(moneda=moneda, value=Decimal(valor), type=Denominacion.BILL)
+            TauserStock.objects.create(tauser=tauser, denominacion=den, quantity=3)
+        res = validar_stock_tauser_para_transaccion(tauser.id, Decimal('60'), moneda.id)
+        self.assertTrue(res['ok'])
+        self.assertEqual(res['entregado'], [(Decimal('20'), 3)])
+
+
+class TauserLedgerTests(TestCase):
+    def setUp(self):
+        self.addCleanup(catalogo_denominaciones.invalidar)
+        self.moneda, _ = Moneda.objects.get_or_create(codigo='USD', defaults={'nombre': 'Dólar', 'simbolo': '$', 'decimales': 2})
+        self.tauser = Tauser.objects.create(ubicacion='Sucursal ledger')
+        self.den_100, _ = Denominacion.objects.get_or_create(moneda=self.moneda, value=Decimal('100'), type=Denominacion.BILL)
+        TauserStock.objects.create(tauser=self.tauser, denominacion=self.den_100, quantity=5)
+
+    def test_entrada_suma_stock_y_registra_movimientos(self):
+        from .models import TauserStockMovimiento
+        from .services import TauserLedger
+
+        ledger = TauserLedger(self.tauser)
+        # 100 existente (stock y denominación), 50 nueva, 1 moneda nueva
+        total = ledger.registrar_entrada(self.moneda, {('bill', 100.0): 2, ('bill', 50.0): 3, ('coin', 1.0): 4, ('bill', 20.0): 0})
+        self.assertEqual(total, 9)
+
+        stock = {
+            (s.denominacion.type, s.denominacion.value): s.quantity
+            for s in self.tauser.stocks.select_related('denominacion')
+        }
+        self.assertEqual(stock, {('bill', Decimal('100')): 7, ('bill', Decimal('50')): 3, ('coin', Decimal('1')): 4})
+        movimientos = TauserStockMovimiento.objects.filter(tauser=self.tauser, tipo_movimiento=TauserStockMovimiento.ENTRADA)
+        self.assertEqual(sorted(m.cantidad for m in movimientos), [2, 3, 4])
+        self.assertIn(Decimal('50'), catalogo_denominaciones.valores('USD'))
+
+    def test_entrada_en_sentencias_fijas(self):
+        from .services import TauserLedger
+
+        ledger = TauserLedger(self.tauser)
+        denominaciones = {('bill', 100.0): 1}
+        for valor in ('50', '20', '10', '5'):
+            Denominacion.objects.get_or_create(moneda=self.moneda, value=Decimal(valor), type=Denominacion.BILL)
+            denominaciones[('bill', float(valor))] = 2
+        # SAVEPOINT, denominaciones, SELECT FOR UPDATE, UPDATE, INSERT stock, INSERT movimientos,
+        # DELETE del resumen de la flota en la caché compartida, RELEASE
+        with self.assertNumQueries(8):
+            ledger.registrar_entrada(self.moneda, denominaciones)
+
+
+class MovimientosTauserTests(TestCase):
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+        from clientes.models import Cliente
+        from transaccion.models import Transaccion
+        from .models import TauserStockMovimiento
+
+        self.moneda, _ = Moneda.objects.get_or_create(codigo='USD', defaults={'nombre': 'Dólar', 'simbolo': '$', 'decimales': 2})
+        self.tauser = Tauser.objects.create(ubicacion='Sucursal movimientos')
+        den_100, _ = Denominacion.objects.get_or_create(moneda=self.moneda, value=Decimal('100'), type=Denominacion.BILL)
+        den_50, _ = Denominacion.objects.get_or_create(moneda=self.moneda, value=Decimal('50'), type=Denominacion.BILL)
+        usuario = get_user_model().objects.create_user(email='movimientos@example.com', password='pass12345')
+        for i in range(5):
+            cliente = Cliente.objects.create(nombre=f'Cliente mov {i}', tipo='MIN')
+            cliente.usuarios.add(usuario)
+            tx = Transaccion.objects.create(
+                cliente=cliente, tipo='compra', moneda=self.moneda, monto_operado=Decimal('100'),
+                tasa_aplicada=Decimal('7500'), comision=Decimal('0'), monto_pyg=Decimal('750000'),
+            )
+            TauserStockMovimiento.objects.create(
+                tauser=self.tauser, denominacion=den_100, cantidad=2,
+                tipo_movimiento=TauserStockMovimiento.ENTRADA, transaccion=tx,
+            )
+            TauserStockMovimiento.objects.create(
+                tauser=self.tauser, denominacion=den_50, cantidad=1,
+                tipo_movimiento=TauserStockMovimiento.SALIDA, transaccion=tx,
+            )
+        self.url = reverse('tauser:movimientos_tauser', args=[self.tauser.id])
+
+    @override_settings(MOVIMIENTOS_TAUSER_POR_PAGINA=4)
+    def test_sumas_en_base_y_paginas(self):
+        response = self.client.get(self.url, {'moneda': 'USD'})
+        self.assertEqual(response.context['suma_entrada_valor'], Decimal('1000'))
+        self.assertEqual(response.context['suma_salida_valor'], Decimal('250'))
+        self.assertEqual(len(response.context['movimientos_info']), 4)
+        self.assertEqual(response.context['movimientos_info'][0]['usuario'].email, 'movimientos@example.com')
+
+        vistos = []
+        pagina = response.context['pagina']
+        vistos += [info['mov'].id for info in response.context['movimientos_info']]
+        while pagina.siguiente:
+            response = self.client.get(self.url, {'moneda': 'USD', 'despues': pagina.siguiente})
+            pagina = response.context['pagina']
+            vistos += [info['mov'].id for info in response.context['movimientos_info']]
+        self.assertEqual(len(vistos), 10)
+        self.assertEqual(len(set(vistos)), 10)
+
+    def test_consultas_no_crecen_con_las_filas(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.get(self.url, {'moneda': 'USD'})
+        # Ninguna consulta por fila sobre los usuarios del cliente
+        usuarios = [q for q in consultas.captured_queries if 'clientes_cliente_usuarios' in q['sql']]
+        self.assertEqual(len(usuarios), 1)
+
+    def test_exportar_csv(self):
+        response = self.client.get(reverse('tauser:exportar_movimientos_tauser_csv', args=[self.tauser.id]), {'tipo': 'entrada'})
+        self.assertTrue(response.streaming)
+        lineas = b''.join(response.streaming_content).decode().strip().splitlines()
+        self.assertEqual(len(lineas), 6)
+        self.assertIn('movimientos@example.com', lineas[1])
+
+
+class EnrutadorTausersTests(TestCase):
+    def setUp(self):
+        from .enrutador import enrutador_tausers
+
+        self.enrutador = enrutador_tausers
+        self.enrutador.invalidar()
+        self.addCleanup(self.enrutador.invalidar)
+        self.moneda, _ = Moneda.objects.get_or_create(codigo='XTS', defaults={'nombre': 'Prueba', 'simbolo': 'X', 'decimales': 2})
+        den_100 = Denominacion.objects.create(moneda=self.moneda, value=Decimal('100'), type=Denominacion.BILL)
+        den_50 = Denominacion.objects.create(moneda=self.moneda, value=Decimal('50'), type=Denominacion.BILL)
+        self.justo = Tauser.objects.create(ubicacion='Justo')
+        self.holgado = Tauser.objects.create(ubicacion='Holgado')
+        self.corto = Tauser.objects.create(ubicacion='Corto')
+        TauserStock.objects.create(tauser=self.justo, denominacion=den_100, quantity=2)
+        TauserStock.objects.create(tauser=self.holgado, denominacion=den_100, quantity=10)
+        TauserStock.objects.create(tauser=self.corto, denominacion=den_50, quantity=3)
+
+    def test_ordena_por_factibilidad_y_costo(self):
+        opciones = self.enrutador.rankear(self.moneda.id, Decimal('200'))
+        ids = [o.tauser_id for o in opciones]
+        # Ambos entregan 2 piezas, pero el "justo" se quedaría sin billetes de 100
+        self.assertEqual(ids[:2], [self.holgado.id, self.justo.id])
+        self.assertTrue(opciones[0].ok)
+        self.assertEqual(opciones[0].piezas, 2)
+        self.assertEqual(opciones[0].entregado, [(Decimal('100'), 2)])
+        self.assertLess(opciones[0].costo, opciones[1].costo)
+        corto = next(o for o in opciones if o.tauser_id == self.corto.id)
+        self.assertFalse(corto.ok)
+        self.assertTrue(all(not o.ok for o in opciones[2:]))
+
+    def test_consulta_repetida_sin_queries_y_recarga_tras_cambios(self):
+        from .services import TauserLedger
+
+        self.enrutador.rankear(self.moneda.id, Decimal('200'))
+        with self.assertNumQueries(0):
+            self.enrutador.rankear(self.moneda.id, Decimal('200'))
+
+        # Entrada en bloque (sin post_save): avisa con stock_modificado
+        TauserLedger(self.corto).registrar_entrada(self.moneda, {('bill', 50.0): 1})
+        corto = next(o for o in self.enrutador.rankear(self.moneda.id, Decimal('200')) if o.tauser_id == self.corto.id)
+        self.assertTrue(corto.ok)
+        self.assertEqual(corto.entregado, [(Decimal('50'), 4)])
+
+        self.holgado.estado = 'inactivo'
+        self.holgado.save()
+        ids = [o.tauser_id for o in self.enrutador.rankear(self.moneda.id, Decimal('200'))]
+        self.assertNotIn(self.holgado.id, ids)
+        self.assertEqual(ids[0], self.justo.id)
+
+    def test_endpoint_sugerir_tauser(self):
+        url = reverse('transacciones:sugerir_tauser')
+        resp = self.client.get(url, {'monto': '200', 'moneda_id': self.moneda.id, 'limite': 2})
+        self.assertEqual(resp.status_code, 200)
+        datos = resp.json()
+        self.assertTrue(datos['ok'])
+        self.assertEqual(datos['sugerido'], self.holgado.id)
+        self.assertEqual([t['tauser_id'] for t in datos['tausers']], [self.holgado.id, self.justo.id])
+
+        self.assertEqual(self.client.get(url, {'monto': '200'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'monto': 'abc', 'moneda_id': self.moneda.id}).status_code, 400)
+        for limite in (0, -1):
+            self.assertEqual(
+                self.client.get(url, {'monto': '200', 'moneda_id': self.moneda.id, 'limite': limite}).status_code, 400
+            )
+
+
+class PronosticoReposicionTests(TestCase):
+    def setUp(self):
+        from datetime import datetime, time, timedelta
+        from django.utils import timezone
+        from clientes.models import Cliente
+        from transaccion.models import Transaccion
+        from .models import TauserStockMovimiento
+
+        self.hoy = timezone.localdate()
+        self.moneda, _ = Moneda.objects.get_or_create(codigo='XTS', defaults={'nombre': 'Prueba', 'simbolo': 'X', 'decimales': 2})
+        self.tauser = Tauser.objects.create(ubicacion='Sucursal pronóstico')
+        self.den_100 = Denominacion.objects.create(moneda=self.moneda, value=Decimal('100'), type=Denominacion.BILL)
+        den_50 = Denominacion.objects.create(moneda=self.moneda, value=Decimal('50'), type=Denominacion.BILL)
+        TauserStock.objects.create(tauser=self.tauser, denominacion=self.den_100, quantity=10)
+        TauserStock.objects.create(tauser=self.tauser, denominacion=den_50, quantity=40)
+        cliente = Cliente.objects.create(nombre='Cliente pronóstico', tipo='MIN')
+        tx = Transaccion.objects.create(
+            cliente=cliente, tipo='compra', moneda=self.moneda, monto_operado=Decimal('100'),
+            tasa_aplicada=Decimal('7500'), comision=Decimal('0'), monto_pyg=Decimal('750000'),
+        )
+        # 3 piezas por día durante 4 semanas y 8 por día la última semana
+        for dias_atras in range(1, 29):
+            mov = TauserStockMovimiento.objects.create(
+                tauser=self.tauser, denominacion=self.den_100, cantidad=8 if dias_atras <= 7 else 3,
+                tipo_movimiento=TauserStockMovimiento.SALIDA, transaccion=tx,
+            )
+            fecha = timezone.make_aware(datetime.combine(self.hoy - timedelta(days=dias_atras), time(12)))
+            TauserStockMovimiento.objects.filter(pk=mov.pk).update(fecha=fecha)
+        # Un descuento manual no es demanda
+        TauserStockMovimiento.objects.create(
+            tauser=self.tauser, denominacion=den_50, cantidad=30, tipo_movimiento=TauserStockMovimiento.SALIDA,
+        )
+
+    def test_tasa_usa_la_ventana_corta_si_la_demanda_sube(self):
+        from datetime import timedelta
+        from .pronostico import pronosticar
+
+        propios = [p for p in pronosticar(hoy=self.hoy) if p.tauser_id == self.tauser.id]
+        self.assertEqual(len(propios), 2)
+        p100 = propios[0]
+        self.assertEqual(p100.denominacion_id, self.den_100.id)
+        self.assertEqual(p100.tasa_diaria, 8.0)
+        self.assertEqual(p100.dias_restantes, 1.2)
+        self.assertEqual(p100.fecha_agotamiento, self.hoy + timedelta(days=1))
+        self.assertIsNone(propios[1].dias_restantes)
+
+    def test_plan_agrupa_entregas_en_pocos_viajes(self):
+        from datetime import timedelta
+        from .pronostico import Pronostico, planificar_reposicion
+
+        def pronostico(tauser_id, faltan, dias):
+            # tasa 10/día, cobertura 20 días -> objetivo 200 piezas
+            return Pronostico(tauser_id, f'T{tauser_id}', 1, 'XTS', Decimal('100'), 'bill', 200 - faltan, 10.0, dias, self.hoy + timedelta(days=dias))
+
+        pronosticos = [pronostico(1, 60, 3), pronostico(2, 50, 1), pronostico(3, 30, 2), pronostico(4, 150, 5), pronostico(5, 100, 30)]
+        viajes = planificar_reposicion(pronosticos, horizonte=7, cobertura=20, capacidad_viaje=100, capacidad_casete=500)
+        # Paquetes 100+50 (T4), 60, 50, 30: entran en tres bóvedas de 100; T5 no está en riesgo
+        self.assertEqual(len(viajes), 3)
+        self.assertEqual(sum(v.piezas for v in viajes), 290)
+        self.assertTrue(all(v.piezas <= 100 for v in viajes))
+        self.assertNotIn(5, {e.tauser_id for v in viajes for e in v.entregas})
+        self.assertEqual(viajes[0].fecha_limite, self.hoy + timedelta(days=1))
+
+    def test_endpoint_json(self):
+        response = self.client.get(reverse('tauser:pronostico_reposicion'), {'horizonte': 3, 'cobertura': 10})
+        self.assertEqual(response.status_code, 200)
+        datos = response.json()
+        propios = [p for p in datos['pronosticos'] if p['tauser_id'] == self.tauser.id]
+        self.assertEqual(len(propios), 1)
+        entregas = [e for v in datos['viajes'] for e in v['entregas'] if e['tauser_id'] == self.tauser.id]
+        # 8 por día × 10 días - 10 en stock
+        self.assertEqual([e['cantidad'] for e in entregas], [70])
+
+    def test_comando_rechaza_valores_no_positivos(self):
+        import io
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+
+        for opcion in ('--ventana', '--capacidad-viaje', '--lote', '--horizonte'):
+            with self.subTest(opcion=opcion), self.assertRaisesMessage(CommandError, opcion):
+                call_command('pronosticar_reposicion', opcion, '0', stdout=io.StringIO())
+        with self.assertRaisesMessage(CommandError, '--capacidad-viaje'):
+            call_command('pronosticar_reposicion', '--capacidad-viaje', '-5', stdout=io.StringIO())
+
+
+class ResumenFlotaTests(TestCase):
+    def setUp(self):
+        from clientes.models import Cliente
+        from transaccion.models import Transaccion
+        from transaccion.services import reservar_stock_tauser_para_transaccion
+        from .resumen_flota import invalidar_resumen_flota
+
+        invalidar_resumen_flota()
+        self.addCleanup(invalidar_resumen_flota)
+        self.moneda, _ = Moneda.objects.get_or_create(codigo='XTS', defaults={'nombre': 'Prueba', 'simbolo': 'X', 'decimales': 2})
+        den_100 = Denominacion.objects.create(moneda=self.moneda, value=Decimal('100'), type=Denominacion.BILL)
+        den_20 = Denominacion.objects.create(moneda=self.moneda, value=Decimal('20'), type=Denominacion.BILL)
+        self.tauser = Tauser.objects.create(ubicacion='Sucursal flota')
+        TauserStock.objects.create(tauser=self.tauser, denominacion=den_100, quantity=5)
+        TauserStock.objects.create(tauser=self.tauser, denominacion=den_20, quantity=10)
+        cliente = Cliente.objects.create(nombre='Cliente flota', tipo='MIN')
+        self.tx = Transaccion.objects.create(
+            cliente=cliente, tipo='compra', moneda=self.moneda, monto_operado=Decimal('240'),
+            tasa_aplicada=Decimal('7500'), comision=Decimal('0'), monto_pyg=Decimal('1800000'), tauser=self.tauser,
+        )
+        reservar_stock_tauser_para_transaccion(self.tauser, self.tx, Decimal('240'), self.moneda)
+
+    def _fila(self):
+        from .resumen_flota import resumen_flota
+
+        tauser = next(t for t in resumen_flota()['tausers'] if t['id'] == self.tauser.id)
+        return next(m for m in tauser['monedas'] if m['moneda'] == 'XTS')
+
+    def test_disponible_y_reservado(self):
+        fila = self._fila()
+        # 240 = 2 × 100 + 2 × 20
+        self.assertEqual(fila['piezas_disponibles'], 11)
+        self.assertEqual(fila['valor_disponible'], Decimal('460'))
+        self.assertEqual(fila['piezas_reservadas'], 4)
+        self.assertEqual(fila['valor_reservado'], Decimal('240'))
+        # Solo la lectura de la caché compartida
+        with self.assertNumQueries(1):
+            self._fila()
+
+    def test_se_invalida_con_escrituras_en_bloque(self):
+        from transaccion.services import cancelar_transacciones
+        from .services import TauserLedger
+
+        self._fila()
+        TauserLedger(self.tauser).registrar_entrada(self.moneda, {('bill', 100.0): 1})
+        self.assertEqual(self._fila()['valor_disponible'], Decimal('560'))
+
+        cancelar_transacciones([self.tx])
+        fila = self._fila()
+        self.assertEqual(fila['piezas_reservadas'], 0)
+        self.assertEqual(fila['valor_disponible'], Decimal('800'))
+
+    def test_vista(self):
+        response = self.client.get(reverse('tauser:resumen_stock_flota'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Sucursal flota')
+        self.assertIn('XTS', [t['moneda'] for t in response.context['totales']])
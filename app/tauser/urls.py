@@ -10,5 +10,8 @@ urlpatterns = [
     path('editar-estado/<int:tauser_id>/', views.editar_estado_tauser, name='editar_estado_tauser'),
     path('asignar_stock/', views.asignar_stock_tauser, name='asignar_stock_tauser'),
     path('ver-stock/<int:tauser_id>/', views.ver_stock_tauser, name='ver_stock_tauser'),
+    path('stock-flota/', views.resumen_stock_flota, name='resumen_stock_flota'),
+    path('pronostico-reposicion/', views.pronostico_reposicion, name='pronostico_reposicion'),
     path('movimientos/<int:tauser_id>/', views.movimientos_tauser, name='movimientos_tauser'),
+    path('movimientos/<int:tauser_id>/csv/', views.exportar_movimientos_tauser_csv, name='exportar_movimientos_tauser_csv'),
 ]
\ No newline at end of file
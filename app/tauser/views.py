@@ -2,61 +2,97 @@ import uuid
 from django.contrib import messages
 from django.shortcuts import render, get_object_or_404, redirect
 from django.utils import timezone
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from facturacion.models import FacturaElectronica
 from commons.enums import EstadoTransaccionEnum, TipoTransaccionEnum
 from mfa.services import generate_otp
 from monedas.models import TasaCambio, Moneda
 from transaccion.models import Transaccion
 from transaccion.services import cancelar_transaccion, calcular_transaccion, confirmar_transaccion
-from .services import validar_stock_tauser_para_transaccion
+from .services import TauserLedger, validar_stock_tauser_para_transaccion
+from .pronostico import planificar_reposicion, pronosticar
+from .resumen_flota import resumen_flota
+from .catalogo_denominaciones import catalogo_denominaciones
 from .forms import TauserForm, TauserStockForm
 from .models import Tauser, TauserStock, Denominacion, TauserStockMovimiento, ReservaDenominacionTauser
-import os
+import csv
 import json
+from decimal import Decimal
+from django.conf import settings
+from django.contrib.auth import get_user_model
 from django.db import models
+from django.db.models import DecimalField, F, Prefetch, Sum
+from commons.paginacion import paginar_por_clave
+def _movimientos_filtrados(request, tauser):
+    """
+    Movimientos del Tauser filtrados por moneda, tipo y fechas (querystring).
+    Devuelve ``(queryset, filtros)``; el queryset ya trae denominación, moneda,
+    transacción y cliente en el mismo SELECT y los usuarios del cliente en un prefetch.
+    """
+    filtros = {
+        'moneda_codigo': request.GET.get('moneda', ''),
+        'tipo_movimiento': request.GET.get('tipo', ''),
+        'fecha_inicio': request.GET.get('fecha_inicio', ''),
+        'fecha_fin': request.GET.get('fecha_fin', ''),
+    }
+    movimientos = TauserStockMovimiento.objects.filter(tauser=tauser).select_related(
+        'denominacion', 'denominacion__moneda', 'transaccion', 'transaccion__cliente'
+    ).prefetch_related(
+        Prefetch('transaccion__cliente__usuarios', queryset=get_user_model().objects.order_by('pk'))
+    )
+    if filtros['moneda_codigo']:
+        movimientos = movimientos.filter(denominacion__moneda__codigo=filtros['moneda_codigo'])
+    if filtros['tipo_movimiento']:
+        movimientos = movimientos.filter(tipo_movimiento=filtros['tipo_movimiento'])
+    if filtros['fecha_inicio']:
+        movimientos = movimientos.filter(fecha__date__gte=filtros['fecha_inicio'])
+    if filtros['fecha_fin']:
+        movimientos = movimientos.filter(fecha__date__lte=filtros['fecha_fin'])
+    return movimientos, filtros
+
+
+def _cliente_y_usuario(mov):
+    """Cliente de la transacción del movimiento y su primer usuario (del prefetch, sin consultas)."""
+    if not mov.transaccion:
+        return None, None
+    cliente = mov.transaccion.cliente
+    usuarios = cliente.usuarios.all()
+    return cliente, (usuarios[0] if usuarios else None)
+
+
 def movimientos_tauser(request, tauser_id):
     """
     Muestra los movimientos de stock de un Tauser, permitiendo filtrar por moneda, tipo y fechas.
-    Calcula sumas de entradas y salidas, y muestra información de usuario y cliente asociada a cada movimiento.
+    Las sumas de entradas y salidas se calculan en la base (una consulta agrupada por tipo) y la
+    lista se pagina por cursor ``(-fecha, id)``.
     """
     tausers = Tauser.objects.all().order_by('nombre')
     tauser_id_selected = request.GET.get('tauser') or tauser_id
     tauser = get_object_or_404(Tauser, id=tauser_id_selected)
-    movimientos = TauserStockMovimiento.objects.filter(tauser=tauser).select_related('denominacion', 'denominacion__moneda', 'transaccion').order_by('-fecha')
     monedas = Moneda.objects.all()
-    moneda_codigo = request.GET.get('moneda', '')
-    tipo_movimiento = request.GET.get('tipo', '')
-    fecha_inicio = request.GET.get('fecha_inicio', '')
-    fecha_fin = request.GET.get('fecha_fin', '')
-    if moneda_codigo:
-        movimientos = movimientos.filter(denominacion__moneda__codigo=moneda_codigo)
-    if tipo_movimiento:
-        movimientos = movimientos.filter(tipo_movimiento=tipo_movimiento)
-    if fecha_inicio:
-        movimientos = movimientos.filter(fecha__date__gte=fecha_inicio)
-    if fecha_fin:
-        movimientos = movimientos.filter(fecha__date__lte=fecha_fin)
-
-    # Calcular sumas de entrada y salida para la moneda filtrada
-    suma_entrada_valor = 0.0
-    suma_salida_valor = 0.0
-    for mov in movimientos:
-        total_valor = float(mov.denominacion.value) * mov.cantidad
-        if mov.tipo_movimiento == 'entrada':
-            suma_entrada_valor += total_valor
-        elif mov.tipo_movimiento == 'salida':
-            suma_salida_valor += total_valor
-
-    # Prepara un diccionario con usuario y cliente para cada movimiento
+    movimientos, filtros = _movimientos_filtrados(request, tauser)
+
+    # Sumas de entrada y salida: solo tienen sentido con una moneda filtrada
+    suma_entrada_valor = suma_salida_valor = Decimal('0')
+    if filtros['moneda_codigo']:
+        sumas = dict(
+            movimientos.order_by().values('tipo_movimiento').annotate(
+                total=Sum(F('cantidad') * F('denominacion__value'), output_field=DecimalField())
+            ).values_list('tipo_movimiento', 'total')
+        )
+        suma_entrada_valor = sumas.get(TauserStockMovimiento.ENTRADA) or Decimal('0')
+        suma_salida_valor = sumas.get(TauserStockMovimiento.SALIDA) or Decimal('0')
+
+    pagina = paginar_por_clave(
+        movimientos,
+        campo='fecha',
+        tamano=getattr(settings, 'MOVIMIENTOS_TAUSER_POR_PAGINA', 50),
+        despues=request.GET.get('despues'),
+        antes=request.GET.get('antes'),
+    )
     movimientos_info = []
-    for mov in movimientos:
-        usuario = None
-        cliente = None
-        if mov.transaccion:
-            cliente = mov.transaccion.cliente
-            # Busca el primer usuario asociado al cliente (si existe)
-            usuario = cliente.usuarios.first() if hasattr(cliente, 'usuarios') else None
+    for mov in pagina.items:
+        cliente, usuario = _cliente_y_usuario(mov)
         movimientos_info.append({
             'mov': mov,
             'usuario': usuario,
@@ -66,14 +102,97 @@ def movimientos_tauser(request, tauser_id):
         'tauser': tauser,
         'tausers': tausers,
         'movimientos_info': movimientos_info,
+        'pagina': pagina,
         'monedas': monedas,
-        'moneda_codigo': moneda_codigo,
         'tauser_id_selected': int(tauser_id_selected),
-        'tipo_movimiento': tipo_movimiento,
-        'fecha_inicio': fecha_inicio,
-        'fecha_fin': fecha_fin,
         'suma_entrada_valor': suma_entrada_valor,
         'suma_salida_valor': suma_salida_valor,
+        **filtros,
+    })
+
+
+class _Eco:
+    """Pseudo-archivo para ``csv.writer``: devuelve la línea en lugar de guardarla."""
+
+    def write(self, valor):
+        return valor
+
+
+def exportar_movimientos_tauser_csv(request, tauser_id):
+    """
+    Exporta en CSV los movimientos del Tauser con los mismos filtros que
+    ``movimientos_tauser``. La respuesta se genera por partes, leyendo la base de a bloques.
+    """
+    tauser = get_object_or_404(Tauser, id=tauser_id)
+    movimientos, _ = _movimientos_filtrados(request, tauser)
+
+    def filas():
+        escritor = csv.writer(_Eco())
+        yield escritor.writerow(['Fecha', 'Tipo', 'Denominación', 'Tipo denominación', 'Cantidad', 'Moneda', 'Total', 'Transacción', 'Cliente', 'Usuario'])
+        for mov in movimientos.order_by('-fecha', '-id').iterator(chunk_size=1000):
+            cliente, usuario = _cliente_y_usuario(mov)
+            yield escritor.writerow([
+                timezone.localtime(mov.fecha).strftime('%Y-%m-%d %H:%M:%S'),
+                mov.get_tipo_movimiento_display(),
+                mov.denominacion.value,
+                mov.denominacion.get_type_display(),
+                mov.cantidad,
+                mov.denominacion.moneda.codigo,
+                mov.denominacion.value * mov.cantidad,
+                mov.transaccion_id or '',
+                cliente or '',
+                usuario or '',
+            ])
+
+    response = StreamingHttpResponse(filas(), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="movimientos_{tauser.nombre}.csv"'
+    return response
+
+
+def _entero_positivo(valor, defecto):
+    try:
+        valor = int(valor)
+    except (TypeError, ValueError):
+        return defecto
+    return valor if valor > 0 else defecto
+
+
+def pronostico_reposicion(request):
+    """
+    Pronóstico de agotamiento por Tauser y denominación, y viajes de reposición,
+    en JSON. Querystring opcional: ``horizonte`` y ``cobertura`` (días).
+    """
+    horizonte = _entero_positivo(request.GET.get('horizonte'), 7)
+    cobertura = _entero_positivo(request.GET.get('cobertura'), 14)
+    pronosticos = pronosticar()
+    viajes = planificar_reposicion(pronosticos, horizonte=horizonte, cobertura=cobertura)
+    return JsonResponse({
+        'horizonte': horizonte,
+        'cobertura': cobertura,
+        'pronosticos': [
+            p._asdict() for p in pronosticos
+            if p.dias_restantes is not None and p.dias_restantes < horizonte
+        ],
+        'viajes': [
+            {**viaje._asdict(), 'entregas': [e._asdict() for e in viaje.entregas]}
+            for viaje in viajes
+        ],
+    })
+
+
+def resumen_stock_flota(request):
+    """
+    Stock de todos los Tausers por moneda (disponible y reservado) en una sola
+    página; los datos salen de ``tauser.resumen_flota`` (agregado y en caché).
+    """
+    resumen = resumen_flota()
+    estado = request.GET.get('estado', '')
+    tausers = [t for t in resumen['tausers'] if not estado or t['estado'] == estado]
+    return render(request, 'resumen_flota.html', {
+        'tausers': tausers,
+        'totales': resumen['totales'],
+        'estados': Tauser.ESTADOS,
+        'estado_selected': estado,
     })
 
 
@@ -108,13 +227,9 @@ def ver_stock_tauser(request, tauser_id):
 
 def asignar_stock_tauser(request):
     """
-    Permite asignar o actualizar el stock de divisas del Tauser, basado en las denominaciones definidas en denominaciones.json.
+    Permite asignar o actualizar el stock de divisas del Tauser, basado en el catálogo de denominaciones.
     Procesa el formulario para agregar o quitar cantidades de cada denominación.
     """
-    denominaciones_json_path = os.path.join(os.path.dirname(__file__), 'denominaciones.json')
-    with open(denominaciones_json_path, 'r') as f:
-        denominaciones_data = json.load(f)
-
     denominaciones = []
     moneda_seleccionada = None
 
@@ -124,10 +239,7 @@ def asignar_stock_tauser(request):
         if moneda_id:
             try:
                 moneda_seleccionada = Moneda.objects.get(id=moneda_id)
-                denominaciones = [
-                    d for d in denominaciones_data
-                    if d['currency'] == moneda_seleccionada.codigo
-                ]
+                denominaciones = catalogo_denominaciones.denominaciones(moneda_seleccionada.codigo)
             except Moneda.DoesNotExist:
                 denominaciones = []
 
@@ -256,7 +368,8 @@ def tramitar_transacciones(request):
                         tx.tasa_aplicada = calculo_nuevo['tasa_aplicada']
                         tx.comision = calculo_nuevo['comision']
                         tx.monto_pyg = calculo_nuevo['monto_pyg']
-                        tx.save(update_fields=['tasa_aplicada', 'comision', 'monto_pyg'])
+                        tx.version_precios = calculo_nuevo.get('version_precios')
+                        tx.save(update_fields=['tasa_aplicada', 'comision', 'monto_pyg', 'version_precios'])
                         # Marcar en sesión que ya se aceptó el cambio para este código
                         request.session[session_key_cotizacion] = True
 
@@ -464,6 +577,7 @@ def tramitar_transacciones(request):
                                     tx.tasa_aplicada = calculo_nuevo['tasa_aplicada']
                                     tx.comision = calculo_nuevo['comision']
                                     tx.monto_pyg = calculo_nuevo['monto_pyg']
+                                    tx.version_precios = calculo_nuevo.get('version_precios')
                                 
                                 # Marcar como COMPLETADA
                                 tx.estado = EstadoTransaccionEnum.COMPLETADA
@@ -473,8 +587,7 @@ def tramitar_transacciones(request):
                                 tauser = tx.tauser
                                 if not tauser:
                                     raise Exception("No hay TAUser asignado a la transacción.")
-                                from .models import Denominacion, TauserStock, TauserStockMovimiento, ReservaDenominacionTauser
-                                from monedas.models import Moneda
+                                ledger = TauserLedger(tauser, tx)
 
                                 tipo_tx = str(tx.tipo).lower()
                                 medio_pago = getattr(tx, 'medio_pago', None)
@@ -505,32 +618,13 @@ def tramitar_transacciones(request):
                                     
                                     # SALIDA solo si el cobro es efectivo (entrega PYG)
                                     if cobro_efectivo:
-                                        moneda_pyg = Moneda.objects.get(codigo="PYG")
-                                        reservas = ReservaDenominacionTauser.objects.filter(transaccion=tx)
-                                        for reserva in reservas:
-                                            if reserva.denominacion.moneda == moneda_pyg:
-                                                TauserStockMovimiento.objects.create(
-                                                    tauser=reserva.tauser,
-                                                    denominacion=reserva.denominacion,
-                                                    cantidad=reserva.cantidad,
-                                                    tipo_movimiento=TauserStockMovimiento.SALIDA,
-                                                    transaccion=tx
-                                                )
+                                        ledger.registrar_salida_reservas(moneda=Moneda.objects.get(codigo="PYG"))
                                 # --- COMPRA ---
                                 elif tipo_tx == "compra":
                                     # SALIDA siempre (entrega moneda extranjera)
-                                    reservas = ReservaDenominacionTauser.objects.filter(transaccion=tx)
-                                    if not reservas.exists():
+                                    if not ledger.registrar_salida_reservas():
                                         import logging
                                         logging.warning(f"[TAUSER] No se encontraron reservas para registrar salida en compra. Transacción: {tx.id}")
-                                    for reserva in reservas:
-                                        TauserStockMovimiento.objects.create(
-                                            tauser=reserva.tauser,
-                                            denominacion=reserva.denominacion,
-                                            cantidad=reserva.cantidad,
-                                            tipo_movimiento=TauserStockMovimiento.SALIDA,
-                                            transaccion=tx
-                                        )
 
                                 # FACTURA
                                 if generar_factura:
@@ -610,6 +704,7 @@ def tramitar_transacciones(request):
                                 tx.tasa_aplicada = calculo_nuevo['tasa_aplicada']
                                 tx.comision = calculo_nuevo['comision']
                                 tx.monto_pyg = calculo_nuevo['monto_pyg']
+                                tx.version_precios = calculo_nuevo.get('version_precios')
                                 tx.save()
                             
                             # ===========================
@@ -643,8 +738,7 @@ def tramitar_transacciones(request):
                             tauser = tx.tauser
                             if not tauser:
                                 raise Exception("No hay TAUser asignado a la transacción.")
-                            from .models import Denominacion, TauserStock, TauserStockMovimiento, ReservaDenominacionTauser
-                            from monedas.models import Moneda
+                            ledger = TauserLedger(tauser, tx)
 
                             tipo_tx = str(tx.tipo).lower()
                             medio_pago = getattr(tx, 'medio_pago', None)
@@ -655,79 +749,20 @@ def tramitar_transacciones(request):
                             # --- VENTA ---
                             if tipo_tx == "venta":
                                 # ENTRADA siempre (recibe moneda extranjera)
-                                moneda = tx.moneda
-                                for (tipo, valor), cantidad in denominaciones.items():
-                                    denom_obj, _ = Denominacion.objects.get_or_create(
-                                        moneda=moneda,
-                                        value=valor,
-                                        type=tipo
-                                    )
-                                    stock_obj, _ = TauserStock.objects.get_or_create(
-                                        tauser=tauser,
-                                        denominacion=denom_obj
-                                    )
-                                    stock_obj.quantity += cantidad
-                                    stock_obj.save()
-                                    if cantidad > 0:
-                                        TauserStockMovimiento.objects.create(
-                                            tauser=tauser,
-                                            denominacion=denom_obj,
-                                            cantidad=cantidad,
-                                            tipo_movimiento=TauserStockMovimiento.ENTRADA,
-                                            transaccion=tx
-                                        )
+                                ledger.registrar_entrada(tx.moneda, denominaciones)
                                 # SALIDA solo si el cobro es efectivo (entrega PYG)
                                 if cobro_efectivo:
-                                    moneda_pyg = Moneda.objects.get(codigo="PYG")
-                                    reservas = ReservaDenominacionTauser.objects.filter(transaccion=tx)
-                                    for reserva in reservas:
-                                        if reserva.denominacion.moneda == moneda_pyg:
-                                            TauserStockMovimiento.objects.create(
-                                                tauser=reserva.tauser,
-                                                denominacion=reserva.denominacion,
-                                                cantidad=reserva.cantidad,
-                                                tipo_movimiento=TauserStockMovimiento.SALIDA,
-                                                transaccion=tx
-                                            )
+                                    ledger.registrar_salida_reservas(moneda=Moneda.objects.get(codigo="PYG"))
 
                             # --- COMPRA ---
                             elif tipo_tx == "compra":
                                 # ENTRADA (recibe PYG) SIEMPRE, sin importar el método de pago
-                                moneda_pyg = Moneda.objects.get(codigo="PYG")
-                                for (tipo, valor), cantidad in denominaciones.items():
-                                    denom_obj, _ = Denominacion.objects.get_or_create(
-                                        moneda=moneda_pyg,
-                                        value=valor,
-                                        type=tipo
-                                    )
-                                    stock_obj, _ = TauserStock.objects.get_or_create(
-                                        tauser=tauser,
-                                        denominacion=denom_obj
-                                    )
-                                    stock_obj.quantity += cantidad
-                                    stock_obj.save()
-                                    if cantidad > 0:
-                                        TauserStockMovimiento.objects.create(
-                                            tauser=tauser,
-                                            denominacion=denom_obj,
-                                            cantidad=cantidad,
-                                            tipo_movimiento=TauserStockMovimiento.ENTRADA,
-                                            transaccion=tx
-                                        )
+                                ledger.registrar_entrada(Moneda.objects.get(codigo="PYG"), denominaciones)
                                 # SALIDA siempre (entrega moneda extranjera)
-                                reservas = ReservaDenominacionTauser.objects.filter(transaccion=tx)
-                                if not reservas.exists():
+                                if not ledger.registrar_salida_reservas():
                                     # Depuración: si no hay reservas, dejar constancia
                                     import logging
                                     logging.warning(f"[TAUSER] No se encontraron reservas para registrar salida en compra. Transacción: {tx.id}")
-                                for reserva in reservas:
-                                    TauserStockMovimiento.objects.create(
-                                        tauser=reserva.tauser,
-                                        denominacion=reserva.denominacion,
-                                        cantidad=reserva.cantidad,
-                                        tipo_movimiento=TauserStockMovimiento.SALIDA,
-                                        transaccion=tx
-                                    )
                                     
                             # ===========================
                             # 5. Generar factura (NUEVO)
@@ -797,18 +832,12 @@ def tramitar_transacciones(request):
     if datos_transaccion:
         tipo = datos_transaccion["tipo"].lower()
 
-        denominaciones_json_path = os.path.join(os.path.dirname(__file__), 'denominaciones.json')
-        with open(denominaciones_json_path, 'r') as f:
-            denominaciones_data = json.load(f)
-
+        # El catálogo ya devuelve las denominaciones ordenadas de mayor a menor
         if tipo == "compra" and datos_transaccion.get("medio_pago") == "Efectivo":
-            denominaciones_venta = [d for d in denominaciones_data if d["currency"] == "PYG"]
-            denominaciones_venta.sort(key=lambda x: float(x["value"]), reverse=True)
+            denominaciones_venta = catalogo_denominaciones.denominaciones("PYG")
         elif tipo == "venta":
             moneda_codigo = datos_transaccion["moneda"].codigo
-            denominaciones_venta = [d for d in denominaciones_data if d["currency"] == moneda_codigo]
-
-        denominaciones_venta.sort(key=lambda x: float(x["value"]), reverse=True)
+            denominaciones_venta = catalogo_denominaciones.denominaciones(moneda_codigo)
 
     return render(request, "tramitar_transacciones.html", {
         "datos_transaccion": datos_transaccion,
@@ -0,0 +1,97 @@
+"""
+Caché en memoria (por proceso) de los parámetros de precio usados por
+``transaccion.services.calcular_transaccion``.
+
+Cada cotización necesita el precio base y las comisiones de la moneda
+(``PrecioBaseComision``), el descuento vigente del segmento del cliente
+(``TasaComision``) y la comisión del método de pago (``ComisionMetodoPago``).
+Esas filas cambian muy poco, pero el calculador se consulta en cada tecla del
+formulario de compra/venta. Este módulo guarda los parámetros ya resueltos por
+clave ``(moneda, segmento, tipo_metodo, tipo, version_precios)`` para que una
+cotización repetida solo lea la fila de ``VersionPrecios``.
+
+La invalidación se hace por señales (ver ``transaccion/signals.py``): cualquier
+alta, edición o baja de ``PrecioBaseComision``, ``TasaComision``,
+``ComisionMetodoPago``, ``PaymentMethod`` o ``TasaCambio`` vacía la caché.
+Como la caché es local a cada proceso, los cambios hechos en otro proceso se
+detectan por la versión de precios de la clave; las entradas además vencen a
+los ``CACHE_PRECIOS_TTL_SEGUNDOS`` segundos para no acumular versiones viejas.
+"""
+import threading
+import time
+
+from django.conf import settings
+
+
+class CachePrecios:
+    """
+    Almacén clave → valor con vencimiento, seguro para hilos y con contadores
+    de aciertos/fallos.
+
+    La caché no sabe cómo obtener los datos: quien consulta pasa una función
+    ``cargar`` que se ejecuta solo cuando la clave no está o venció.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entradas = {}
+        self._hits = 0
+        self._misses = 0
+        self._invalidaciones = 0
+
+    @staticmethod
+    def _ttl():
+        return getattr(settings, "CACHE_PRECIOS_TTL_SEGUNDOS", 300)
+
+    def obtener(self, clave, cargar):
+        """
+        Devuelve el valor asociado a ``clave``.
+
+        Si no existe o venció, llama a ``cargar()`` y guarda el resultado.
+        Las excepciones de ``cargar`` se propagan y no se cachean.
+        """
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada[0] > ahora:
+                self._hits += 1
+                return entrada[1]
+            self._misses += 1
+
+        valor = cargar()
+
+        with self._lock:
+            self._entradas[clave] = (time.monotonic() + self._ttl(), valor)
+        return valor
+
+    def invalidar(self):
+        """Descarta todas las entradas (se llama desde las señales)."""
+        with self._lock:
+            self._entradas.clear()
+            self._invalidaciones += 1
+
+    def estadisticas(self):
+        """
+        Retorna un diccionario con el estado de la caché:
+        ``hits``, ``misses``, ``invalidaciones``, ``entradas`` y ``hit_ratio``.
+        """
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "invalidaciones": self._invalidaciones,
+                "entradas": len(self._entradas),
+                "hit_ratio": (self._hits / total) if total else 0.0,
+            }
+
+    def reiniciar_estadisticas(self):
+        """Pone los contadores en cero (útil en pruebas y diagnósticos)."""
+        with self._lock:
+            self._hits = 0
+            self._misses = 0
+            self._invalidaciones = 0
+
+
+#: Instancia única por proceso usada por ``calcular_transaccion``.
+cache_precios = CachePrecios()
@@ -0,0 +1,175 @@
+"""
+Contadores acumulados para los límites de operación de los clientes.
+
+``validate_limits`` necesita, para un cliente y una moneda, cuánto suman en PYG
+(y en la moneda operada) las transacciones pendientes y pagadas del día y del
+mes. En lugar de agregar sobre ``Transaccion`` en cada alta, esos totales se
+guardan en ``ContadorLimite`` (una fila por día y otra por mes) y se actualizan
+con ``F()`` cada vez que una transacción cambia de estado o de monto (señales
+en ``transaccion/signals.py``).
+
+Los días y meses se toman en la zona horaria local (``TIME_ZONE``), igual que
+los filtros ``fecha__date`` del ORM.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from commons.enums import EstadoTransaccionEnum
+from .models import ContadorLimite, Transaccion
+
+#: Estados cuyas transacciones suman para los límites.
+ESTADOS_CONTADOS = (EstadoTransaccionEnum.PENDIENTE, EstadoTransaccionEnum.PAGADA)
+
+
+def _inicio_mes(dia):
+    return dia.replace(day=1)
+
+
+def _inicio_mes_siguiente(dia):
+    return (dia.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def periodos(dia):
+    """Claves ``(periodo, fecha)`` de los contadores que afecta un día."""
+    return ((ContadorLimite.DIA, dia), (ContadorLimite.MES, _inicio_mes(dia)))
+
+
+def aplicar_delta(cliente_id, moneda_id, dia, delta_pyg, delta_operado):
+    """
+    Suma ``delta_pyg`` y ``delta_operado`` (pueden ser negativos) a los
+    contadores del día y del mes. La actualización es atómica en la base.
+    """
+    with transaction.atomic():
+        for periodo, fecha in periodos(dia):
+            filtro = {"cliente_id": cliente_id, "moneda_id": moneda_id, "periodo": periodo, "fecha": fecha}
+            actualizadas = ContadorLimite.objects.filter(**filtro).update(
+                monto_pyg=F("monto_pyg") + delta_pyg,
+                monto_operado=F("monto_operado") + delta_operado,
+            )
+            if not actualizadas:
+                _, creado = ContadorLimite.objects.get_or_create(
+                    **filtro, defaults={"monto_pyg": delta_pyg, "monto_operado": delta_operado}
+                )
+                if not creado:
+                    ContadorLimite.objects.filter(**filtro).update(
+                        monto_pyg=F("monto_pyg") + delta_pyg,
+                        monto_operado=F("monto_operado") + delta_operado,
+                    )
+
+
+def descontar_lote(transacciones):
+    """
+    Resta de los contadores el aporte de transacciones que dejaron de contar
+    (cancelación o expiración en bloque con ``update()``, sin señales).
+    ``transacciones`` son dicts con ``cliente_id``, ``moneda_id``, ``fecha``,
+    ``monto_pyg`` y ``monto_operado``; se aplica un delta por cliente, moneda y día.
+    """
+    por_dia = {}
+    for t in transacciones:
+        clave = (t["cliente_id"], t["moneda_id"], timezone.localdate(t["fecha"]))
+        total = por_dia.setdefault(clave, [Decimal("0"), Decimal("0")])
+        total[0] += Decimal(str(t["monto_pyg"]))
+        total[1] += Decimal(str(t["monto_operado"]))
+    for (cliente_id, moneda_id, dia), (pyg, operado) in por_dia.items():
+        aplicar_delta(cliente_id, moneda_id, dia, -pyg, -operado)
+
+
+def recalcular(cliente_id, moneda_id, dia, crear=True):
+    """
+    Recalcula desde ``Transaccion`` los contadores del día y del mes indicados.
+    Se usa cuando no se conoce el aporte anterior de una transacción.
+    Con ``crear=False`` solo se actualizan filas existentes.
+    """
+    base = Transaccion.objects.filter(cliente_id=cliente_id, moneda_id=moneda_id, estado__in=ESTADOS_CONTADOS)
+    rangos = {
+        ContadorLimite.DIA: base.filter(fecha__date=dia),
+        ContadorLimite.MES: base.filter(
+            fecha__date__gte=_inicio_mes(dia), fecha__date__lt=_inicio_mes_siguiente(dia)
+        ),
+    }
+    with transaction.atomic():
+        for periodo, fecha in periodos(dia):
+            totales = rangos[periodo].aggregate(pyg=Sum("monto_pyg"), operado=Sum("monto_operado"))
+            valores = {"monto_pyg": totales["pyg"] or 0, "monto_operado": totales["operado"] or 0}
+            filtro = {"cliente_id": cliente_id, "moneda_id": moneda_id, "periodo": periodo, "fecha": fecha}
+            if crear:
+                ContadorLimite.objects.update_or_create(**filtro, defaults=valores)
+            else:
+                ContadorLimite.objects.filter(**filtro).update(**valores)
+
+
+def contadores_bloqueados(cliente, moneda, dia=None):
+    """
+    Devuelve ``(contador_dia, contador_mes)`` bloqueados con ``select_for_update``.
+    Debe llamarse dentro de ``transaction.atomic()``; las filas que falten se crean en cero.
+    """
+    dia = dia or timezone.localdate()
+    claves = dict(periodos(dia))
+    filtro = {"cliente": cliente, "moneda": moneda}
+
+    por_periodo = Q()
+    for periodo, fecha in claves.items():
+        por_periodo |= Q(periodo=periodo, fecha=fecha)
+
+    def leer():
+        return {
+            c.periodo: c
+            for c in ContadorLimite.objects.select_for_update().filter(por_periodo, **filtro).order_by("periodo")
+        }
+
+    contadores = leer()
+    if len(contadores) < len(claves):
+        for periodo, fecha in claves.items():
+            ContadorLimite.objects.get_or_create(**filtro, periodo=periodo, fecha=fecha)
+        contadores = leer()
+    return contadores[ContadorLimite.DIA], contadores[ContadorLimite.MES]
+
+
+def reconstruir(tamano_lote=1000):
+    """
+    Borra y vuelve a generar todos los contadores a partir del historial de
+    transacciones. Devuelve la cantidad de contadores creados.
+    """
+    with transaction.atomic():
+        contadores = _contadores_desde_historial()
+        ContadorLimite.objects.all().delete()
+        ContadorLimite.objects.bulk_create(contadores, batch_size=tamano_lote)
+    return len(contadores)
+
+
+def _contadores_desde_historial():
+    """Arma (sin guardar) los contadores de día y mes agregando ``Transaccion``."""
+    por_dia = (
+        Transaccion.objects.filter(estado__in=ESTADOS_CONTADOS)
+        .annotate(dia=TruncDate("fecha"))
+        .values("cliente_id", "moneda_id", "dia")
+        .annotate(pyg=Sum("monto_pyg"), operado=Sum("monto_operado"))
+        .order_by()
+    )
+
+    dias = []
+    meses = {}
+    for fila in por_dia.iterator():
+        clave = (fila["cliente_id"], fila["moneda_id"])
+        pyg = fila["pyg"] or Decimal("0")
+        operado = fila["operado"] or Decimal("0")
+        dias.append(ContadorLimite(
+            cliente_id=clave[0], moneda_id=clave[1], periodo=ContadorLimite.DIA,
+            fecha=fila["dia"], monto_pyg=pyg, monto_operado=operado,
+        ))
+        mes = meses.setdefault(clave + (_inicio_mes(fila["dia"]),), [Decimal("0"), Decimal("0")])
+        mes[0] += pyg
+        mes[1] += operado
+
+    return dias + [
+        ContadorLimite(
+            cliente_id=cliente_id, moneda_id=moneda_id, periodo=ContadorLimite.MES,
+            fecha=fecha, monto_pyg=pyg, monto_operado=operado,
+        )
+        for (cliente_id, moneda_id, fecha), (pyg, operado) in meses.items()
+    ]
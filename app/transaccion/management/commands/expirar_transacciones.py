@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from transaccion.services import TAMANO_LOTE_EXPIRACION, expirar_transacciones_pendientes
+
+
+class Command(BaseCommand):
+    help = (
+        'Anula las transacciones pendientes cuyo plazo de pago venció. '
+        'Con --loop queda corriendo y repite el barrido cada --intervalo segundos.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE_EXPIRACION,
+                            help='Transacciones a expirar por transacción de base de datos')
+        parser.add_argument('--loop', action='store_true', help='Repetir el barrido indefinidamente')
+        parser.add_argument('--intervalo', type=float, default=30, help='Segundos entre barridos (con --loop)')
+
+    def handle(self, *args, **options):
+        while True:
+            expiradas = expirar_transacciones_pendientes(tamano_lote=options['lote'])
+            self.stdout.write(self.style.SUCCESS(f'Transacciones expiradas: {expiradas}'))
+            if not options['loop']:
+                return
+            time.sleep(options['intervalo'])
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from transaccion import contadores_limites
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye los contadores de límites (día/mes por cliente y moneda) desde el historial de transacciones.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help='Cantidad de filas por INSERT')
+
+    def handle(self, *args, **options):
+        creados = contadores_limites.reconstruir(tamano_lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(f'Contadores de límites reconstruidos: {creados}'))
@@ -0,0 +1,326 @@
+"""
+Matriz precalculada de cotizaciones.
+
+Materializa, para cada combinación (moneda × segmento × tipo de método de pago ×
+compra/venta), los parámetros de precio ya resueltos y la tasa aplicada que
+resultan de ``PrecioBaseComision``, ``TasaComision`` y ``ComisionMetodoPago``.
+
+Disposición: por cada moneda se guarda una tupla plana de celdas
+(``CeldaPrecio``) de largo ``len(SEGMENTOS) * len(metodos) * len(TIPOS)``; la
+celda de una combinación está en ``(i_segmento * n_metodos + i_metodo) * 2 + i_tipo``.
+Así una cotización es una búsqueda por índice y una multiplicación, sin ORM.
+
+La reconstrucción es incremental: las señales (``transaccion/signals.py``)
+marcan como sucia solo la moneda, el segmento o la tabla de métodos que
+cambió, y en la siguiente lectura se vuelven a leer únicamente esas filas.
+Eso solo alcanza si todos los cambios de precio desde la última lectura se
+hicieron en este proceso: si ``VersionPrecios`` avanzó más que los
+incrementos registrados aquí (``registrar_version_local``), otro proceso
+cambió precios que no están marcados y la matriz se reconstruye entera. Esa
+comparación se hace en cada lectura que recibe la versión vigente (como la
+de ``calcular_transaccion``); las demás lecturas la hacen solo si hay algo
+marcado. Al
+cambiar el día se recalculan los descuentos (la vigencia de ``TasaComision``
+depende de la fecha) y, como la matriz es local a cada proceso, se reconstruye
+entera a los ``CACHE_PRECIOS_TTL_SEGUNDOS`` segundos.
+"""
+import threading
+import time
+from collections import namedtuple
+from datetime import date
+from decimal import Decimal
+
+from django.conf import settings
+
+from clientes.models import Cliente, TasaComision
+from commons.enums import PaymentTypeEnum, TipoTransaccionEnum
+from monedas.models import PrecioBaseComision
+
+SEGMENTOS = tuple(codigo for codigo, _ in Cliente.SEGMENTOS)
+TIPOS = (TipoTransaccionEnum.COMPRA, TipoTransaccionEnum.VENTA)
+
+#: Posición de los tipos de método que no tienen ComisionMetodoPago configurada.
+SIN_COMISION = None
+
+CeldaPrecio = namedtuple(
+    "CeldaPrecio",
+    [
+        "precio_base",
+        "comision",
+        "comision_final",
+        "descuento_pct",
+        "tasa_aplicada",
+        "porcentaje_metodo_pago",  # None = sin comisión configurada para el método
+        "factor_pyg",  # PYG por unidad de moneda, incluida la comisión del método
+    ],
+)
+
+
+def calcular_celda(precio, tipo, descuento_pct, porcentaje_metodo_pago):
+    """
+    Calcula una celda con la misma aritmética que
+    ``transaccion.services._aplicar_parametros_precio``.
+    """
+    precio_base, comision_compra, comision_venta = precio
+    comision = comision_compra if tipo == TipoTransaccionEnum.VENTA else comision_venta
+    comision_final = comision - comision * descuento_pct / Decimal("100")
+    if tipo == TipoTransaccionEnum.VENTA:
+        tasa_aplicada = precio_base - comision_final
+    else:
+        tasa_aplicada = precio_base + comision_final
+
+    factor_pyg = tasa_aplicada
+    if porcentaje_metodo_pago is not None:
+        ajuste = tasa_aplicada * porcentaje_metodo_pago / Decimal("100")
+        factor_pyg = tasa_aplicada - ajuste if tipo == TipoTransaccionEnum.VENTA else tasa_aplicada + ajuste
+
+    return CeldaPrecio(
+        precio_base, comision, comision_final, descuento_pct,
+        tasa_aplicada, porcentaje_metodo_pago, factor_pyg,
+    )
+
+
+class MatrizPrecios:
+    """
+    Matriz de cotizaciones por proceso, con reconstrucción incremental y
+    segura para hilos.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reiniciar()
+
+    def _reiniciar(self):
+        # Datos de origen ya leídos
+        self._precios = {}  # moneda_id -> (precio_base, comision_compra, comision_venta)
+        self._codigos = {}  # moneda_id -> código
+        self._descuentos = {}  # segmento -> porcentaje
+        self._porcentajes_metodo = {}  # tipo_metodo -> porcentaje
+        # Ejes y celdas
+        self._metodos = ()
+        self._celdas = {}  # moneda_id -> tuple[CeldaPrecio]
+        # Estado de la reconstrucción
+        self._completa = False
+        self._monedas_sucias = set()
+        self._segmentos_sucios = set()
+        self._metodos_sucios = False
+        self._fecha = None
+        self._construida_en = 0.0
+        #: VersionPrecios leída antes de la última reconstrucción
+        self.version_precios = None
+        # Incrementos de VersionPrecios hechos en este proceso desde entonces
+        self._versiones_locales = 0
+
+    @staticmethod
+    def _ttl():
+        return getattr(settings, "CACHE_PRECIOS_TTL_SEGUNDOS", 300)
+
+    # -------- Marcado (lo llaman las señales) --------
+    def marcar_moneda(self, moneda_id):
+        with self._lock:
+            self._monedas_sucias.add(moneda_id)
+
+    def marcar_segmento(self, segmento):
+        with self._lock:
+            self._segmentos_sucios.add(segmento)
+
+    def marcar_metodos(self):
+        with self._lock:
+            self._metodos_sucios = True
+
+    def registrar_version_local(self):
+        """Anota que este proceso incrementó ``VersionPrecios`` (lo llama la señal)."""
+        with self._lock:
+            self._versiones_locales += 1
+
+    def invalidar(self):
+        """Descarta toda la matriz; la próxima lectura la reconstruye completa."""
+        with self._lock:
+            self._reiniciar()
+
+    # -------- Reconstrucción --------
+    def _leer_precios(self, moneda_ids=None):
+        qs = PrecioBaseComision.objects.all()
+        if moneda_ids is not None:
+            qs = qs.filter(moneda_id__in=moneda_ids)
+        return {
+            moneda_id: (codigo, (Decimal(str(base)), Decimal(str(compra)), Decimal(str(venta))))
+            for moneda_id, codigo, base, compra, venta in qs.values_list(
+                "moneda_id", "moneda__codigo", "precio_base", "comision_compra", "comision_venta"
+            )
+        }
+
+    def _leer_descuentos(self, segmentos, fecha):
+        vigentes = TasaComision.vigentes_por_tipo(segmentos, fecha=fecha)
+        return {
+            segmento: Decimal(str(vigentes[segmento].porcentaje)) if segmento in vigentes else Decimal("0")
+            for segmento in segmentos
+        }
+
+    def _leer_porcentajes_metodo(self):
+        from payments.models import ComisionMetodoPago
+
+        return {
+            tipo_metodo: Decimal(str(porcentaje))
+            for tipo_metodo, porcentaje in ComisionMetodoPago.objects.values_list(
+                "tipo_metodo", "porcentaje_comision"
+            )
+        }
+
+    def _construir_slab(self, moneda_id):
+        precio = self._precios[moneda_id]
+        return tuple(
+            calcular_celda(precio, tipo, self._descuentos[segmento], self._porcentajes_metodo.get(metodo))
+            for segmento in SEGMENTOS
+            for metodo in self._metodos
+            for tipo in TIPOS
+        )
+
+    def _actualizar(self, version=None):
+        """
+        Relee solo lo marcado como sucio y recalcula las celdas afectadas.
+        Si se recibe ``version`` (ya leída por quien consulta) y no coincide con
+        la de la matriz, se comprueba aunque no haya nada marcado.
+        """
+        from .models import VersionPrecios
+
+        hoy = date.today()
+        if self._completa and time.monotonic() - self._construida_en > self._ttl():
+            self._reiniciar()
+        if self._completa and self._fecha != hoy:
+            self._segmentos_sucios.update(SEGMENTOS)
+        if (
+            self._completa
+            and not (self._monedas_sucias or self._segmentos_sucios or self._metodos_sucios)
+            and (version is None or version == self.version_precios)
+        ):
+            return
+
+        # La versión se lee antes que las filas: si otro proceso cambia un precio
+        # en el medio, la matriz queda con una versión vieja y no al revés.
+        version = VersionPrecios.actual()
+        if self._completa and version - self.version_precios != self._versiones_locales:
+            # Hubo cambios de otro proceso: releer solo lo marcado dejaría celdas viejas
+            self._reiniciar()
+        self.version_precios = version
+        self._versiones_locales = 0
+
+        if not self._completa:
+            leidos = self._leer_precios()
+            self._codigos = {mid: codigo for mid, (codigo, _) in leidos.items()}
+            self._precios = {mid: precio for mid, (_, precio) in leidos.items()}
+            self._descuentos = self._leer_descuentos(SEGMENTOS, hoy)
+            self._porcentajes_metodo = self._leer_porcentajes_metodo()
+            recalcular = set(self._precios)
+            todas = True
+            self._construida_en = time.monotonic()
+        else:
+            recalcular = set()
+            todas = False
+            if self._monedas_sucias:
+                leidos = self._leer_precios(self._monedas_sucias)
+                for moneda_id in self._monedas_sucias:
+                    if moneda_id in leidos:
+                        self._codigos[moneda_id], self._precios[moneda_id] = leidos[moneda_id]
+                        recalcular.add(moneda_id)
+                    else:
+                        self._codigos.pop(moneda_id, None)
+                        self._precios.pop(moneda_id, None)
+                        self._celdas.pop(moneda_id, None)
+            if self._segmentos_sucios:
+                segmentos = [s for s in SEGMENTOS if s in self._segmentos_sucios]
+                self._descuentos.update(self._leer_descuentos(segmentos, hoy))
+                todas = True
+            if self._metodos_sucios:
+                self._porcentajes_metodo = self._leer_porcentajes_metodo()
+                todas = True
+
+        metodos = tuple(m.value for m in PaymentTypeEnum) + tuple(
+            sorted(m for m in self._porcentajes_metodo if m not in {e.value for e in PaymentTypeEnum})
+        ) + (SIN_COMISION,)
+        if metodos != self._metodos:
+            self._metodos = metodos
+            todas = True
+        if todas:
+            recalcular = set(self._precios)
+
+        for moneda_id in recalcular:
+            self._celdas[moneda_id] = self._construir_slab(moneda_id)
+
+        self._monedas_sucias.clear()
+        self._segmentos_sucios.clear()
+        self._metodos_sucios = False
+        self._fecha = hoy
+        self._completa = True
+
+    # -------- Lectura --------
+    def celda(self, moneda_id, segmento, tipo_metodo, tipo):
+        """
+        Devuelve la ``CeldaPrecio`` de la combinación, o ``None`` si la moneda no
+        tiene precio base o el segmento/tipo no son conocidos por la matriz.
+        Un tipo de método sin comisión configurada usa la posición ``SIN_COMISION``.
+        """
+        return self.celda_y_version(moneda_id, segmento, tipo_metodo, tipo)[0]
+
+    def celda_y_version(self, moneda_id, segmento, tipo_metodo, tipo, version_precios=None):
+        """
+        Como ``celda``, pero devuelve también la ``VersionPrecios`` con la que se
+        construyó la matriz: ``(celda, version_precios)``. Si se pasa la versión
+        vigente, la matriz se pone al día con ella antes de responder.
+        """
+        with self._lock:
+            self._actualizar(version_precios)
+            version_precios = self.version_precios
+            slab = self._celdas.get(moneda_id)
+            if slab is None or segmento not in SEGMENTOS or tipo not in TIPOS:
+                return None, version_precios
+            if tipo_metodo not in self._metodos:
+                tipo_metodo = SIN_COMISION
+            n_metodos = len(self._metodos)
+            indice = (
+                (SEGMENTOS.index(segmento) * n_metodos + self._metodos.index(tipo_metodo)) * len(TIPOS)
+                + TIPOS.index(tipo)
+            )
+            return slab[indice], version_precios
+
+    def cotizar(self, moneda_id, segmento, tipo_metodo, tipo, monto_operado):
+        """
+        Monto en PYG (sin redondear a denominaciones) de operar ``monto_operado``
+        en la combinación dada, o ``None`` si la combinación no está en la matriz.
+        """
+        celda = self.celda(moneda_id, segmento, tipo_metodo, tipo)
+        if celda is None:
+            return None
+        return Decimal(monto_operado) * celda.factor_pyg
+
+    def descuentos(self):
+        """Porcentaje de descuento vigente por segmento (MIN, CORP, VIP)."""
+        with self._lock:
+            self._actualizar()
+            return dict(self._descuentos)
+
+    def tasas(self, segmento="MIN", tipo_metodo=SIN_COMISION):
+        """
+        Tasa aplicada de compra y venta de cada moneda para un segmento y método.
+
+        Returns:
+            dict[str, dict]: ``{codigo: {"compra": Decimal, "venta": Decimal}}``,
+            donde ``compra`` es lo que el cliente paga por unidad y ``venta`` lo
+            que recibe.
+        """
+        with self._lock:
+            self._actualizar()
+            ids = list(self._celdas)
+            codigos = dict(self._codigos)
+        resultado = {}
+        for moneda_id in ids:
+            compra = self.celda(moneda_id, segmento, tipo_metodo, TipoTransaccionEnum.COMPRA)
+            venta = self.celda(moneda_id, segmento, tipo_metodo, TipoTransaccionEnum.VENTA)
+            if compra is None or venta is None:
+                continue
+            resultado[codigos[moneda_id]] = {"compra": compra.tasa_aplicada, "venta": venta.tasa_aplicada}
+        return resultado
+
+
+#: Instancia única por proceso.
+matriz_precios = MatrizPrecios()
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transaccion', '0011_populate_transacciones'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionPrecios',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(default=0)),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Versión de precios',
+                'verbose_name_plural': 'Versión de precios',
+            },
+        ),
+        migrations.AddField(
+            model_name='transaccion',
+            name='version_precios',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, null=True, verbose_name='Versión de precios'),
+        ),
+    ]
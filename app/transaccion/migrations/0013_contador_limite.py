@@ -0,0 +1,69 @@
+# Generated by Django 5.2.5 on 2026-10-18 06:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+
+
+def poblar_contadores(apps, schema_editor):
+    """Carga los contadores con el historial (mismo criterio que reconstruir_contadores_limites)."""
+    Transaccion = apps.get_model('transaccion', 'Transaccion')
+    ContadorLimite = apps.get_model('transaccion', 'ContadorLimite')
+
+    por_dia = (
+        Transaccion.objects.filter(estado__in=['pendiente', 'pagada'])
+        .annotate(dia=TruncDate('fecha'))
+        .values('cliente_id', 'moneda_id', 'dia')
+        .annotate(pyg=Sum('monto_pyg'), operado=Sum('monto_operado'))
+        .order_by()
+    )
+    contadores = []
+    meses = {}
+    for fila in por_dia:
+        pyg = fila['pyg'] or 0
+        operado = fila['operado'] or 0
+        contadores.append(ContadorLimite(
+            cliente_id=fila['cliente_id'], moneda_id=fila['moneda_id'], periodo='dia',
+            fecha=fila['dia'], monto_pyg=pyg, monto_operado=operado,
+        ))
+        clave = (fila['cliente_id'], fila['moneda_id'], fila['dia'].replace(day=1))
+        acumulado = meses.setdefault(clave, [0, 0])
+        acumulado[0] += pyg
+        acumulado[1] += operado
+    for (cliente_id, moneda_id, fecha), (pyg, operado) in meses.items():
+        contadores.append(ContadorLimite(
+            cliente_id=cliente_id, moneda_id=moneda_id, periodo='mes',
+            fecha=fecha, monto_pyg=pyg, monto_operado=operado,
+        ))
+    ContadorLimite.objects.bulk_create(contadores, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0009_auto_poblar_clientes'),
+        ('monedas', '0009_auto_poblar_monedas'),
+        ('transaccion', '0012_version_precios'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContadorLimite',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periodo', models.CharField(choices=[('dia', 'Día'), ('mes', 'Mes')], max_length=3)),
+                ('fecha', models.DateField()),
+                ('monto_pyg', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('monto_operado', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('cliente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='contadores_limite', to='clientes.cliente')),
+                ('moneda', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='contadores_limite', to='monedas.moneda')),
+            ],
+            options={
+                'verbose_name': 'Contador de límite',
+                'verbose_name_plural': 'Contadores de límite',
+                'constraints': [models.UniqueConstraint(fields=('cliente', 'moneda', 'periodo', 'fecha'), name='contador_limite_unico')],
+            },
+        ),
+        migrations.RunPython(poblar_contadores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transaccion', '0013_contador_limite'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaccion',
+            index=models.Index(condition=models.Q(('estado', 'pendiente')), fields=['fecha_expiracion'], name='tx_pendiente_expiracion_idx'),
+        ),
+    ]
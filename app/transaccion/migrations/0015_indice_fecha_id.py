@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transaccion', '0014_indice_expiracion_pendientes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaccion',
+            index=models.Index(fields=['fecha', 'id'], name='tx_fecha_id_idx'),
+        ),
+    ]
@@ -95,6 +95,11 @@ class Transaccion(models.Model):
     fecha_expiracion = models.DateTimeField(null=True, blank=True, verbose_name="Fecha de Expiración")
     fecha_pago = models.DateTimeField(null=True, blank=True, verbose_name="Fecha de Pago")
 
+    # Versión de precios (VersionPrecios) con la que se cotizó la transacción
+    version_precios = models.PositiveBigIntegerField(
+        null=True, blank=True, editable=False, verbose_name="Versión de precios"
+    )
+
     class Meta:
         verbose_name = "Transacción"
         verbose_name_plural = "Transacciones"
@@ -103,10 +108,58 @@ class Transaccion(models.Model):
             models.Index(fields=['codigo_verificacion']),
             models.Index(fields=['estado', 'fecha']),
             models.Index(fields=['cliente', 'fecha']),
+            # Paginación por cursor del historial: orden (fecha, id)
+            models.Index(fields=['fecha', 'id'], name='tx_fecha_id_idx'),
+            # Barrido de expiración: solo las pendientes, que son pocas frente al historial.
+            models.Index(
+                fields=['fecha_expiracion'],
+                condition=models.Q(estado='pendiente'),
+                name='tx_pendiente_expiracion_idx',
+            ),
         ]
 
     def __str__(self):
         return f"#{self.id} | {self.codigo_verificacion} | {self.get_tipo_display()} {self.moneda} - {self.cliente}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Recuerda el estado y los montos leídos de la base para que los contadores
+        de límites (ver ``transaccion/contadores_limites.py``) apliquen solo la diferencia.
+        """
+        instance = super().from_db(db, field_names, values)
+        instance._valores_contador = instance.aporte_a_limites()
+        instance._valores_ganancia = instance.valores_ganancia()
+        return instance
+
+    def aporte_a_limites(self):
+        """
+        ``(monto_pyg, monto_operado)`` que la transacción suma a los límites del
+        cliente: solo cuentan las pendientes y pagadas, como en ``validate_limits``.
+        Si algún campo no fue cargado (``only``/``defer``) devuelve None.
+        """
+        from decimal import Decimal
+
+        if {"estado", "monto_pyg", "monto_operado"} & self.get_deferred_fields():
+            return None
+        if self.estado not in (EstadoTransaccionEnum.PENDIENTE, EstadoTransaccionEnum.PAGADA):
+            return (Decimal("0"), Decimal("0"))
+        return (Decimal(str(self.monto_pyg)), Decimal(str(self.monto_operado)))
+
+    #: Campos que determinan el aporte a ``control_ganancias.GananciaDiaria``.
+    CAMPOS_GANANCIA = (
+        "estado", "fecha", "moneda_id", "tipo", "cliente_id", "medio_pago_id",
+        "ganancia", "monto_operado", "monto_pyg",
+    )
+
+    def valores_ganancia(self):
+        """
+        Tupla con los valores de ``CAMPOS_GANANCIA`` (ver
+        ``control_ganancias/ganancia_diaria.py``), o None si alguno no fue cargado.
+        """
+        if set(self.CAMPOS_GANANCIA) & self.get_deferred_fields():
+            return None
+        return tuple(getattr(self, campo) for campo in self.CAMPOS_GANANCIA)
     
 
     def save(self, *args, **kwargs):
@@ -162,6 +215,34 @@ class Transaccion(models.Model):
         """
         from transaccion.services import calcular_transaccion
         from decimal import Decimal
+        from datetime import date
+        from django.utils import timezone
+
+        # Si ningún dato de precios cambió desde la cotización (misma versión y
+        # mismo día, por la vigencia de las tasas de descuento) no hace falta recalcular
+        if (
+            self.version_precios is not None
+            and self.version_precios == VersionPrecios.actual()
+            and timezone.localdate(self.fecha) == date.today()
+        ):
+            monto_pyg = Decimal(str(self.monto_pyg))
+            tasa = Decimal(str(self.tasa_aplicada))
+            return {
+                'ha_cambiado': False,
+                'monto_pyg_original': monto_pyg,
+                'monto_pyg_nuevo': monto_pyg,
+                'tasa_original': tasa,
+                'tasa_nueva': tasa,
+                'diferencia_pyg': Decimal('0'),
+                'diferencia_porcentaje': Decimal('0'),
+                'calculo_completo': {
+                    'tasa_aplicada': tasa,
+                    'comision': self.comision,
+                    'comision_final': self.comision,
+                    'monto_pyg': monto_pyg,
+                    'version_precios': self.version_precios,
+                },
+            }
 
         tipo_metodo_override = None
         # Si es venta, usar el tipo de medio_cobro para el override
@@ -191,6 +272,12 @@ class Transaccion(models.Model):
         # Considerar que hay cambio si la diferencia es mayor a 1 PYG (para evitar diferencias por redondeo)
         ha_cambiado = abs(diferencia_pyg) > Decimal('1')
 
+        # Sin cambio: se actualiza la versión para que la próxima verificación sea directa
+        version_nueva = calculo_nuevo.get('version_precios')
+        if not ha_cambiado and self.pk and version_nueva is not None and version_nueva != self.version_precios:
+            Transaccion.objects.filter(pk=self.pk).update(version_precios=version_nueva)
+            self.version_precios = version_nueva
+
         return {
             'ha_cambiado': ha_cambiado,
             'monto_pyg_original': monto_pyg_original,
@@ -203,6 +290,84 @@ class Transaccion(models.Model):
         }
 
 
+class VersionPrecios(models.Model):
+    """
+    Contador global (una sola fila) que se incrementa cada vez que cambia un
+    dato que interviene en la cotización: precio base y comisiones, tasas de
+    descuento, comisiones por método de pago, métodos de pago, segmento del
+    cliente o medios de cobro (ver ``transaccion/signals.py``).
+
+    Cada transacción guarda la versión con la que se cotizó, de modo que
+    ``Transaccion.verificar_cambio_cotizacion`` solo recalcula cuando la
+    versión actual es distinta.
+    """
+    version = models.PositiveBigIntegerField(default=0)
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Versión de precios"
+        verbose_name_plural = "Versión de precios"
+
+    def __str__(self):
+        return f"Versión de precios {self.version}"
+
+    @classmethod
+    def actual(cls):
+        """Versión vigente (0 si todavía no hubo cambios)."""
+        return cls.objects.filter(pk=1).values_list("version", flat=True).first() or 0
+
+    @classmethod
+    def incrementar(cls):
+        """Incrementa la versión de forma atómica en la base de datos."""
+        from django.utils import timezone
+
+        actualizadas = cls.objects.filter(pk=1).update(
+            version=models.F("version") + 1, actualizado_en=timezone.now()
+        )
+        if not actualizadas:
+            _, creada = cls.objects.get_or_create(pk=1, defaults={"version": 1})
+            if not creada:
+                cls.objects.filter(pk=1).update(
+                    version=models.F("version") + 1, actualizado_en=timezone.now()
+                )
+
+
+class ContadorLimite(models.Model):
+    """
+    Acumulado por cliente y moneda de las transacciones que cuentan para los
+    límites (pendientes y pagadas), por día y por mes.
+
+    Se mantiene con señales sobre ``Transaccion`` en cada cambio de estado o de
+    montos y se puede reconstruir con ``manage.py reconstruir_contadores_limites``.
+    """
+    DIA = "dia"
+    MES = "mes"
+    PERIODO_CHOICES = [
+        (DIA, "Día"),
+        (MES, "Mes"),
+    ]
+
+    cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE, related_name="contadores_limite")
+    moneda = models.ForeignKey(Moneda, on_delete=models.CASCADE, related_name="contadores_limite")
+    periodo = models.CharField(max_length=3, choices=PERIODO_CHOICES)
+    # Día del contador, o primer día del mes si el periodo es mensual
+    fecha = models.DateField()
+    monto_pyg = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    monto_operado = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = "Contador de límite"
+        verbose_name_plural = "Contadores de límite"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["cliente", "moneda", "periodo", "fecha"], name="contador_limite_unico"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.cliente} {self.moneda} {self.get_periodo_display()} {self.fecha}: {self.monto_pyg} PYG"
+
+
 class Movimiento(models.Model):
     transaccion = models.ForeignKey(
         Transaccion, on_delete=models.CASCADE,
@@ -1,14 +1,14 @@
 import logging
 import json
 import os
-from datetime import timedelta
+from datetime import date, timedelta
 from decimal import Decimal, ROUND_DOWN
 
 import stripe
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import transaction as dj_tx
-from django.db.models import Sum
+from django.db.models import Case, F, IntegerField, Q, Sum, Value, When
 from django.urls import reverse
 from django.utils import timezone
 
@@ -17,8 +17,14 @@ from commons.redondeo import redondear_a_denom_py
 
 from clientes.models import LimitePYG, LimiteMoneda, TasaComision
 from monedas.models import TasaCambio, PrecioBaseComision
-from .models import Transaccion, Movimiento
+from .models import Transaccion, Movimiento, VersionPrecios
+from .signals import transacciones_modificadas
+from .cache_precios import cache_precios
+from .matriz_precios import matriz_precios
+from . import contadores_limites
+from tauser.desglose import resolver_desglose
 from tauser.models import ReservaDenominacionTauser, TauserStock, Denominacion, Tauser
+from tauser.signals import stock_modificado
 from commons.enums import EstadoTransaccionEnum, TipoTransaccionEnum, TipoMovimientoEnum
 from pagos.services import PaymentOrchestrator
 from pagos.models import PagoPasarela
@@ -30,112 +36,423 @@ stripe.api_key = settings.STRIPE_SECRET_KEY
 # =========================
 # Cálculo de transacción
 # =========================
-def calcular_transaccion(cliente, tipo, moneda, monto_operado, medio_pago=None, tipo_metodo_override=None):
+def _resolver_tipo_metodo(medio_pago=None, tipo_metodo_override=None, version_precios=None):
     """
-    Calcula tasa, comisión y monto_pyg, sumando comisión por método de pago.
-    
-    Args:
-        cliente: Cliente que realiza la transacción
-        tipo: TipoTransaccionEnum (COMPRA/VENTA)
-        moneda: Moneda operada
-        monto_operado: Monto en la moneda extranjera
-        medio_pago: PaymentMethod o ID (opcional si tipo_metodo_override está definido)
-        tipo_metodo_override: str - Tipo de método para casos especiales como 'efectivo' o 'tarjeta'
-                               que no requieren PaymentMethod guardado
+    Determina el tipo de método de pago (valor de PaymentTypeEnum) a usar para la comisión.
+    Los PaymentMethod recibidos por ID se resuelven a través de la caché de precios,
+    con la versión de precios en la clave (se lee si no se recibe).
     """
-
-    from payments.models import ComisionMetodoPago, PaymentMethod
-
-    # Determinar el tipo de método de pago
-    tipo_metodo = None
-    
+    from payments.models import PaymentMethod
     from commons.enums import PaymentTypeEnum
+
     if tipo_metodo_override:
         # Usar siempre el valor del Enum para mapeo correcto
         if tipo_metodo_override == "transferencia":
-            tipo_metodo = PaymentTypeEnum.CUENTA_BANCARIA.value
+            return PaymentTypeEnum.CUENTA_BANCARIA.value
         elif tipo_metodo_override == "billetera":
-            tipo_metodo = PaymentTypeEnum.BILLETERA.value
+            return PaymentTypeEnum.BILLETERA.value
         elif tipo_metodo_override == "efectivo":
-            tipo_metodo = PaymentTypeEnum.EFECTIVO.value
+            return PaymentTypeEnum.EFECTIVO.value
         elif tipo_metodo_override == "tarjeta":
-            tipo_metodo = PaymentTypeEnum.TARJETA.value
-        else:
-            tipo_metodo = tipo_metodo_override
-    elif medio_pago is not None:
-        payment_method_obj = None
-        if isinstance(medio_pago, (int, str)):
+            return PaymentTypeEnum.TARJETA.value
+        return tipo_metodo_override
+
+    if medio_pago is not None:
+        if hasattr(medio_pago, "payment_type"):
+            return medio_pago.payment_type
+        medio_pago_id = _id_medio_pago(medio_pago)
+        if version_precios is None:
+            version_precios = VersionPrecios.actual()
+
+        def cargar():
             try:
-                payment_method_obj = PaymentMethod.objects.get(pk=medio_pago)
+                return PaymentMethod.objects.values_list("payment_type", flat=True).get(pk=medio_pago_id)
             except PaymentMethod.DoesNotExist:
                 raise ValidationError("El método de pago seleccionado no existe.")
-        else:
-            payment_method_obj = medio_pago
-        tipo_metodo = payment_method_obj.payment_type
+        return cache_precios.obtener(("medio_pago", medio_pago_id, version_precios), cargar)
+
+    return PaymentTypeEnum.EFECTIVO.value
+
+
+def _id_medio_pago(medio_pago):
+    """
+    Convierte a int el ID de un PaymentMethod recibido como int o str.
+    Cualquier otro valor (float, dict, texto no numérico) es un ValidationError.
+    """
+    if isinstance(medio_pago, bool) or not isinstance(medio_pago, (int, str)):
+        raise ValidationError("El método de pago seleccionado no es válido.")
+    try:
+        return int(medio_pago)
+    except ValueError:
+        raise ValidationError("El método de pago seleccionado no es válido.")
+
+
+def _construir_parametros_precio(pb, tipo, tc, porcentaje_metodo_pago):
+    """
+    Arma el dict de parámetros de precio a partir de las filas ya leídas.
+    Lo comparten el cálculo individual y el cálculo por lote.
+    """
+    if tipo == TipoTransaccionEnum.VENTA:
+        comision = pb.comision_compra
+    elif tipo == TipoTransaccionEnum.COMPRA:
+        comision = pb.comision_venta
     else:
-        tipo_metodo = PaymentTypeEnum.EFECTIVO.value
+        raise ValidationError("Tipo de transacción inválido.")
 
-    # 1) Segmento del cliente (fallback 'MIN')
-    segmento = getattr(cliente, "tipo", "MIN").upper()
+    return {
+        "precio_base": Decimal(str(pb.precio_base)),
+        "comision": Decimal(str(comision)),
+        "descuento_pct": Decimal(str(tc.porcentaje)) if tc else Decimal("0"),
+        # None = no hay comisión configurada para el método
+        "porcentaje_metodo_pago": (
+            Decimal(str(porcentaje_metodo_pago)) if porcentaje_metodo_pago is not None else None
+        ),
+    }
+
+
+def _parametros_desde_matriz(moneda, segmento, tipo_metodo, tipo, version_precios=None):
+    """
+    Parámetros de precio tomados de la celda de ``matriz_precios``, o None si
+    la combinación no está materializada.
+    """
+    celda, version_precios = matriz_precios.celda_y_version(
+        getattr(moneda, "pk", moneda), segmento, tipo_metodo, tipo, version_precios
+    )
+    if celda is None:
+        return None
+    return {
+        "precio_base": celda.precio_base,
+        "comision": celda.comision,
+        "descuento_pct": celda.descuento_pct,
+        "porcentaje_metodo_pago": celda.porcentaje_metodo_pago,
+        "version_precios": version_precios,
+    }
+
+
+def _cargar_parametros_precio(moneda, segmento, tipo_metodo, tipo, version_precios=None):
+    """
+    Obtiene los parámetros de precio de una combinación (moneda, segmento,
+    tipo_metodo, tipo). Se leen de la matriz precalculada; si la combinación
+    no está en ella se consultan directamente las tablas.
+    """
+    from payments.models import ComisionMetodoPago
+
+    parametros = _parametros_desde_matriz(moneda, segmento, tipo_metodo, tipo, version_precios)
+    if parametros is not None:
+        return parametros
+
+    # La versión se lee antes que las filas de precios
+    version_precios = VersionPrecios.actual()
 
-    # 2) Obtener precio base y comisiones desde PrecioBaseComision
     try:
         pb = PrecioBaseComision.objects.get(moneda=moneda)
     except PrecioBaseComision.DoesNotExist:
         raise ValidationError(f"No hay precio base/comisiones para la moneda {moneda}.")
 
-    # 3) Descuento por segmento (si existe)
     tc = TasaComision.vigente_para_tipo(segmento)
-    descuento_pct = Decimal(str(tc.porcentaje)) if tc else Decimal("0")
 
-    monto_operado = Decimal(monto_operado)
+    porcentaje_metodo_pago = (
+        ComisionMetodoPago.objects.filter(tipo_metodo=tipo_metodo)
+        .values_list("porcentaje_comision", flat=True)
+        .first()
+    )
+
+    parametros = _construir_parametros_precio(pb, tipo, tc, porcentaje_metodo_pago)
+    parametros["version_precios"] = version_precios
+    return parametros
+
 
+def obtener_parametros_precio(moneda, segmento, tipo_metodo, tipo, version_precios):
+    """
+    Parámetros de precio para la combinación dada, servidos desde la caché.
+
+    ``version_precios`` (``VersionPrecios.actual()``) forma parte de la clave:
+    un cambio de precios hecho en otro proceso, cuya señal no llega a esta
+    caché, hace que la siguiente cotización ya no encuentre la entrada vieja.
+    """
+    moneda_id = getattr(moneda, "pk", moneda)
+    clave = ("precio", moneda_id, segmento, tipo_metodo, str(tipo), date.today(), version_precios)
+    return cache_precios.obtener(
+        clave, lambda: _cargar_parametros_precio(moneda, segmento, tipo_metodo, tipo, version_precios)
+    )
+
+
+def _aplicar_parametros_precio(parametros, tipo, monto_operado):
+    """
+    Aplica los parámetros de precio a un monto. No consulta la base de datos.
+    Es el único lugar donde se calculan tasa, comisiones y monto_pyg.
+    """
+    descuento_pct = parametros["descuento_pct"]
+    precio_base = parametros["precio_base"]
+    comision = parametros["comision"]
+
+    monto_operado = Decimal(monto_operado)
 
+    comision_descuento = comision * descuento_pct / Decimal("100")
+    comision_final = comision - comision_descuento
     if tipo == TipoTransaccionEnum.VENTA:
         # Comisión de compra
-        comision = Decimal(str(pb.comision_compra))
-        comision_descuento = comision * descuento_pct / Decimal("100")
-        comision_final = comision - comision_descuento
-        tasa_aplicada = Decimal(str(pb.precio_base)) - comision_final
-        monto_pyg = monto_operado * tasa_aplicada
+        tasa_aplicada = precio_base - comision_final
     elif tipo == TipoTransaccionEnum.COMPRA:
         # Comisión de venta
-        comision = Decimal(str(pb.comision_venta))
-        comision_descuento = comision * descuento_pct / Decimal("100")
-        comision_final = comision - comision_descuento
-        tasa_aplicada = Decimal(str(pb.precio_base)) + comision_final
-        monto_pyg = monto_operado * tasa_aplicada
+        tasa_aplicada = precio_base + comision_final
     else:
         raise ValidationError("Tipo de transacción inválido.")
+    monto_pyg = monto_operado * tasa_aplicada
 
-    # Comisión por método de pago (obligatorio)
+    # Comisión por método de pago
     comision_metodo_pago = Decimal("0")
     porcentaje_metodo_pago = Decimal("0")
-    try:
-        cmp = ComisionMetodoPago.objects.get(tipo_metodo=tipo_metodo)
-        porcentaje_metodo_pago = Decimal(str(cmp.porcentaje_comision))
+    if parametros["porcentaje_metodo_pago"] is not None:
+        porcentaje_metodo_pago = parametros["porcentaje_metodo_pago"]
         comision_metodo_pago = monto_pyg * porcentaje_metodo_pago / Decimal("100")
         if tipo == TipoTransaccionEnum.VENTA:
             monto_pyg -= comision_metodo_pago
         else:
             monto_pyg += comision_metodo_pago
-    except ComisionMetodoPago.DoesNotExist:
-        pass  # Si no hay comisión configurada, no suma nada
+    # Si no hay comisión configurada, no suma nada
 
     # Redondear monto_pyg a denominación válida de PYG
     monto_pyg_redondeado = redondear_a_denom_py(monto_pyg)
 
     return {
         "descuento_pct": descuento_pct,
-        "precio_base": Decimal(str(pb.precio_base)),
+        "precio_base": precio_base,
         "tasa_aplicada": tasa_aplicada,
         "comision": comision,
         "comision_final": comision_final,
         "monto_pyg": monto_pyg_redondeado,
         "comision_metodo_pago": comision_metodo_pago,
         "porcentaje_metodo_pago": porcentaje_metodo_pago,
+        # VersionPrecios de los parámetros usados (ver Transaccion.version_precios)
+        "version_precios": parametros.get("version_precios"),
+    }
+
+
+def calcular_transaccion(cliente, tipo, moneda, monto_operado, medio_pago=None, tipo_metodo_override=None):
+    """
+    Calcula tasa, comisión y monto_pyg, sumando comisión por método de pago.
+
+    Los parámetros de precio salen de ``cache_precios``: una cotización repetida
+    solo lee la versión de precios (una consulta por clave primaria) mientras
+    ninguna fila de precios cambie.
+    
+    Args:
+        cliente: Cliente que realiza la transacción
+        tipo: TipoTransaccionEnum (COMPRA/VENTA)
+        moneda: Moneda operada
+        monto_operado: Monto en la moneda extranjera
+        medio_pago: PaymentMethod o ID (opcional si tipo_metodo_override está definido)
+        tipo_metodo_override: str - Tipo de método para casos especiales como 'efectivo' o 'tarjeta'
+                               que no requieren PaymentMethod guardado
+    """
+    # La versión de precios valida lo cacheado también frente a cambios de otros procesos
+    version_precios = VersionPrecios.actual()
+
+    # Determinar el tipo de método de pago
+    tipo_metodo = _resolver_tipo_metodo(medio_pago, tipo_metodo_override, version_precios)
+
+    # Segmento del cliente (fallback 'MIN')
+    segmento = getattr(cliente, "tipo", "MIN").upper()
+
+    parametros = obtener_parametros_precio(moneda, segmento, tipo_metodo, tipo, version_precios)
+    return _aplicar_parametros_precio(parametros, tipo, monto_operado)
+
+
+def calcular_transacciones_lote(items):
+    """
+    Cotiza varias operaciones a la vez con un número fijo de consultas.
+
+    Carga una sola vez los PaymentMethod referenciados por ID, los
+    PrecioBaseComision de las monedas, las TasaComision vigentes de los
+    segmentos y las ComisionMetodoPago; luego calcula cada cotización con la
+    misma función que ``calcular_transaccion``, por lo que tasa y redondeo son
+    idénticos.
+
+    Args:
+        items: lista de dicts con las claves de ``calcular_transaccion``:
+            ``cliente``, ``tipo``, ``moneda``, ``monto_operado`` y opcionalmente
+            ``medio_pago`` (PaymentMethod o ID) y ``tipo_metodo_override``.
+
+    Returns:
+        list: un resultado por item, en el mismo orden. Cada resultado es el
+        dict de ``calcular_transaccion`` o ``{"error": mensaje}`` si ese item
+        no pudo cotizarse (el resto del lote se calcula igual).
+    """
+    from payments.models import ComisionMetodoPago, PaymentMethod
+
+    items = list(items)
+
+    # 0) Versión de precios, leída antes que las filas de precios
+    version_precios = VersionPrecios.actual()
+
+    # 1) Métodos de pago referenciados por ID (una consulta); los IDs inválidos
+    #    quedan como ValidationError de su item
+    ids_por_item = []
+    for item in items:
+        medio_pago = item.get("medio_pago")
+        if item.get("tipo_metodo_override") or medio_pago is None or hasattr(medio_pago, "payment_type"):
+            ids_por_item.append(None)
+            continue
+        try:
+            ids_por_item.append(_id_medio_pago(medio_pago))
+        except ValidationError as e:
+            ids_por_item.append(e)
+    ids_medio_pago = {i for i in ids_por_item if isinstance(i, int)}
+    tipos_por_medio_pago = {}
+    if ids_medio_pago:
+        tipos_por_medio_pago = dict(
+            PaymentMethod.objects.filter(pk__in=ids_medio_pago).values_list("pk", "payment_type")
+        )
+
+    # 2) Resolver la clave de precio de cada item (sin consultas)
+    claves = []
+    for item, medio_pago_id in zip(items, ids_por_item):
+        try:
+            if isinstance(medio_pago_id, ValidationError):
+                raise medio_pago_id
+            if medio_pago_id is not None:
+                if medio_pago_id not in tipos_por_medio_pago:
+                    raise ValidationError("El método de pago seleccionado no existe.")
+                tipo_metodo = tipos_por_medio_pago[medio_pago_id]
+            else:
+                tipo_metodo = _resolver_tipo_metodo(medio_pago, item.get("tipo_metodo_override"))
+            segmento = getattr(item["cliente"], "tipo", "MIN").upper()
+            claves.append((item["moneda"], segmento, tipo_metodo))
+        except ValidationError as e:
+            claves.append(e)
+
+    validas = [c for c in claves if not isinstance(c, ValidationError)]
+
+    # 3) Filas de precios (una consulta por tabla)
+    precios = {
+        pb.moneda_id: pb
+        for pb in PrecioBaseComision.objects.filter(moneda__in={c[0].pk for c in validas})
+    }
+    descuentos = TasaComision.vigentes_por_tipo({c[1] for c in validas})
+    comisiones_metodo = dict(
+        ComisionMetodoPago.objects.filter(tipo_metodo__in={c[2] for c in validas})
+        .values_list("tipo_metodo", "porcentaje_comision")
+    )
+
+    # 4) Calcular en una pasada, respetando el orden de entrada
+    resultados = []
+    for item, clave in zip(items, claves):
+        try:
+            if isinstance(clave, ValidationError):
+                raise clave
+            moneda, segmento, tipo_metodo = clave
+            tipo = item["tipo"]
+            pb = precios.get(moneda.pk)
+            if pb is None:
+                raise ValidationError(f"No hay precio base/comisiones para la moneda {moneda}.")
+            parametros = _construir_parametros_precio(
+                pb, tipo, descuentos.get(segmento), comisiones_metodo.get(tipo_metodo)
+            )
+            parametros["version_precios"] = version_precios
+            resultados.append(_aplicar_parametros_precio(parametros, tipo, item["monto_operado"]))
+        except ValidationError as e:
+            resultados.append({"error": " ".join(e.messages)})
+    return resultados
+
+# =========================
+# Cotización garantizada
+# =========================
+COTIZACION_SALT = "transaccion.cotizacion_garantizada"
+
+#: Campos de calcular_transaccion que se guardan en el token (todos Decimal salvo la versión).
+_CAMPOS_COTIZACION = (
+    "descuento_pct", "precio_base", "tasa_aplicada", "comision", "comision_final",
+    "monto_pyg", "comision_metodo_pago", "porcentaje_metodo_pago",
+)
+
+
+def _cotizacion_ttl():
+    return getattr(settings, "COTIZACION_GARANTIZADA_SEGUNDOS", 120)
+
+
+def _datos_vinculo_cotizacion(cliente, tipo, moneda, monto_operado, tipo_metodo):
+    """Datos de la operación a los que queda atado el token."""
+    return {
+        "cliente": getattr(cliente, "pk", cliente),
+        "moneda": getattr(moneda, "pk", moneda),
+        "tipo": str(tipo),
+        "monto_operado": str(Decimal(str(monto_operado)).normalize()),
+        "tipo_metodo": tipo_metodo,
     }
 
+
+def cotizar_con_garantia(cliente, tipo, moneda, monto_operado, medio_pago=None, tipo_metodo_override=None):
+    """
+    Igual que ``calcular_transaccion`` pero agrega un token firmado que garantiza
+    las cifras durante ``COTIZACION_GARANTIZADA_SEGUNDOS``.
+
+    El token no se guarda en la base: es la cotización misma firmada con
+    ``SECRET_KEY`` (``django.core.signing``), atada al cliente, moneda, tipo,
+    monto y método de pago.
+
+    Returns:
+        dict: el resultado de ``calcular_transaccion`` más ``cotizacion_token``
+        y ``cotizacion_expira`` (datetime).
+    """
+    from django.core import signing
+
+    tipo_metodo = _resolver_tipo_metodo(medio_pago, tipo_metodo_override)
+    calculo = calcular_transaccion(cliente, tipo, moneda, monto_operado, medio_pago, tipo_metodo_override)
+
+    datos = _datos_vinculo_cotizacion(cliente, tipo, moneda, monto_operado, tipo_metodo)
+    datos.update({campo: str(calculo[campo]) for campo in _CAMPOS_COTIZACION if campo in calculo})
+    datos["version_precios"] = calculo.get("version_precios")
+
+    calculo = dict(calculo)
+    calculo["cotizacion_token"] = signing.dumps(datos, salt=COTIZACION_SALT, compress=True)
+    calculo["cotizacion_expira"] = timezone.now() + timedelta(seconds=_cotizacion_ttl())
+    return calculo
+
+
+def usar_cotizacion_garantizada(token, cliente, tipo, moneda, monto_operado, medio_pago=None, tipo_metodo_override=None):
+    """
+    Valida un token de ``cotizar_con_garantia`` y devuelve las cifras guardadas,
+    con las mismas claves que ``calcular_transaccion``. No recalcula nada.
+
+    Raises:
+        ValidationError: si el token es inválido, venció o corresponde a otra operación.
+    """
+    from django.core import signing
+
+    try:
+        datos = signing.loads(token, salt=COTIZACION_SALT, max_age=_cotizacion_ttl())
+    except signing.SignatureExpired:
+        raise ValidationError("La cotización garantizada expiró. Vuelva a cotizar la operación.")
+    except signing.BadSignature:
+        raise ValidationError("La cotización garantizada no es válida.")
+
+    tipo_metodo = _resolver_tipo_metodo(medio_pago, tipo_metodo_override)
+    esperado = _datos_vinculo_cotizacion(cliente, tipo, moneda, monto_operado, tipo_metodo)
+    if any(datos.get(clave) != valor for clave, valor in esperado.items()):
+        raise ValidationError("La cotización garantizada no corresponde a esta operación.")
+
+    calculo = {campo: Decimal(datos[campo]) for campo in _CAMPOS_COTIZACION if campo in datos}
+    calculo["version_precios"] = datos.get("version_precios")
+    return calculo
+
+
+def calcular_con_cotizacion(token, cliente, tipo, moneda, monto_operado, medio_pago=None, tipo_metodo_override=None):
+    """
+    Cifras del token de ``cotizar_con_garantia`` si sigue vigente y corresponde
+    a la operación; si no hay token, venció o no coincide con lo enviado, las
+    de ``calcular_transaccion`` con los precios actuales.
+    """
+    if token:
+        try:
+            return usar_cotizacion_garantizada(
+                token, cliente, tipo, moneda, monto_operado, medio_pago, tipo_metodo_override
+            )
+        except ValidationError as e:
+            logger.info("Cotización garantizada descartada, se recalcula: %s", "; ".join(e.messages))
+    return calcular_transaccion(cliente, tipo, moneda, monto_operado, medio_pago, tipo_metodo_override)
+
+
 #creo que esta funcion ya no se usa mas
 def obtener_datos_transaccion(transaccion_id):
     try:
@@ -202,21 +519,11 @@ def _check_limit_pyg(cliente, monto_pyg):
         )
 
 
-def _sum_operado_en_periodo(cliente, moneda, desde):
-    """Suma en MONEDA extranjera (no PYG) desde fecha dada."""
-    return (
-        Transaccion.objects.filter(
-            cliente=cliente,
-            moneda=moneda,  # <- FIX: antes usaba 'moneda_operada' (no existe en tu modelo)
-            fecha__gte=desde,
-            estado__in=[EstadoTransaccionEnum.PENDIENTE, EstadoTransaccionEnum.PAGADA],
-        ).aggregate(total=Sum("monto_operado"))["total"]
-        or 0
-    )
-
-
-def _check_limit_moneda(cliente, moneda, monto_operado):
-    """Límites en la moneda extranjera (por operación y acumulados)."""
+def _check_limit_moneda(cliente, moneda, monto_operado, total_mes=None):
+    """
+    Límites en la moneda extranjera (por operación y acumulados).
+    ``total_mes`` es lo ya operado en el mes en esa moneda (contador mensual).
+    """
     try:
         lim = LimiteMoneda.objects.get(cliente=cliente, moneda=moneda)
     except LimiteMoneda.DoesNotExist:
@@ -228,9 +535,9 @@ def _check_limit_moneda(cliente, moneda, monto_operado):
         )
 
     if lim.max_mensual:
-        now = timezone.now().astimezone(timezone.get_current_timezone())
-        inicio_mes = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        total_mes = _sum_operado_en_periodo(cliente, moneda, inicio_mes)
+        if total_mes is None:
+            with dj_tx.atomic():
+                total_mes = contadores_limites.contadores_bloqueados(cliente, moneda)[1].monto_operado
         if total_mes + monto_operado > lim.max_mensual:
             raise ValidationError(
                 f"Límite mensual en {moneda} excedido: mes {total_mes} + {monto_operado} > {lim.max_mensual}."
@@ -243,68 +550,74 @@ def validate_limits(cliente, moneda_operada, monto_operado, monto_pyg):
       1) Límite PYG por operación
       2) Límite por moneda extranjera (operación + mensual)
       3) Límites diarios/mensuales en PYG por tipo de cliente (CLIENT_LIMITS)
+
+    Los acumulados del día y del mes salen de ``ContadorLimite`` y se leen con
+    bloqueo de fila: si se llama dentro de la transacción que crea la operación
+    (como hace ``crear_transaccion``), dos altas simultáneas del mismo cliente y
+    moneda no pueden pasar ambas el límite.
     """
-    _check_limit_pyg(cliente, monto_pyg)
-    _check_limit_moneda(cliente, moneda_operada, monto_operado)
+    with dj_tx.atomic():
+        contador_dia, contador_mes = contadores_limites.contadores_bloqueados(cliente, moneda_operada)
 
-    # límites por tipo de cliente (solo tabla LimiteClienteTipo)
-    from clientes.models import LimiteClienteTipo
-    tipo_map = {"MIN": "minorista", "CORP": "corporativo", "VIP": "vip"}
-    tipo_cliente = tipo_map.get(getattr(cliente, "tipo", "MIN"), "minorista")
-    try:
-        limites_obj = LimiteClienteTipo.objects.get(tipo_cliente=tipo_cliente)
-        limite_diario = Decimal(limites_obj.limite_diario)
-        limite_mensual = Decimal(limites_obj.limite_mensual)
-    except LimiteClienteTipo.DoesNotExist:
-        raise ValidationError("No hay límites configurados para el tipo de cliente: %s" % tipo_cliente)
-
-    hoy = timezone.now().date()
-    inicio_mes = hoy.replace(day=1)
-    estados_validos = [EstadoTransaccionEnum.PENDIENTE, EstadoTransaccionEnum.PAGADA]
-
-    total_diario = (
-        Transaccion.objects.filter(
-            cliente=cliente,
-            moneda=moneda_operada,
-            fecha__date=hoy,
-            estado__in=estados_validos,
-        ).aggregate(total=Sum("monto_pyg"))["total"]
-        or 0
-    )
-    total_mensual = (
-        Transaccion.objects.filter(
-            cliente=cliente,
-            moneda=moneda_operada,
-            fecha__date__gte=inicio_mes,
-            fecha__date__lte=hoy,
-            estado__in=estados_validos,
-        ).aggregate(total=Sum("monto_pyg"))["total"]
-        or 0
-    )
+        _check_limit_pyg(cliente, monto_pyg)
+        _check_limit_moneda(cliente, moneda_operada, monto_operado, total_mes=contador_mes.monto_operado)
 
-    total_diario = Decimal(total_diario)
-    total_mensual = Decimal(total_mensual)
-    monto_pyg = Decimal(monto_pyg)
+        # límites por tipo de cliente (solo tabla LimiteClienteTipo)
+        from clientes.models import LimiteClienteTipo
+        tipo_map = {"MIN": "minorista", "CORP": "corporativo", "VIP": "vip"}
+        tipo_cliente = tipo_map.get(getattr(cliente, "tipo", "MIN"), "minorista")
+        try:
+            limites_obj = LimiteClienteTipo.objects.get(tipo_cliente=tipo_cliente)
+            limite_diario = Decimal(limites_obj.limite_diario)
+            limite_mensual = Decimal(limites_obj.limite_mensual)
+        except LimiteClienteTipo.DoesNotExist:
+            raise ValidationError("No hay límites configurados para el tipo de cliente: %s" % tipo_cliente)
 
-    if total_diario + monto_pyg > limite_diario:
-        raise ValidationError(
-            f"Límite diario alcanzado | total_diario: {total_diario} + monto_pyg: {monto_pyg} > limite_diario: {limite_diario}"
-        )
-    if total_mensual + monto_pyg > limite_mensual:
-        raise ValidationError(
-            f"Límite mensual alcanzado | total_mensual: {total_mensual} + monto_pyg: {monto_pyg} > limite_mensual: {limite_mensual}"
-        )
+        total_diario = Decimal(contador_dia.monto_pyg)
+        total_mensual = Decimal(contador_mes.monto_pyg)
+        monto_pyg = Decimal(monto_pyg)
+
+        if total_diario + monto_pyg > limite_diario:
+            raise ValidationError(
+                f"Límite diario alcanzado | total_diario: {total_diario} + monto_pyg: {monto_pyg} > limite_diario: {limite_diario}"
+            )
+        if total_mensual + monto_pyg > limite_mensual:
+            raise ValidationError(
+                f"Límite mensual alcanzado | total_mensual: {total_mensual} + monto_pyg: {monto_pyg} > limite_mensual: {limite_mensual}"
+            )
 
 
 def crear_transaccion(
-    cliente, tipo, moneda, monto_operado, tasa_aplicada, comision, monto_pyg, medio_pago=None, tauser=None, medio_cobro=None
+    cliente, tipo, moneda, monto_operado, tasa_aplicada=None, comision=None, monto_pyg=None, medio_pago=None, tauser=None,
+    medio_cobro=None, version_precios=None, cotizacion_token=None,
 ):
     """
     Crea la transacción en estado PENDIENTE (sin movimientos aún).
     Si es en efectivo y tiene tauser, descuenta stock y crea reservas.
+    ``version_precios`` es la que devolvió ``calcular_transaccion`` para esta cotización.
+
+    Si se pasa ``cotizacion_token`` (ver ``cotizar_con_garantia``), tasa, comisión,
+    monto_pyg y versión se toman del token y se ignoran los valores recibidos.
     """
-    validate_limits(cliente, moneda, monto_operado, monto_pyg)
+    if cotizacion_token:
+        # Mismo criterio que Transaccion.verificar_cambio_cotizacion para el método
+        tipo_metodo_override = None
+        if str(tipo).lower() == TipoTransaccionEnum.VENTA and medio_cobro:
+            tipo_metodo_override = medio_cobro.tipo_medio
+        cotizacion = usar_cotizacion_garantizada(
+            cotizacion_token, cliente, tipo, moneda, monto_operado, medio_pago, tipo_metodo_override
+        )
+        tasa_aplicada = cotizacion["tasa_aplicada"]
+        comision = cotizacion["comision_final"]
+        monto_pyg = cotizacion["monto_pyg"]
+        version_precios = cotizacion["version_precios"]
+    elif tasa_aplicada is None or comision is None or monto_pyg is None:
+        raise ValidationError("Faltan tasa, comisión o monto en PYG para crear la transacción.")
+
     with dj_tx.atomic():
+        # Dentro de la transacción: los contadores quedan bloqueados hasta el alta
+        validate_limits(cliente, moneda, monto_operado, monto_pyg)
+
         fecha_expiracion = None
         expiracion_min = getattr(settings, "TRANSACCION_EXPIRACION_MINUTOS", 0)
         if expiracion_min:
@@ -323,6 +636,7 @@ def crear_transaccion(
             medio_cobro=medio_cobro,
             estado=EstadoTransaccionEnum.PENDIENTE,
             fecha_expiracion=fecha_expiracion,
+            version_precios=version_precios,
         )
         # En compra: siempre reservar moneda internacional
         # En venta: solo reservar PYG si el medio de cobro es efectivo
@@ -344,61 +658,125 @@ def crear_transaccion(
 
 # --- Lógica de reserva de stock ---
 from decimal import Decimal
-def reservar_stock_tauser_para_transaccion(tauser, transaccion, monto, moneda):
+def reservar_stock_tauser_para_transaccion(tauser, transaccion, monto, moneda, objetivo=None):
     """
     Descuenta del stock del tauser las denominaciones necesarias y crea reservas para la transacción.
+
+    Todo ocurre en una transacción y en pocas sentencias:
+
+    1. se bloquean con ``select_for_update`` todas las filas de ``TauserStock``
+       del tauser para la moneda, en orden de id (dos reservas concurrentes
+       sobre el mismo tauser se serializan sin riesgo de deadlock);
+    2. ``tauser.desglose.resolver_desglose`` calcula el desglose exacto sobre
+       las cantidades bloqueadas;
+    3. un único ``UPDATE`` descuenta las cantidades con ``F()`` y las reservas
+       se crean con ``bulk_create``.
     """
-    # Obtener denominaciones ordenadas de mayor a menor
-    denominaciones = Denominacion.objects.filter(moneda=moneda).order_by('-value')
-    monto_restante = Decimal(monto)
-    from tauser.models import TauserStockMovimiento
-    for denom in denominaciones:
-        try:
-            stock = TauserStock.objects.get(tauser=tauser, denominacion=denom)
-        except TauserStock.DoesNotExist:
-            continue
-        if stock.quantity <= 0:
-            continue
-        max_billetes = int(monto_restante // denom.value)
-        usar = min(max_billetes, stock.quantity)
-        if usar > 0:
-            # Descontar del stock (reserva lógica, no movimiento definitivo)
-            stock.quantity -= usar
-            stock.save(update_fields=['quantity'])
-            # Crear reserva
-            ReservaDenominacionTauser.objects.create(
+    with dj_tx.atomic():
+        filas = list(
+            TauserStock.objects.select_for_update(of=("self",))
+            .filter(tauser=tauser, denominacion__moneda=moneda)
+            .order_by("id")
+            .values_list("id", "denominacion_id", "denominacion__value", "quantity")
+        )
+        disponibles = [((stock_id, denominacion_id), valor, cantidad) for stock_id, denominacion_id, valor, cantidad in filas]
+        desglose = resolver_desglose(monto, disponibles, objetivo)
+        if desglose is None:
+            raise ValidationError(f"Stock insuficiente para reservar denominaciones para el monto {monto} {moneda}.")
+        if not desglose:
+            return []
+
+        # Descontar del stock (reserva lógica, no movimiento definitivo)
+        TauserStock.objects.filter(id__in=[stock_id for (stock_id, _), _, _ in desglose]).update(
+            quantity=F("quantity") - Case(
+                *(When(id=stock_id, then=Value(usar)) for (stock_id, _), _, usar in desglose),
+                output_field=IntegerField(),
+            )
+        )
+        stock_modificado.send(sender=TauserStock, tauser_ids=[tauser.pk])
+        # El movimiento de stock se registra al completar la transacción
+        return ReservaDenominacionTauser.objects.bulk_create([
+            ReservaDenominacionTauser(
                 tauser=tauser,
                 transaccion=transaccion,
-                denominacion=denom,
-                cantidad=usar
+                denominacion_id=denominacion_id,
+                cantidad=usar,
             )
-            # NO crear movimiento de stock aquí, solo al completar la transacción
-            monto_restante -= denom.value * usar
-        if monto_restante <= 0:
-            break
-    if monto_restante > 0:
-        raise ValidationError(f"Stock insuficiente para reservar denominaciones para el monto {monto} {moneda}.")
+            for (_, denominacion_id), _, usar in desglose
+        ])
 
 
 def _liberar_reservas_tauser(transaccion: Transaccion):
     """Devuelve al stock del tauser las reservas asociadas a la transacción."""
     if not getattr(transaccion, "tauser_id", None):
         return
+    liberar_reservas_tauser_lote([transaccion.pk])
 
-    from tauser.models import ReservaDenominacionTauser, TauserStock
 
-    reservas = ReservaDenominacionTauser.objects.filter(transaccion=transaccion)
-    if not reservas.exists():
-        return
+def liberar_reservas_tauser_lote(transaccion_ids) -> int:
+    """
+    Devuelve al stock las reservas de varias transacciones a la vez.
+
+    Las reservas se bloquean antes de sumarlas: si dos procesos liberan la
+    misma transacción, el segundo espera al primero y ya no las encuentra, así
+    que nada vuelve dos veces al stock. Las cantidades se suman por (tauser,
+    denominación), las filas de ``TauserStock`` afectadas se bloquean en orden
+    de id y se actualizan con un único ``UPDATE`` (las que no existan se crean
+    antes en cero con ``bulk_create``); las reservas se borran con un solo
+    ``DELETE``.
 
-    for reserva in reservas:
-        stock, _ = TauserStock.objects.get_or_create(
-            tauser=reserva.tauser,
-            denominacion=reserva.denominacion,
+    Returns:
+        int: cantidad de piezas devueltas al stock.
+    """
+    with dj_tx.atomic():
+        devolver = {}
+        reserva_ids = []
+        for reserva_id, tauser_id, denominacion_id, cantidad in (
+            ReservaDenominacionTauser.objects.select_for_update()
+            .filter(transaccion_id__in=list(transaccion_ids))
+            .order_by("id")
+            .values_list("id", "tauser_id", "denominacion_id", "cantidad")
+        ):
+            reserva_ids.append(reserva_id)
+            devolver[(tauser_id, denominacion_id)] = devolver.get((tauser_id, denominacion_id), 0) + cantidad
+        if not devolver:
+            return 0
+
+        pares = Q()
+        for tauser_id, denominacion_id in devolver:
+            pares |= Q(tauser_id=tauser_id, denominacion_id=denominacion_id)
+
+        def bloquear_stock():
+            return {
+                (tauser_id, denominacion_id): stock_id
+                for stock_id, tauser_id, denominacion_id in TauserStock.objects.select_for_update()
+                .filter(pares)
+                .order_by("id")
+                .values_list("id", "tauser_id", "denominacion_id")
+            }
+
+        existentes = bloquear_stock()
+        if len(existentes) < len(devolver):
+            # Otro proceso puede crear la misma fila en el medio: se crean en cero
+            # ignorando conflictos y la suma la hace el UPDATE de abajo
+            TauserStock.objects.bulk_create(
+                [
+                    TauserStock(tauser_id=tauser_id, denominacion_id=denominacion_id, quantity=0)
+                    for tauser_id, denominacion_id in devolver
+                    if (tauser_id, denominacion_id) not in existentes
+                ],
+                ignore_conflicts=True,
+            )
+            existentes = bloquear_stock()
+        TauserStock.objects.filter(id__in=existentes.values()).update(
+            quantity=F("quantity") + Case(
+                *(When(id=stock_id, then=Value(devolver[par])) for par, stock_id in existentes.items()),
+                output_field=IntegerField(),
+            )
         )
-        stock.quantity += reserva.cantidad
-        stock.save(update_fields=["quantity"])
-    reservas.delete()
+        ReservaDenominacionTauser.objects.filter(id__in=reserva_ids).delete()
+        stock_modificado.send(sender=TauserStock, tauser_ids={tauser_id for tauser_id, _ in devolver})
+    return sum(devolver.values())
 
 
 # =========================
@@ -605,6 +983,61 @@ def cancelar_transaccion(transaccion: Transaccion):
     return transaccion
 
 
+def _cerrar_pendientes_lote(transaccion_ids, estado_final) -> list:
+    """
+    Pasa a ``estado_final`` las transacciones de ``transaccion_ids`` que sigan
+    pendientes, liberando sus reservas del tauser en bloque.
+
+    Las filas se bloquean en orden de id; el cambio de estado es un único
+    ``UPDATE`` y, como no pasa por ``save()``, los contadores de límites se
+    descuentan aquí mismo (``contadores_limites.descontar_lote``).
+
+    Returns:
+        list[int]: ids de las transacciones cerradas.
+    """
+    with dj_tx.atomic():
+        filas = list(
+            Transaccion.objects.select_for_update()
+            .filter(id__in=list(transaccion_ids), estado=EstadoTransaccionEnum.PENDIENTE)
+            .order_by("id")
+            .values("id", "tauser_id", "cliente_id", "moneda_id", "fecha", "monto_pyg", "monto_operado")
+        )
+        if not filas:
+            return []
+        ids = [f["id"] for f in filas]
+        liberar_reservas_tauser_lote([f["id"] for f in filas if f["tauser_id"]])
+        Transaccion.objects.filter(id__in=ids).update(estado=estado_final)
+        contadores_limites.descontar_lote(filas)
+        transacciones_modificadas.send(sender=Transaccion, transaccion_ids=ids)
+    return ids
+
+
+def cancelar_transacciones(transacciones) -> int:
+    """
+    Variante en lote de ``cancelar_transaccion``: cancela las que sigan
+    pendientes (las demás se ignoran) y devuelve cuántas se cancelaron.
+    """
+    ids = _cerrar_pendientes_lote([t.pk for t in transacciones], EstadoTransaccionEnum.CANCELADA)
+    _marcar_cerradas(transacciones, ids, EstadoTransaccionEnum.CANCELADA)
+    return len(ids)
+
+
+def expirar_transacciones(transacciones) -> int:
+    """Variante en lote de ``expirar_transaccion``; devuelve cuántas se anularon."""
+    ids = _cerrar_pendientes_lote([t.pk for t in transacciones], EstadoTransaccionEnum.ANULADA)
+    _marcar_cerradas(transacciones, ids, EstadoTransaccionEnum.ANULADA)
+    return len(ids)
+
+
+def _marcar_cerradas(transacciones, ids, estado):
+    """Refleja en las instancias en memoria el estado aplicado con ``update()``."""
+    cerradas = set(ids)
+    for transaccion in transacciones:
+        if transaccion.pk in cerradas:
+            transaccion.estado = estado
+            transaccion._valores_contador = transaccion.aporte_a_limites()
+
+
 def expirar_transaccion(transaccion: Transaccion) -> bool:
     """Marca una transacción como anulada por expiración si sigue pendiente."""
     if transaccion.estado != EstadoTransaccionEnum.PENDIENTE:
@@ -616,27 +1049,51 @@ def expirar_transaccion(transaccion: Transaccion) -> bool:
     return True
 
 
-def expirar_transacciones_pendientes(base_queryset=None) -> int:
-    """Expira las transacciones pendientes cuyo plazo venció."""
+#: Transacciones que se expiran por transacción de base de datos en el barrido.
+TAMANO_LOTE_EXPIRACION = 200
+
+
+def expirar_lote_pendientes(base_queryset=None, tamano_lote=TAMANO_LOTE_EXPIRACION, ahora=None) -> int:
+    """
+    Expira un lote de hasta ``tamano_lote`` transacciones pendientes vencidas.
+
+    Las filas se toman con ``SELECT ... FOR UPDATE SKIP LOCKED``: las que otro
+    proceso (otro barrido o una confirmación en curso) tiene bloqueadas se
+    saltean y quedan para el próximo lote, así varios barridos no se bloquean
+    entre sí. La consulta usa el índice parcial ``tx_pendiente_expiracion_idx``.
+
+    Returns:
+        int: cantidad de transacciones expiradas en este lote.
+    """
     qs = base_queryset if base_queryset is not None else Transaccion.objects.all()
-    ahora = timezone.now()
-    expiradas = 0
+    ahora = ahora or timezone.now()
 
     with dj_tx.atomic():
-        pendientes = (
+        lote = list(
             qs.filter(
                 estado=EstadoTransaccionEnum.PENDIENTE,
                 fecha_expiracion__isnull=False,
                 fecha_expiracion__lte=ahora,
             )
-            .select_for_update()
+            .order_by("fecha_expiracion", "id")
+            .select_for_update(skip_locked=True)
+            .values_list("id", flat=True)[:tamano_lote]
         )
+        return len(_cerrar_pendientes_lote(lote, EstadoTransaccionEnum.ANULADA))
 
-        for transaccion in pendientes:
-            if expirar_transaccion(transaccion):
-                expiradas += 1
 
-    return expiradas
+def expirar_transacciones_pendientes(base_queryset=None, tamano_lote=TAMANO_LOTE_EXPIRACION) -> int:
+    """
+    Expira todas las transacciones pendientes cuyo plazo venció, de a lotes
+    (ver ``expirar_lote_pendientes``). Lo usa el comando ``expirar_transacciones``.
+    """
+    ahora = timezone.now()
+    total = 0
+    while True:
+        expiradas = expirar_lote_pendientes(base_queryset, tamano_lote=tamano_lote, ahora=ahora)
+        total += expiradas
+        if expiradas < tamano_lote:
+            return total
 
 
 # =========================
@@ -0,0 +1,125 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from clientes.models import Cliente, TasaComision
+from medios_acreditacion.models import MedioAcreditacion
+from monedas.models import PrecioBaseComision, TasaCambio
+from payments.models import ComisionMetodoPago, PaymentMethod
+from .cache_precios import cache_precios
+from .matriz_precios import matriz_precios
+from . import contadores_limites
+from .models import Transaccion, VersionPrecios
+
+#: Lo envían las escrituras en bloque de transacciones (``update()``, que no
+#: dispara ``post_save``) con ``transaccion_ids``: las transacciones afectadas.
+transacciones_modificadas = Signal()
+
+MODELOS_DE_PRECIO = (PrecioBaseComision, TasaComision, ComisionMetodoPago, PaymentMethod, TasaCambio)
+
+
+def invalidar_cache_precios(sender, **kwargs):
+    """
+    Vacía la caché de precios cuando cambia un dato que interviene en el cálculo.
+    Se invalida de inmediato y otra vez al confirmar la transacción de BD, para que
+    ninguna lectura hecha antes del commit quede guardada con datos viejos.
+    """
+    cache_precios.invalidar()
+    transaction.on_commit(cache_precios.invalidar)
+
+
+for _modelo in MODELOS_DE_PRECIO:
+    receiver(post_save, sender=_modelo, dispatch_uid=f"cache_precios_save_{_modelo.__name__}")(invalidar_cache_precios)
+    receiver(post_delete, sender=_modelo, dispatch_uid=f"cache_precios_delete_{_modelo.__name__}")(invalidar_cache_precios)
+
+
+# -------- Matriz de cotizaciones: solo se marca lo que cambió --------
+def _marcar_en_commit(marcar, *args):
+    marcar(*args)
+    transaction.on_commit(lambda: marcar(*args))
+
+
+@receiver(post_save, sender=PrecioBaseComision, dispatch_uid="matriz_precios_save_PrecioBaseComision")
+@receiver(post_delete, sender=PrecioBaseComision, dispatch_uid="matriz_precios_delete_PrecioBaseComision")
+def marcar_moneda_en_matriz(sender, instance, **kwargs):
+    _marcar_en_commit(matriz_precios.marcar_moneda, instance.moneda_id)
+
+
+@receiver(post_save, sender=TasaComision, dispatch_uid="matriz_precios_save_TasaComision")
+@receiver(post_delete, sender=TasaComision, dispatch_uid="matriz_precios_delete_TasaComision")
+def marcar_segmento_en_matriz(sender, instance, **kwargs):
+    _marcar_en_commit(matriz_precios.marcar_segmento, instance.tipo_cliente)
+
+
+@receiver(post_save, sender=ComisionMetodoPago, dispatch_uid="matriz_precios_save_ComisionMetodoPago")
+@receiver(post_delete, sender=ComisionMetodoPago, dispatch_uid="matriz_precios_delete_ComisionMetodoPago")
+def marcar_metodos_en_matriz(sender, **kwargs):
+    _marcar_en_commit(matriz_precios.marcar_metodos)
+
+
+# -------- Versión de precios --------
+# Todo lo que puede cambiar el resultado de calcular_transaccion para una transacción ya creada
+MODELOS_VERSION_PRECIOS = (
+    PrecioBaseComision, TasaComision, ComisionMetodoPago, PaymentMethod, Cliente, MedioAcreditacion,
+)
+
+
+def incrementar_version_precios(sender, **kwargs):
+    """
+    Incrementa VersionPrecios dentro de la misma transacción de BD que el cambio,
+    así una transacción cotizada con la versión anterior siempre se recalcula.
+    """
+    VersionPrecios.incrementar()
+    matriz_precios.registrar_version_local()
+
+
+def incrementar_version_si_cambio_precio(sender, instance, created, raw=False, **kwargs):
+    """
+    Para los modelos con ``CAMPOS_PRECIO`` (Cliente, PaymentMethod,
+    MedioAcreditacion) solo cuenta un cambio en esos campos: un alta o una
+    edición de nombre o datos de contacto no afecta ninguna cotización existente.
+    """
+    cambio = instance.cambio_campos_precio()
+    if not created and not raw and cambio:
+        incrementar_version_precios(sender)
+
+
+for _modelo in MODELOS_VERSION_PRECIOS:
+    al_guardar = (
+        incrementar_version_si_cambio_precio if hasattr(_modelo, "CAMPOS_PRECIO") else incrementar_version_precios
+    )
+    receiver(post_save, sender=_modelo, dispatch_uid=f"version_precios_save_{_modelo.__name__}")(al_guardar)
+    receiver(post_delete, sender=_modelo, dispatch_uid=f"version_precios_delete_{_modelo.__name__}")(incrementar_version_precios)
+
+
+# -------- Contadores de límites --------
+@receiver(post_save, sender=Transaccion, dispatch_uid="contadores_limites_save_Transaccion")
+def actualizar_contadores_limites(sender, instance, created, raw=False, **kwargs):
+    """
+    Aplica a los contadores de límites la diferencia entre el aporte anterior y
+    el actual de la transacción (alta, cambio de estado o de montos).
+    """
+    if raw:
+        return
+    nuevo = instance.aporte_a_limites()
+    anterior = (Decimal("0"), Decimal("0")) if created else getattr(instance, "_valores_contador", None)
+    dia = timezone.localdate(instance.fecha)
+    if nuevo is None or anterior is None:
+        # No se conoce el aporte anterior (instancia no leída de la base o campos diferidos)
+        contadores_limites.recalcular(instance.cliente_id, instance.moneda_id, dia)
+    elif nuevo != anterior:
+        contadores_limites.aplicar_delta(
+            instance.cliente_id, instance.moneda_id, dia, nuevo[0] - anterior[0], nuevo[1] - anterior[1]
+        )
+    instance._valores_contador = nuevo
+
+
+@receiver(post_delete, sender=Transaccion, dispatch_uid="contadores_limites_delete_Transaccion")
+def descontar_contadores_limites(sender, instance, **kwargs):
+    # Solo se actualizan filas existentes: si se está borrando el cliente, sus contadores también
+    contadores_limites.recalcular(
+        instance.cliente_id, instance.moneda_id, timezone.localdate(instance.fecha), crear=False
+    )
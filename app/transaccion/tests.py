@@ -1,23 +1,38 @@
 """
 Pruebas unitarias de transacciones
 """
+import json
+from io import StringIO
 from decimal import Decimal
 from unittest.mock import patch
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
 from django.core.exceptions import ValidationError
 from django.urls import reverse
+from django.core.management import call_command
 
-from clientes.models import Cliente, LimitePYG, LimiteMoneda
+from clientes.models import Cliente, LimitePYG, LimiteMoneda, TasaComision
 from monedas.models import Moneda
 from payments.models import PaymentMethod
-from transaccion.models import Transaccion, Movimiento
+from transaccion.models import Transaccion, Movimiento, VersionPrecios, ContadorLimite
 from transaccion.forms import TransaccionForm
 from transaccion.services import (
+    calcular_con_cotizacion,
+    calcular_transaccion,
+    calcular_transacciones_lote,
+    cotizar_con_garantia,
+    usar_cotizacion_garantizada,
     crear_transaccion,
     cancelar_transaccion,
     confirmar_transaccion,
     validate_limits,
+    expirar_lote_pendientes,
 )
+from transaccion.cache_precios import cache_precios
+from transaccion.matriz_precios import matriz_precios
+from transaccion import contadores_limites
+from commons.redondeo import redondear_a_denom_py
+from monedas.models import PrecioBaseComision
+from payments.models import ComisionMetodoPago
 from commons.enums import (
     TipoTransaccionEnum,
     EstadoTransaccionEnum,
@@ -203,4 +218,670 @@ class TransaccionViewsTest(TestCase):
             "medio_pago": self.payment.id,
         }
         response = self.client_http.post(url, data)
-        self.assertIn(response.status_code, [200, 302]) 
+        self.assertIn(response.status_code, [200, 302])
+
+
+class CachePreciosTest(TestCase):
+    """
+    Pruebas de la caché de precios usada por calcular_transaccion.
+    """
+    def setUp(self):
+        cache_precios.invalidar()
+        matriz_precios.invalidar()
+        cache_precios.reiniciar_estadisticas()
+        self.cliente = Cliente.objects.create(nombre="Cliente Cache", tipo="MIN")
+        self.moneda, _ = Moneda.objects.get_or_create(codigo="USD", defaults={"nombre": "Dólar"})
+        self.precio, _ = PrecioBaseComision.objects.update_or_create(
+            moneda=self.moneda,
+            defaults={"precio_base": Decimal("7300"), "comision_compra": Decimal("50"), "comision_venta": Decimal("200")},
+        )
+        ComisionMetodoPago.objects.update_or_create(tipo_metodo="tarjeta", defaults={"porcentaje_comision": Decimal("2.00")})
+
+    def test_segunda_cotizacion_solo_lee_la_version(self):
+        primera = calcular_transaccion(self.cliente, TipoTransaccionEnum.COMPRA, self.moneda, Decimal("100"), tipo_metodo_override="tarjeta")
+        with self.assertNumQueries(1):
+            segunda = calcular_transaccion(self.cliente, TipoTransaccionEnum.COMPRA, self.moneda, Decimal("100"), tipo_metodo_override="tarjeta")
+        self.assertEqual(primera, segunda)
+        stats = cache_precios.estadisticas()
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hits"], 1)
+
+    def test_cambio_de_precio_invalida(self):
+        antes = calcular_transaccion(self.cliente, TipoTransaccionEnum.COMPRA, self.moneda, Decimal("1"), tipo_metodo_override="efectivo")
+        self.precio.precio_base = Decimal("7400")
+        self.precio.save()
+        despues = calcular_transaccion(self.cliente, TipoTransaccionEnum.COMPRA, self.moneda, Decimal("1"), tipo_metodo_override="efectivo")
+        self.assertEqual(despues["tasa_aplicada"] - antes["tasa_aplicada"], Decimal("100"))
+
+    def test_cambio_de_otro_proceso_no_usa_la_entrada_vieja(self):
+        antes = calcular_transaccion(self.cliente, TipoTransaccionEnum.COMPRA, self.moneda, Decimal("1"), tipo_metodo_override="efectivo")
+        # Otro proceso cambia el precio: aquí no llega ninguna señal
+        PrecioBaseComision.objects.filter(pk=self.precio.pk).update(precio_base=Decimal("7400"))
+        VersionPrecios.incrementar()
+        despues = calcular_transaccion(self.cliente, TipoTransaccionEnum.COMPRA, self.moneda, Decimal("1"), tipo_metodo_override="efectivo")
+        self.assertEqual(despues["tasa_aplicada"] - antes["tasa_aplicada"], Decimal("100"))
+        self.assertEqual(despues["version_precios"], VersionPrecios.actual())
+
+    def test_cambio_comision_metodo_invalida(self):
+        calcular_transaccion(self.cliente, TipoTransaccionEnum.COMPRA, self.moneda, Decimal("100"), tipo_metodo_override="tarjeta")
+        ComisionMetodoPago.objects.filter(tipo_metodo="tarjeta").first().delete()
+        calculo = calcular_transaccion(self.cliente, TipoTransaccionEnum.COMPRA, self.moneda, Decimal("100"), tipo_metodo_override="tarjeta")
+        self.assertEqual(calculo["porcentaje_metodo_pago"], Decimal("0"))
+
+
+class CalculoLoteTest(TestCase):
+    """
+    Pruebas del cálculo de cotizaciones por lote.
+    """
+    def setUp(self):
+        cache_precios.invalidar()
+        matriz_precios.invalidar()
+        self.cliente_min = Cliente.objects.create(nombre="Cliente Lote MIN", tipo="MIN")
+        self.cliente_vip = Cliente.objects.create(nombre="Cliente Lote VIP", tipo="VIP")
+        self.usd, _ = Moneda.objects.get_or_create(codigo="USD", defaults={"nombre": "Dólar"})
+        self.eur, _ = Moneda.objects.get_or_create(codigo="EUR", defaults={"nombre": "Euro"})
+        self.jpy, _ = Moneda.objects.get_or_create(codigo="JPY", defaults={"nombre": "Yen"})
+        for moneda, base in ((self.usd, "7300"), (self.eur, "7900")):
+            PrecioBaseComision.objects.update_or_create(
+                moneda=moneda,
+                defaults={"precio_base": Decimal(base), "comision_compra": Decimal("50"), "comision_venta": Decimal("170")},
+            )
+        PrecioBaseComision.objects.filter(moneda=self.jpy).delete()
+        self.payment = PaymentMethod.objects.create(
+            cliente=self.cliente_min,
+            payment_type=PaymentTypeEnum.BILLETERA.value,
+            proveedor_billetera="Tigo",
+        )
+
+    def _items(self):
+        items = []
+        for cliente in (self.cliente_min, self.cliente_vip):
+            for moneda in (self.usd, self.eur):
+                for tipo in (TipoTransaccionEnum.COMPRA, TipoTransaccionEnum.VENTA):
+                    for metodo in ("efectivo", "tarjeta", "transferencia"):
+                        items.append({
+                            "cliente": cliente, "tipo": tipo, "moneda": moneda,
+                            "monto_operado": Decimal("123.45"), "tipo_metodo_override": metodo,
+                        })
+        items.append({
+            "cliente": self.cliente_min, "tipo": TipoTransaccionEnum.COMPRA, "moneda": self.usd,
+            "monto_operado": Decimal("10"), "medio_pago": self.payment.pk,
+        })
+        return items
+
+    def test_lote_igual_a_calculo_individual(self):
+        items = self._items()
+        resultados = calcular_transacciones_lote(items)
+        self.assertEqual(len(resultados), len(items))
+        for item, resultado in zip(items, resultados):
+            esperado = calcular_transaccion(
+                item["cliente"], item["tipo"], item["moneda"], item["monto_operado"],
+                item.get("medio_pago"), item.get("tipo_metodo_override"),
+            )
+            self.assertEqual(resultado, esperado)
+
+    def test_lote_consultas_constantes(self):
+        items = self._items()
+        # PaymentMethod + PrecioBaseComision + TasaComision + ComisionMetodoPago
+        with self.assertNumQueries(5):
+            calcular_transacciones_lote(items)
+
+    def test_lote_errores_por_item(self):
+        resultados = calcular_transacciones_lote([
+            {"cliente": self.cliente_min, "tipo": TipoTransaccionEnum.COMPRA, "moneda": self.jpy, "monto_operado": 1},
+            {"cliente": self.cliente_min, "tipo": TipoTransaccionEnum.COMPRA, "moneda": self.usd, "monto_operado": 1, "medio_pago": 999999},
+            {"cliente": self.cliente_min, "tipo": TipoTransaccionEnum.VENTA, "moneda": self.usd, "monto_operado": 1},
+        ])
+        self.assertIn("error", resultados[0])
+        self.assertIn("error", resultados[1])
+        self.assertNotIn("error", resultados[2])
+
+    def test_calcular_lote_api(self):
+        url = reverse("transacciones:calcular_lote_api")
+        payload = {"items": [
+            {"cliente": self.cliente_vip.id, "moneda": self.eur.id, "tipo": "VENTA", "monto_operado": "50", "tipo_metodo": "tarjeta"},
+            {"cliente": self.cliente_vip.id, "moneda": self.eur.id, "tipo": "OTRO", "monto_operado": "50"},
+        ]}
+        response = Client().post(url, data=json.dumps(payload), content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        resultados = response.json()["resultados"]
+        esperado = calcular_transaccion(self.cliente_vip, TipoTransaccionEnum.VENTA, self.eur, Decimal("50"), tipo_metodo_override="tarjeta")
+        self.assertEqual(resultados[0]["monto_pyg"], str(esperado["monto_pyg"]))
+        self.assertIn("error", resultados[1])
+
+    def test_calcular_lote_api_ids_invalidos_por_item(self):
+        url = reverse("transacciones:calcular_lote_api")
+        base = {"cliente": self.cliente_min.id, "moneda": self.usd.id, "tipo": "COMPRA", "monto_operado": "10"}
+        payload = {"items": [
+            {**base, "medio_pago_id": "abc"},
+            {**base, "medio_pago_id": {"x": 1}},
+            {**base, "medio_pago_id": 1.5},
+            {**base, "cliente": "zz"},
+            {**base, "moneda": None},
+            {**base, "medio_pago_id": str(self.payment.pk)},
+            base,
+        ]}
+        response = Client().post(url, data=json.dumps(payload), content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        resultados = response.json()["resultados"]
+        self.assertEqual(len(resultados), 7)
+        for resultado in resultados[:5]:
+            self.assertIn("error", resultado)
+        self.assertNotIn("error", resultados[5])
+        self.assertNotIn("error", resultados[6])
+
+    def test_lote_medio_pago_no_numerico(self):
+        resultados = calcular_transacciones_lote([
+            {"cliente": self.cliente_min, "tipo": TipoTransaccionEnum.COMPRA, "moneda": self.usd, "monto_operado": 1, "medio_pago": "abc"},
+            {"cliente": self.cliente_min, "tipo": TipoTransaccionEnum.COMPRA, "moneda": self.usd, "monto_operado": 1, "medio_pago": 1.5},
+            {"cliente": self.cliente_min, "tipo": TipoTransaccionEnum.COMPRA, "moneda": self.usd, "monto_operado": 1, "medio_pago": str(self.payment.pk)},
+        ])
+        self.assertIn("error", resultados[0])
+        self.assertIn("error", resultados[1])
+        self.assertNotIn("error", resultados[2])
+
+
+class MatrizPreciosTest(TestCase):
+    """
+    Pruebas de la matriz precalculada de cotizaciones.
+    """
+    def setUp(self):
+        cache_precios.invalidar()
+        matriz_precios.invalidar()
+        self.addCleanup(matriz_precios.invalidar)
+        self.usd, _ = Moneda.objects.get_or_create(codigo="USD", defaults={"nombre": "Dólar"})
+        self.precio, _ = PrecioBaseComision.objects.update_or_create(
+            moneda=self.usd,
+            defaults={"precio_base": Decimal("7300"), "comision_compra": Decimal("50"), "comision_venta": Decimal("200")},
+        )
+        ComisionMetodoPago.objects.update_or_create(tipo_metodo="tarjeta", defaults={"porcentaje_comision": Decimal("2.00")})
+
+    def test_celdas_iguales_al_calculo(self):
+        for segmento in ("MIN", "CORP", "VIP"):
+            cliente = Cliente.objects.create(nombre=f"Cliente {segmento}", tipo=segmento)
+            for tipo in (TipoTransaccionEnum.COMPRA, TipoTransaccionEnum.VENTA):
+                for metodo in ("efectivo", "tarjeta", "billetera", "cuenta_bancaria", "otro"):
+                    calculo = calcular_transaccion(cliente, tipo, self.usd, Decimal("250"), tipo_metodo_override=metodo)
+                    celda = matriz_precios.celda(self.usd.pk, segmento, metodo, tipo)
+                    self.assertEqual(celda.tasa_aplicada, calculo["tasa_aplicada"])
+                    self.assertEqual(
+                        redondear_a_denom_py(matriz_precios.cotizar(self.usd.pk, segmento, metodo, tipo, Decimal("250"))),
+                        calculo["monto_pyg"],
+                    )
+
+    def test_reconstruccion_incremental(self):
+        matriz_precios.celda(self.usd.pk, "MIN", "efectivo", TipoTransaccionEnum.COMPRA)
+        with self.assertNumQueries(0):
+            matriz_precios.celda(self.usd.pk, "VIP", "tarjeta", TipoTransaccionEnum.VENTA)
+
+        self.precio.precio_base = Decimal("7400")
+        self.precio.save()
+        with self.assertNumQueries(2):  # VersionPrecios + el precio de la moneda
+            celda = matriz_precios.celda(self.usd.pk, "MIN", "efectivo", TipoTransaccionEnum.COMPRA)
+        self.assertEqual(celda.tasa_aplicada, Decimal("7600"))
+
+        TasaComision.objects.filter(tipo_cliente="VIP").update(porcentaje=Decimal("50"))
+        matriz_precios.marcar_segmento("VIP")
+        with self.assertNumQueries(2):
+            celda = matriz_precios.celda(self.usd.pk, "VIP", "efectivo", TipoTransaccionEnum.COMPRA)
+        self.assertEqual(celda.tasa_aplicada, Decimal("7500"))
+
+    def test_cambio_de_otro_proceso_reconstruye_todo(self):
+        eur, _ = Moneda.objects.get_or_create(codigo="EUR", defaults={"nombre": "Euro"})
+        precio_eur, _ = PrecioBaseComision.objects.update_or_create(
+            moneda=eur,
+            defaults={"precio_base": Decimal("8000"), "comision_compra": Decimal("50"), "comision_venta": Decimal("100")},
+        )
+        matriz_precios.celda(self.usd.pk, "MIN", "efectivo", TipoTransaccionEnum.COMPRA)
+
+        # Otro proceso cambia el USD: sube la versión pero aquí no se marca nada
+        PrecioBaseComision.objects.filter(pk=self.precio.pk).update(precio_base=Decimal("7400"))
+        VersionPrecios.incrementar()
+        precio_eur.precio_base = Decimal("8100")
+        precio_eur.save()
+
+        celda, version = matriz_precios.celda_y_version(self.usd.pk, "MIN", "efectivo", TipoTransaccionEnum.COMPRA)
+        self.assertEqual(celda.tasa_aplicada, Decimal("7600"))
+        self.assertEqual(version, VersionPrecios.actual())
+
+    def test_moneda_sin_precio_no_esta_en_matriz(self):
+        self.precio.delete()
+        self.assertIsNone(matriz_precios.celda(self.usd.pk, "MIN", "efectivo", TipoTransaccionEnum.COMPRA))
+        self.assertNotIn("USD", matriz_precios.tasas())
+
+    def test_tasas_comisiones_json_desde_matriz(self):
+        from django.contrib.auth import get_user_model
+        from django.test import RequestFactory
+        from monedas.views import tasas_comisiones_json
+
+        request = RequestFactory().get(reverse("monedas:tasas_comisiones_json"))
+        request.user = get_user_model()(email="matriz@test.com")
+        matriz_precios.descuentos()
+        with self.assertNumQueries(0):
+            response = tasas_comisiones_json(request)
+        self.assertIn("vip", json.loads(response.content)["tasas"])
+
+
+class VersionPreciosTest(TestCase):
+    """
+    Pruebas de la versión de precios usada para detectar cambios de cotización.
+    """
+    def setUp(self):
+        cache_precios.invalidar()
+        matriz_precios.invalidar()
+        self.addCleanup(matriz_precios.invalidar)
+        self.cliente = Cliente.objects.create(nombre="Cliente Version", tipo="MIN")
+        self.moneda, _ = Moneda.objects.get_or_create(codigo="USD", defaults={"nombre": "Dólar"})
+        self.precio, _ = PrecioBaseComision.objects.update_or_create(
+            moneda=self.moneda,
+            defaults={"precio_base": Decimal("7300"), "comision_compra": Decimal("50"), "comision_venta": Decimal("200")},
+        )
+
+    def _crear(self):
+        calculo = calcular_transaccion(self.cliente, TipoTransaccionEnum.COMPRA, self.moneda, Decimal("10"), tipo_metodo_override="efectivo")
+        return crear_transaccion(
+            self.cliente, TipoTransaccionEnum.COMPRA, self.moneda, Decimal("10"),
+            calculo["tasa_aplicada"], calculo["comision_final"], calculo["monto_pyg"],
+            version_precios=calculo["version_precios"],
+        )
+
+    def test_cambio_de_precio_incrementa_version(self):
+        antes = VersionPrecios.actual()
+        self.precio.precio_base = Decimal("7350")
+        self.precio.save()
+        self.assertGreater(VersionPrecios.actual(), antes)
+
+    def test_solo_cambios_de_precio_del_cliente_incrementan_version(self):
+        cliente = Cliente.objects.get(pk=self.cliente.pk)
+        antes = VersionPrecios.actual()
+        cliente.nombre = "Cliente Version renombrado"
+        cliente.save()
+        Cliente.objects.create(nombre="Cliente nuevo", tipo="VIP")
+        self.assertEqual(VersionPrecios.actual(), antes)
+        cliente.tipo = "VIP"
+        cliente.save()
+        self.assertEqual(VersionPrecios.actual(), antes + 1)
+
+    def test_solo_cambios_de_tipo_del_metodo_incrementan_version(self):
+        metodo = PaymentMethod.objects.create(
+            cliente=self.cliente, payment_type=PaymentTypeEnum.BILLETERA.value, proveedor_billetera="Tigo",
+        )
+        antes = VersionPrecios.actual()
+        metodo = PaymentMethod.objects.get(pk=metodo.pk)
+        metodo.billetera_titular = "Otro titular"
+        metodo.save()
+        self.assertEqual(VersionPrecios.actual(), antes)
+        metodo.payment_type = PaymentTypeEnum.CUENTA_BANCARIA.value
+        metodo.save()
+        self.assertEqual(VersionPrecios.actual(), antes + 1)
+
+    def test_sin_cambios_no_recalcula(self):
+        tx = self._crear()
+        self.assertEqual(tx.version_precios, VersionPrecios.actual())
+        with patch("transaccion.services.calcular_transaccion") as calcular, self.assertNumQueries(1):
+            verificacion = tx.verificar_cambio_cotizacion()
+        calcular.assert_not_called()
+        self.assertFalse(verificacion["ha_cambiado"])
+        self.assertEqual(verificacion["monto_pyg_nuevo"], tx.monto_pyg)
+
+    def test_cambio_de_precio_se_detecta(self):
+        tx = self._crear()
+        self.precio.precio_base = Decimal("7500")
+        self.precio.save()
+        verificacion = tx.verificar_cambio_cotizacion()
+        self.assertTrue(verificacion["ha_cambiado"])
+        self.assertEqual(verificacion["tasa_nueva"] - verificacion["tasa_original"], Decimal("200"))
+
+    def test_cambio_sin_efecto_actualiza_version(self):
+        tx = self._crear()
+        otro = Moneda.objects.create(codigo="XAU", nombre="Oro")
+        PrecioBaseComision.objects.create(moneda=otro, precio_base=Decimal("1"), comision_compra=Decimal("0"), comision_venta=Decimal("0"))
+        self.assertNotEqual(tx.version_precios, VersionPrecios.actual())
+        self.assertFalse(tx.verificar_cambio_cotizacion()["ha_cambiado"])
+        tx.refresh_from_db()
+        self.assertEqual(tx.version_precios, VersionPrecios.actual())
+
+
+class CotizacionGarantizadaTest(TestCase):
+    """
+    Pruebas de los tokens de cotización garantizada.
+    """
+    def setUp(self):
+        cache_precios.invalidar()
+        matriz_precios.invalidar()
+        self.addCleanup(matriz_precios.invalidar)
+        self.cliente = Cliente.objects.create(nombre="Cliente Token", tipo="MIN")
+        self.moneda, _ = Moneda.objects.get_or_create(codigo="USD", defaults={"nombre": "Dólar"})
+        self.precio, _ = PrecioBaseComision.objects.update_or_create(
+            moneda=self.moneda,
+            defaults={"precio_base": Decimal("7300"), "comision_compra": Decimal("50"), "comision_venta": Decimal("200")},
+        )
+
+    def _cotizar(self, monto="10"):
+        return cotizar_con_garantia(
+            self.cliente, TipoTransaccionEnum.COMPRA, self.moneda, Decimal(monto), tipo_metodo_override="efectivo"
+        )
+
+    def test_token_conserva_cifras_aunque_cambie_el_precio(self):
+        cotizacion = self._cotizar()
+        self.precio.precio_base = Decimal("7600")
+        self.precio.save()
+        with patch("transaccion.services.calcular_transaccion") as calcular:
+            tx = crear_transaccion(
+                self.cliente, TipoTransaccionEnum.COMPRA, self.moneda, Decimal("10.00"),
+                cotizacion_token=cotizacion["cotizacion_token"],
+            )
+        calcular.assert_not_called()
+        self.assertEqual(tx.tasa_aplicada, cotizacion["tasa_aplicada"])
+        self.assertEqual(tx.monto_pyg, cotizacion["monto_pyg"])
+        self.assertEqual(tx.version_precios, cotizacion["version_precios"])
+
+    def test_token_de_otra_operacion(self):
+        cotizacion = self._cotizar()
+        with self.assertRaises(ValidationError):
+            usar_cotizacion_garantizada(
+                cotizacion["cotizacion_token"], self.cliente, TipoTransaccionEnum.COMPRA,
+                self.moneda, Decimal("11"), tipo_metodo_override="efectivo",
+            )
+        with self.assertRaises(ValidationError):
+            usar_cotizacion_garantizada(
+                cotizacion["cotizacion_token"], self.cliente, TipoTransaccionEnum.COMPRA,
+                self.moneda, Decimal("10"), tipo_metodo_override="tarjeta",
+            )
+
+    def test_token_alterado(self):
+        token = self._cotizar()["cotizacion_token"]
+        with self.assertRaises(ValidationError):
+            crear_transaccion(
+                self.cliente, TipoTransaccionEnum.COMPRA, self.moneda, Decimal("10"), cotizacion_token=token + "x"
+            )
+
+    def test_token_vencido(self):
+        token = self._cotizar()["cotizacion_token"]
+        with override_settings(COTIZACION_GARANTIZADA_SEGUNDOS=-1), self.assertRaises(ValidationError):
+            usar_cotizacion_garantizada(
+                token, self.cliente, TipoTransaccionEnum.COMPRA, self.moneda, Decimal("10"),
+                tipo_metodo_override="efectivo",
+            )
+
+    def test_token_vencido_o_ajeno_recalcula(self):
+        token = self._cotizar()["cotizacion_token"]
+        self.precio.precio_base = Decimal("7600")
+        self.precio.save()
+        actual = calcular_transaccion(
+            self.cliente, TipoTransaccionEnum.COMPRA, self.moneda, Decimal("10"), tipo_metodo_override="efectivo"
+        )
+        with override_settings(COTIZACION_GARANTIZADA_SEGUNDOS=-1):
+            vencido = calcular_con_cotizacion(
+                token, self.cliente, TipoTransaccionEnum.COMPRA, self.moneda, Decimal("10"),
+                tipo_metodo_override="efectivo",
+            )
+        ajeno = calcular_con_cotizacion(
+            token, self.cliente, TipoTransaccionEnum.COMPRA, self.moneda, Decimal("12"),
+            tipo_metodo_override="efectivo",
+        )
+        self.assertEqual(vencido["monto_pyg"], actual["monto_pyg"])
+        self.assertEqual(vencido["version_precios"], actual["version_precios"])
+        self.assertEqual(ajeno["tasa_aplicada"], actual["tasa_aplicada"])
+
+    def test_calcular_api_devuelve_token(self):
+        response = Client().post(
+            reverse("transacciones:calcular_api"),
+            data=json.dumps({
+                "cliente": self.cliente.pk, "tipo": "COMPRA", "moneda": self.moneda.pk,
+                "monto_operado": "10", "tipo_metodo": "efectivo",
+            }),
+            content_type="application/json",
+        )
+        datos = response.json()
+        calculo = usar_cotizacion_garantizada(
+            datos["cotizacion_token"], self.cliente, TipoTransaccionEnum.COMPRA, self.moneda, Decimal("10"),
+            tipo_metodo_override="efectivo",
+        )
+        self.assertEqual(str(calculo["monto_pyg"]), datos["monto_pyg"])
+
+
+class ContadoresLimitesTest(TestCase):
+    """
+    Pruebas de los contadores acumulados usados por validate_limits.
+    """
+    def setUp(self):
+        from clientes.models import LimiteClienteTipo
+        self.cliente = Cliente.objects.create(nombre="Cliente Contador", tipo="MIN")
+        self.moneda, _ = Moneda.objects.get_or_create(codigo="USD", defaults={"nombre": "Dólar"})
+        LimiteClienteTipo.objects.update_or_create(
+            tipo_cliente="minorista",
+            defaults={"limite_diario": Decimal("1000000"), "limite_mensual": Decimal("5000000")},
+        )
+
+    def _crear(self, monto_pyg):
+        return crear_transaccion(
+            self.cliente, TipoTransaccionEnum.COMPRA, self.moneda, Decimal("10"),
+            Decimal("7500"), Decimal("200"), Decimal(monto_pyg),
+        )
+
+    def _totales(self):
+        dia, mes = contadores_limites.contadores_bloqueados(self.cliente, self.moneda)
+        return dia.monto_pyg, mes.monto_pyg, mes.monto_operado
+
+    def test_alta_y_cancelacion_actualizan_contadores(self):
+        tx = self._crear("400000")
+        self._crear("100000")
+        self.assertEqual(self._totales(), (Decimal("500000"), Decimal("500000"), Decimal("20")))
+        cancelar_transaccion(tx)
+        self.assertEqual(self._totales(), (Decimal("100000"), Decimal("100000"), Decimal("10")))
+
+    def test_limite_diario_con_contadores(self):
+        self._crear("900000")
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as consultas:
+            with self.assertRaisesMessage(ValidationError, "Límite diario alcanzado"):
+                validate_limits(self.cliente, self.moneda, Decimal("10"), Decimal("200000"))
+        # Los acumulados salen de los contadores, no de agregar Transaccion
+        self.assertFalse(any('"transaccion_transaccion"' in q["sql"] for q in consultas.captured_queries))
+
+    def test_completada_deja_de_contar(self):
+        tx = self._crear("300000")
+        tx.estado = EstadoTransaccionEnum.COMPLETADA
+        tx.save()
+        self.assertEqual(self._totales()[0], Decimal("0"))
+
+    def test_reconstruir_desde_historial(self):
+        self._crear("250000")
+        self._crear("150000")
+        esperado = self._totales()
+        ContadorLimite.objects.all().delete()
+        call_command("reconstruir_contadores_limites", stdout=StringIO())
+        self.assertEqual(self._totales(), esperado)
+
+
+class ExpiracionPendientesTest(TestCase):
+    """
+    Pruebas del barrido de transacciones pendientes vencidas.
+    """
+    def setUp(self):
+        self.cliente = Cliente.objects.create(nombre="Cliente Expira", tipo="MIN")
+        self.moneda, _ = Moneda.objects.get_or_create(codigo="USD", defaults={"nombre": "Dólar"})
+
+    def _crear(self, vencida=True, estado=EstadoTransaccionEnum.PENDIENTE):
+        from datetime import timedelta
+        from django.utils import timezone
+
+        desfase = timedelta(minutes=-5 if vencida else 5)
+        return Transaccion.objects.create(
+            cliente=self.cliente, tipo=TipoTransaccionEnum.COMPRA, moneda=self.moneda,
+            monto_operado=Decimal("10"), tasa_aplicada=Decimal("7500"), comision=Decimal("200"),
+            monto_pyg=Decimal("75000"), estado=estado, fecha_expiracion=timezone.now() + desfase,
+        )
+
+    def test_lote_respeta_tamano_y_solo_vencidas(self):
+        vencidas = [self._crear() for _ in range(3)]
+        vigente = self._crear(vencida=False)
+        pagada = self._crear(estado=EstadoTransaccionEnum.PAGADA)
+
+        base = Transaccion.objects.filter(cliente=self.cliente)
+        self.assertEqual(expirar_lote_pendientes(base, tamano_lote=2), 2)
+        self.assertEqual(expirar_lote_pendientes(base, tamano_lote=2), 1)
+        self.assertEqual(expirar_lote_pendientes(base, tamano_lote=2), 0)
+
+        for tx in vencidas:
+            tx.refresh_from_db()
+            self.assertEqual(tx.estado, EstadoTransaccionEnum.ANULADA)
+        vigente.refresh_from_db()
+        pagada.refresh_from_db()
+        self.assertEqual(vigente.estado, EstadoTransaccionEnum.PENDIENTE)
+        self.assertEqual(pagada.estado, EstadoTransaccionEnum.PAGADA)
+
+    def test_comando_reporta_expiradas(self):
+        from django.utils import timezone
+
+        for _ in range(3):
+            self._crear()
+        pendientes = Transaccion.objects.filter(
+            estado=EstadoTransaccionEnum.PENDIENTE, fecha_expiracion__lte=timezone.now()
+        ).count()
+        salida = StringIO()
+        call_command("expirar_transacciones", "--lote", "2", stdout=salida)
+        self.assertIn(f"Transacciones expiradas: {pendientes}", salida.getvalue())
+        self.assertFalse(Transaccion.objects.filter(estado=EstadoTransaccionEnum.PENDIENTE).exists())
+
+    def test_listado_no_expira(self):
+        tx = self._crear()
+        self.client.get(reverse("transacciones:transacciones_list"))
+        tx.refresh_from_db()
+        self.assertEqual(tx.estado, EstadoTransaccionEnum.PENDIENTE)
+
+
+class TransaccionesListPaginacionTest(TestCase):
+    """
+    Pruebas del listado paginado por cursor y de los conteos por estado.
+    """
+    def setUp(self):
+        self.cliente = Cliente.objects.create(nombre="Cliente Paginado", tipo="MIN")
+        self.moneda, _ = Moneda.objects.get_or_create(codigo="USD", defaults={"nombre": "Dólar"})
+        estados = [EstadoTransaccionEnum.PENDIENTE] * 3 + [EstadoTransaccionEnum.PAGADA, EstadoTransaccionEnum.CANCELADA]
+        self.ids = [
+            Transaccion.objects.create(
+                cliente=self.cliente, tipo=TipoTransaccionEnum.COMPRA, moneda=self.moneda,
+                monto_operado=Decimal("10"), tasa_aplicada=Decimal("7500"), comision=Decimal("200"),
+                monto_pyg=Decimal("75000"), estado=estado,
+            ).id
+            for estado in estados
+        ]
+        # Dos filas con la misma fecha: el id desempata
+        fecha = Transaccion.objects.get(pk=self.ids[0]).fecha
+        Transaccion.objects.filter(pk=self.ids[1]).update(fecha=fecha)
+        self.url = reverse("transacciones:transacciones_list")
+
+    def _pagina(self, **params):
+        params = {"estado": "todas", "cliente": self.cliente.id, "por_pagina": 2, **params}
+        return self.client.get(self.url, params).context
+
+    def test_recorre_paginas_sin_repetir(self):
+        vistos = []
+        ctx = self._pagina()
+        self.assertIsNone(ctx["pagina"].anterior)
+        while True:
+            vistos += [t.id for t in ctx["transacciones"]]
+            if not ctx["pagina"].siguiente:
+                break
+            ctx = self._pagina(despues=ctx["pagina"].siguiente)
+        esperado = list(
+            Transaccion.objects.filter(pk__in=self.ids).order_by("-fecha", "-id").values_list("id", flat=True)
+        )
+        self.assertEqual(vistos, esperado)
+
+        # Volver atrás desde la última página devuelve la anterior
+        anterior = self._pagina(antes=ctx["pagina"].anterior)
+        self.assertEqual([t.id for t in anterior["transacciones"]], esperado[2:4])
+
+    def test_cursor_invalido_devuelve_primera_pagina(self):
+        ctx = self._pagina(despues="no-es-un-cursor")
+        self.assertEqual(len(ctx["transacciones"]), 2)
+        self.assertIsNone(ctx["pagina"].anterior)
+
+    def test_conteos_por_estado(self):
+        ctx = self._pagina()
+        self.assertEqual(
+            ctx["counts"],
+            {"pendiente": 3, "pagada": 1, "completada": 0, "cancelada": 1, "anulada": 0, "todas": 5},
+        )
+
+
+class ReservaStockTauserTest(TestCase):
+    """
+    Pruebas de la reserva de denominaciones del tauser.
+    """
+    def setUp(self):
+        from tauser.models import Tauser, Denominacion, TauserStock
+        self.cliente = Cliente.objects.create(nombre="Cliente Reserva", tipo="MIN")
+        self.moneda, _ = Moneda.objects.get_or_create(codigo="USD", defaults={"nombre": "Dólar"})
+        self.tauser = Tauser.objects.create(ubicacion="Sucursal Reserva")
+        self.stocks = {}
+        for valor, cantidad in (("50", 1), ("20", 4)):
+            den, _ = Denominacion.objects.get_or_create(moneda=self.moneda, value=Decimal(valor), type=Denominacion.BILL)
+            self.stocks[valor] = TauserStock.objects.create(tauser=self.tauser, denominacion=den, quantity=cantidad)
+        self.tx = Transaccion.objects.create(
+            cliente=self.cliente, tipo=TipoTransaccionEnum.COMPRA, moneda=self.moneda,
+            monto_operado=Decimal("60"), tasa_aplicada=Decimal("7500"), comision=Decimal("200"),
+            monto_pyg=Decimal("450000"), tauser=self.tauser,
+        )
+
+    def _cantidades(self):
+        return {valor: type(s).objects.get(pk=s.pk).quantity for valor, s in self.stocks.items()}
+
+    def test_reserva_en_pocas_sentencias(self):
+        from tauser.models import ReservaDenominacionTauser
+        from transaccion.services import reservar_stock_tauser_para_transaccion
+
+        # SAVEPOINT, SELECT ... FOR UPDATE, UPDATE, DELETE del resumen de la flota
+        # en la caché compartida, INSERT, RELEASE
+        with self.assertNumQueries(6):
+            reservar_stock_tauser_para_transaccion(self.tauser, self.tx, Decimal("60"), self.moneda)
+
+        self.assertEqual(self._cantidades(), {"50": 1, "20": 1})
+        reservas = ReservaDenominacionTauser.objects.filter(transaccion=self.tx)
+        self.assertEqual([(r.denominacion.value, r.cantidad) for r in reservas], [(Decimal("20"), 3)])
+
+    def test_stock_insuficiente_no_descuenta(self):
+        from tauser.models import ReservaDenominacionTauser
+        from transaccion.services import reservar_stock_tauser_para_transaccion
+
+        with self.assertRaises(ValidationError):
+            reservar_stock_tauser_para_transaccion(self.tauser, self.tx, Decimal("200"), self.moneda)
+        self.assertEqual(self._cantidades(), {"50": 1, "20": 4})
+        self.assertFalse(ReservaDenominacionTauser.objects.filter(transaccion=self.tx).exists())
+
+    def test_liberar_dos_veces_no_duplica_stock(self):
+        from transaccion.services import liberar_reservas_tauser_lote, reservar_stock_tauser_para_transaccion
+
+        reservar_stock_tauser_para_transaccion(self.tauser, self.tx, Decimal("60"), self.moneda)
+        self.assertEqual(liberar_reservas_tauser_lote([self.tx.pk]), 3)
+        self.assertEqual(liberar_reservas_tauser_lote([self.tx.pk]), 0)
+        self.assertEqual(self._cantidades(), {"50": 1, "20": 4})
+
+    def test_cancelar_en_lote_devuelve_stock_y_contadores(self):
+        from tauser.models import ReservaDenominacionTauser
+        from transaccion.services import cancelar_transacciones, reservar_stock_tauser_para_transaccion
+
+        otra = Transaccion.objects.create(
+            cliente=self.cliente, tipo=TipoTransaccionEnum.COMPRA, moneda=self.moneda,
+            monto_operado=Decimal("50"), tasa_aplicada=Decimal("7500"), comision=Decimal("200"),
+            monto_pyg=Decimal("375000"), tauser=self.tauser,
+        )
+        reservar_stock_tauser_para_transaccion(self.tauser, self.tx, Decimal("60"), self.moneda)
+        reservar_stock_tauser_para_transaccion(self.tauser, otra, Decimal("50"), self.moneda)
+        # Una fila de stock borrada se vuelve a crear al liberar
+        self.stocks.pop("50").delete()
+
+        self.assertEqual(cancelar_transacciones([self.tx, otra, self.tx]), 2)
+
+        self.assertEqual(self.tx.estado, EstadoTransaccionEnum.CANCELADA)
+        self.assertEqual(Transaccion.objects.get(pk=otra.pk).estado, EstadoTransaccionEnum.CANCELADA)
+        self.assertEqual(self._cantidades(), {"20": 4})
+        self.assertEqual(self.tauser.stocks.get(denominacion__value=Decimal("50")).quantity, 1)
+        self.assertFalse(ReservaDenominacionTauser.objects.exists())
+        dia, mes = contadores_limites.contadores_bloqueados(self.cliente, self.moneda)
+        self.assertEqual((dia.monto_pyg, mes.monto_operado), (Decimal("0"), Decimal("0")))
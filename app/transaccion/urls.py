@@ -11,6 +11,7 @@ urlpatterns = [
     path("<int:pk>/confirmar/", views.confirmar_view, name="confirmar"),
     path("<int:pk>/cancelar/", views.cancelar_view, name="cancelar"),
     path("calcular/", views.calcular_api, name="calcular_api"),
+    path("calcular/lote/", views.calcular_lote_api, name="calcular_lote_api"),
 
     path("<int:pk>/pago/tarjeta/", views.iniciar_pago_tarjeta, name="iniciar_pago_tarjeta"),
     path("stripe/webhook/", views.stripe_webhook, name="stripe_webhook"),
@@ -22,6 +23,7 @@ urlpatterns = [
     path("medios-acreditacion-por-cliente/", views.medios_acreditacion_por_cliente, name="medios_acreditacion_por_cliente"),
 
     path("validar-stock-tauser/", views.validar_stock_tauser, name="validar_stock_tauser"),
+    path("sugerir-tauser/", views.sugerir_tauser, name="sugerir_tauser"),
     path("vincular-tauser/", views.vincular_tauser, name="vincular_tauser"),
 
     path("<int:pk>/pago/simplesipap/", views.marcar_pagada_simple, name="pago_simplesipap"),
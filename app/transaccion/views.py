@@ -6,6 +6,7 @@ from django.conf import settings
 from django.contrib import messages
 from django.core.exceptions import ValidationError
 from django.db import transaction
+from django.db.models import Count, Q
 from django.http import (
     HttpResponse,
     HttpResponseBadRequest,
@@ -16,21 +17,25 @@ from django.shortcuts import get_object_or_404, redirect, render
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_GET, require_http_methods, require_POST
 from commons.enums import EstadoTransaccionEnum, TipoMovimientoEnum, TipoTransaccionEnum, PaymentTypeEnum
+from commons.paginacion import paginar_por_clave
 from clientes.models import Cliente
 from monedas.models import Moneda, TasaCambio
 from payments.models import PaymentMethod
 from .forms import TransaccionForm
 from .models import Movimiento, Transaccion
 from .services import (
+    calcular_con_cotizacion,
     calcular_transaccion,
+    calcular_transacciones_lote,
+    cotizar_con_garantia,
     confirmar_transaccion,
     cancelar_transaccion,
     crear_transaccion,
     crear_checkout_para_transaccion,
-    expirar_transacciones_pendientes,
     requiere_pago_tarjeta,
     verificar_pago_stripe,
 )
+from tauser.enrutador import enrutador_tausers
 from tauser.services import validar_stock_tauser_para_transaccion
 
 @require_POST
@@ -94,6 +99,37 @@ def validar_stock_tauser(request):
         resultado["moneda"] = str(resultado["moneda"])
     return JsonResponse(resultado)
 
+
+@require_GET
+def sugerir_tauser(request):
+    """
+    Ordena los Tausers activos para entregar ``monto`` de ``moneda_id`` (GET):
+    primero los que pueden entregar el monto exacto, de menor a mayor costo
+    (piezas y denominaciones escasas consumidas). ``limite`` acota la lista.
+    """
+    monto = request.GET.get("monto")
+    moneda_id = request.GET.get("moneda_id")
+    if not monto or not moneda_id:
+        return JsonResponse({"ok": False, "mensaje": "Faltan parámetros."}, status=400)
+    try:
+        monto = Decimal(monto)
+        moneda_id = int(moneda_id)
+        limite = int(request.GET["limite"]) if request.GET.get("limite") else None
+        if limite is not None and limite < 1:
+            raise ValueError("limite debe ser mayor a cero")
+    except (ArithmeticError, ValueError):
+        return JsonResponse({"ok": False, "mensaje": "Parámetros inválidos."}, status=400)
+    if not monto.is_finite() or monto <= 0:
+        return JsonResponse({"ok": False, "mensaje": "El monto debe ser mayor a cero."}, status=400)
+
+    opciones = enrutador_tausers.rankear(moneda_id, monto)
+    sugerido = opciones[0] if opciones and opciones[0].ok else None
+    return JsonResponse({
+        "ok": sugerido is not None,
+        "sugerido": sugerido.tauser_id if sugerido else None,
+        "tausers": [opcion._asdict() for opcion in opciones[:limite]],
+    })
+
 logger = logging.getLogger(__name__)
 stripe.api_key = settings.STRIPE_SECRET_KEY
 
@@ -229,6 +265,16 @@ def tramitar_transaccion_terminal(request):
     }
     return render(request, "transacciones/terminal.html", context)
 
+def _tamano_pagina(valor):
+    """Filas por página pedidas en ``?por_pagina=``, acotadas a ``TRANSACCIONES_POR_PAGINA_MAX``."""
+    por_defecto = getattr(settings, "TRANSACCIONES_POR_PAGINA", 25)
+    try:
+        tamano = int(valor) if valor else por_defecto
+    except ValueError:
+        tamano = por_defecto
+    return max(1, min(tamano, getattr(settings, "TRANSACCIONES_POR_PAGINA_MAX", 200)))
+
+
 def transacciones_list(request):
     order = request.GET.get("order")
     dir_ = request.GET.get("dir")
@@ -263,8 +309,6 @@ def transacciones_list(request):
         )
         base = Transaccion.objects.all()
 
-    expirar_transacciones_pendientes(base)
-
     # filtro por cliente (si aplica)
     if cliente_id:
         transacciones = transacciones.filter(cliente_id=cliente_id)
@@ -275,20 +319,22 @@ def transacciones_list(request):
     if estado_enum is not None:
         transacciones = transacciones.filter(estado=estado_enum)
 
-    # orden por fecha (default desc)
-    if order == "fecha":
-        transacciones = transacciones.order_by("fecha" if dir_ == "asc" else "-fecha")
-    else:
-        transacciones = transacciones.order_by("-fecha")
-
-    counts = {
-        "pendiente": base.filter(estado=EstadoTransaccionEnum.PENDIENTE).count(),
-        "pagada": base.filter(estado=EstadoTransaccionEnum.PAGADA).count(),
-        "completada": base.filter(estado=EstadoTransaccionEnum.COMPLETADA).count(),
-        "cancelada": base.filter(estado=EstadoTransaccionEnum.CANCELADA).count(),
-        "anulada": base.filter(estado=EstadoTransaccionEnum.ANULADA).count(),
-        "todas": base.count(),
-    }
+    # orden por fecha (default desc), paginado por (fecha, id)
+    tamano = _tamano_pagina(request.GET.get("por_pagina"))
+    pagina = paginar_por_clave(
+        transacciones,
+        campo="fecha",
+        tamano=tamano,
+        despues=request.GET.get("despues"),
+        antes=request.GET.get("antes"),
+        descendente=not (order == "fecha" and dir_ == "asc"),
+    )
+
+    # Conteos por estado en una sola consulta
+    counts = base.aggregate(
+        **{clave: Count("id", filter=Q(estado=estado)) for clave, estado in estados_validos.items() if estado},
+        todas=Count("id"),
+    )
 
     # Solo mostrar clientes asociados al usuario autenticado
     if request.user.is_authenticated:
@@ -299,7 +345,9 @@ def transacciones_list(request):
     from tauser.models import Tauser
     tausers = Tauser.objects.filter(estado="activo")
     ctx = {
-        "transacciones": transacciones,
+        "transacciones": pagina.items,
+        "pagina": pagina,
+        "por_pagina": tamano,
         "clientes": clientes,
         "cliente_id": cliente_id,
         "estado_qs": estado_qs,
@@ -415,7 +463,8 @@ def transaccion_create(request):
                     calculo["comision_final"],
                     calculo["monto_pyg"],
                     medio_pago,
-                    tauser
+                    tauser,
+                    version_precios=calculo.get("version_precios"),
                 )
                 messages.success(request, 
                     f"Transacción {transaccion.id} creada correctamente. "
@@ -498,10 +547,13 @@ def compra_moneda(request):
             if tauser_id:
                 from tauser.models import Tauser
                 tauser = Tauser.objects.filter(id=tauser_id).first()
-            calculo = calcular_transaccion(
-                cliente, 
-                TipoTransaccionEnum.COMPRA, 
-                moneda, 
+            # Cifras garantizadas por el calculador; si el token venció o no
+            # corresponde a lo enviado, se recalcula con los precios actuales
+            calculo = calcular_con_cotizacion(
+                request.POST.get("cotizacion_token"),
+                cliente,
+                TipoTransaccionEnum.COMPRA,
+                moneda,
                 monto,
                 medio_pago_obj,
                 tipo_metodo_override
@@ -515,7 +567,8 @@ def compra_moneda(request):
                 calculo["comision_final"],
                 calculo["monto_pyg"],
                 medio_pago_obj,
-                tauser
+                tauser,
+                version_precios=calculo.get("version_precios"),
             )
 
             # Preparar datos para el modal
@@ -629,10 +682,13 @@ def venta_moneda(request):
             if tauser_id:
                 from tauser.models import Tauser
                 tauser = Tauser.objects.filter(id=tauser_id).first()
-            calculo = calcular_transaccion(
-                cliente, 
-                TipoTransaccionEnum.VENTA, 
-                moneda, 
+            # Cifras garantizadas por el calculador; si el token venció o no
+            # corresponde a lo enviado, se recalcula con los precios actuales
+            calculo = calcular_con_cotizacion(
+                request.POST.get("cotizacion_token"),
+                cliente,
+                TipoTransaccionEnum.VENTA,
+                moneda,
                 monto,
                 medio_pago=None,  # Para VENTA no hay medio_pago (el cliente cobra)
                 tipo_metodo_override=tipo_metodo_override
@@ -647,7 +703,8 @@ def venta_moneda(request):
                 calculo["monto_pyg"],
                 None,  # medio_pago=None para VENTA
                 tauser,
-                medio_cobro_obj
+                medio_cobro_obj,
+                version_precios=calculo.get("version_precios"),
             )
 
             # Preparar datos para el modal
@@ -727,7 +784,8 @@ def calcular_api(request):
                 # Default: efectivo (para compatibilidad con código antiguo)
                 tipo_metodo_override = 'efectivo'
             
-            calculo = calcular_transaccion(
+            # La respuesta incluye un token que garantiza estas cifras al crear la transacción
+            calculo = cotizar_con_garantia(
                 cliente, 
                 tipo, 
                 moneda, 
@@ -735,22 +793,120 @@ def calcular_api(request):
                 medio_pago, 
                 tipo_metodo_override
             )
-            return JsonResponse(
-                {
-                    "descuento_pct": str(calculo.get("descuento_pct", "")),
-                    "precio_base": str(calculo.get("precio_base", "")),
-                    "tasa_aplicada": str(calculo["tasa_aplicada"]),
-                    "comision": str(calculo["comision"]),
-                    "monto_pyg": str(calculo["monto_pyg"]),
-                    "comision_metodo_pago": str(calculo.get("comision_metodo_pago", 0)),
-                    "porcentaje_metodo_pago": str(calculo.get("porcentaje_metodo_pago", 0)),
-                }
-            )
+            return JsonResponse(_calculo_a_json(calculo))
         except Exception as e:
             return JsonResponse({"error": str(e)}, status=400)
     return JsonResponse({"error": "Método no permitido"}, status=405)
 
 
+#: Cantidad máxima de operaciones aceptadas por calcular_lote_api.
+MAX_ITEMS_LOTE = 500
+
+
+@csrf_exempt
+def calcular_lote_api(request):
+    """
+    Cotiza varias operaciones en una sola petición.
+
+    Recibe ``{"items": [...]}`` donde cada item tiene los mismos campos que
+    ``calcular_api`` (cliente, moneda, tipo, monto_operado y medio_pago_id o
+    tipo_metodo). Devuelve ``{"resultados": [...]}`` en el mismo orden; los
+    items con error llevan ``{"error": ...}`` sin afectar al resto.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Método no permitido"}, status=405)
+    try:
+        data = json.loads(request.body)
+        items_json = data["items"]
+        if not isinstance(items_json, list):
+            raise ValueError("'items' debe ser una lista.")
+        if len(items_json) > MAX_ITEMS_LOTE:
+            raise ValueError(f"Se permiten como máximo {MAX_ITEMS_LOTE} items por lote.")
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    # Primera pasada: validar los IDs de cada item; los inválidos quedan como error del item
+    tipos = {"COMPRA": TipoTransaccionEnum.COMPRA, "VENTA": TipoTransaccionEnum.VENTA}
+    parseados = {}
+    errores = {}
+    for pos, item in enumerate(items_json):
+        try:
+            if not isinstance(item, dict):
+                raise ValueError("Cada item debe ser un objeto.")
+            if item.get("tipo") not in tipos:
+                raise ValueError(f"Tipo de transacción inválido: {item.get('tipo')}")
+            medio_pago_id = item.get("medio_pago_id")
+            parseados[pos] = {
+                "cliente": _id_entero(item.get("cliente"), "cliente"),
+                "moneda": _id_entero(item.get("moneda"), "moneda"),
+                "tipo": tipos[item["tipo"]],
+                "monto_operado": Decimal(str(item["monto_operado"])),
+                "medio_pago": _id_entero(medio_pago_id, "medio_pago_id") if medio_pago_id else None,
+                "tipo_metodo": item.get("tipo_metodo"),
+            }
+        except Exception as e:
+            errores[pos] = str(e)
+
+    clientes = Cliente.objects.in_bulk({p["cliente"] for p in parseados.values()})
+    monedas = Moneda.objects.in_bulk({p["moneda"] for p in parseados.values()})
+
+    items = []
+    for pos, item in list(parseados.items()):
+        cliente = clientes.get(item["cliente"])
+        moneda = monedas.get(item["moneda"])
+        if cliente is None:
+            errores[pos] = "Cliente no encontrado."
+        elif moneda is None:
+            errores[pos] = "Moneda no encontrada."
+        else:
+            items.append({
+                "cliente": cliente,
+                "tipo": item["tipo"],
+                "moneda": moneda,
+                "monto_operado": item["monto_operado"],
+                "medio_pago": item["medio_pago"],
+                # Default: efectivo (igual que calcular_api)
+                "tipo_metodo_override": None if item["medio_pago"] else (item["tipo_metodo"] or "efectivo"),
+            })
+
+    calculos = iter(calcular_transacciones_lote(items))
+    resultados = []
+    for pos in range(len(items_json)):
+        if pos in errores:
+            resultados.append({"error": errores[pos]})
+            continue
+        calculo = next(calculos)
+        resultados.append(calculo if "error" in calculo else _calculo_a_json(calculo))
+    return JsonResponse({"resultados": resultados})
+
+
+def _id_entero(valor, campo):
+    """Convierte a int un ID recibido en JSON (número entero o texto numérico)."""
+    if isinstance(valor, bool) or not isinstance(valor, (int, str)):
+        raise ValueError(f"'{campo}' debe ser un ID numérico.")
+    try:
+        return int(valor)
+    except ValueError:
+        raise ValueError(f"'{campo}' debe ser un ID numérico.")
+
+
+def _calculo_a_json(calculo):
+    """Serializa el resultado de calcular_transaccion para las respuestas JSON."""
+    datos = {
+        "descuento_pct": str(calculo.get("descuento_pct", "")),
+        "precio_base": str(calculo.get("precio_base", "")),
+        "tasa_aplicada": str(calculo["tasa_aplicada"]),
+        "comision": str(calculo["comision"]),
+        "monto_pyg": str(calculo["monto_pyg"]),
+        "comision_metodo_pago": str(calculo.get("comision_metodo_pago", 0)),
+        "porcentaje_metodo_pago": str(calculo.get("porcentaje_metodo_pago", 0)),
+    }
+    if "cotizacion_token" in calculo:
+        datos["cotizacion_token"] = calculo["cotizacion_token"]
+        datos["cotizacion_expira"] = calculo["cotizacion_expira"].isoformat()
+    return datos
+
+
 def iniciar_pago_tarjeta(request, pk):
     # Filtrar por clientes del usuario autenticado
     if request.user.is_authenticated:
@@ -1085,6 +1241,7 @@ def confirmar_cambio_cotizacion(request, pk):
                         medio_pago=tx.medio_pago,
                         tauser=tx.tauser,
                         medio_cobro=tx.medio_cobro,
+                        version_precios=calculo_nuevo.get('version_precios'),
                     )
                     
                     # Limpiar datos de verificación de la sesión
@@ -1194,6 +1351,7 @@ def confirmar_cambio_cotizacion_sipap(request, pk):
                         medio_pago=tx.medio_pago,
                         tauser=tx.tauser,
                         medio_cobro=tx.medio_cobro,
+                        version_precios=calculo_nuevo.get('version_precios'),
                     )
                     
                     # Limpiar datos de verificación de la sesión
@@ -19,3 +19,6 @@ class UsuariosConfig(AppConfig):
     """
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'usuarios'
+
+    def ready(self):
+        from . import signals
@@ -0,0 +1,90 @@
+"""
+Contadores globales del dashboard principal.
+
+Cada contador (``CONTADORES``) es una fila de ``ContadorDashboard``, la misma
+para todos los procesos. La primera lectura lo calcula con un ``COUNT``;
+después las señales de ``usuarios/signals.py`` lo mantienen al confirmarse
+cada transacción de BD, con ``UPDATE ... SET valor = valor ± 1`` (atómico):
+
+- un alta que cumple el filtro del contador lo incrementa;
+- una baja que lo cumplía lo decrementa;
+- una modificación de un modelo con filtro (ej. ``is_active``) borra el
+  contador, que se recalcula en la siguiente lectura.
+
+Si la fila no está el incremento se descarta y se cuenta al leer. Un contador
+contado hace más de ``DASHBOARD_CONTADORES_SEGUNDOS`` se vuelve a contar: eso
+acota cuánto puede durar un desvío por escrituras en bloque que no disparan
+señales.
+"""
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ContadorDashboard
+
+#: nombre -> (modelo, filtro que debe cumplir la fila para contarse)
+CONTADORES = {
+    'total_usuarios': (settings.AUTH_USER_MODEL, {}),
+    'usuarios_activos': (settings.AUTH_USER_MODEL, {'is_active': True}),
+    'total_roles': ('usuarios.Role', {}),
+    'total_clientes': ('clientes.Cliente', {}),
+    'total_monedas': ('monedas.Moneda', {'activa': True}),
+    'total_cotizaciones': ('monedas.TasaCambio', {}),
+    'total_transacciones': ('transaccion.Transaccion', {}),
+}
+
+
+def _ttl():
+    return getattr(settings, 'DASHBOARD_CONTADORES_SEGUNDOS', 600)
+
+
+def _contar(nombre):
+    modelo, filtro = CONTADORES[nombre]
+    # _base_manager: cuenta todas las filas aunque el manager por defecto filtre
+    return apps.get_model(modelo)._base_manager.filter(**filtro).count()
+
+
+def contadores():
+    """``{nombre: valor}`` de todos los contadores; solo cuenta los que faltan o vencieron."""
+    ahora = timezone.now()
+    valores = dict(
+        ContadorDashboard.objects.filter(
+            nombre__in=CONTADORES, contado_en__gt=ahora - timedelta(seconds=_ttl()),
+        ).values_list('nombre', 'valor')
+    )
+    contados = [
+        ContadorDashboard(nombre=nombre, valor=_contar(nombre), contado_en=ahora)
+        for nombre in CONTADORES if nombre not in valores
+    ]
+    if contados:
+        ContadorDashboard.objects.bulk_create(
+            contados, update_conflicts=True, unique_fields=['nombre'], update_fields=['valor', 'contado_en'],
+        )
+        valores.update((contador.nombre, contador.valor) for contador in contados)
+    return {nombre: valores[nombre] for nombre in CONTADORES}
+
+
+def contadores_de_modelo(modelo):
+    """``[(nombre, filtro)]`` de los contadores de ``modelo`` (clase)."""
+    etiqueta = modelo._meta.label_lower
+    return [
+        (nombre, filtro)
+        for nombre, (modelo_contador, filtro) in CONTADORES.items()
+        if modelo_contador.lower() == etiqueta
+    ]
+
+
+def cumple(instancia, filtro):
+    return all(getattr(instancia, campo) == valor for campo, valor in filtro.items())
+
+
+def sumar(nombre, delta):
+    # Si la fila no existe se contará en la próxima lectura
+    ContadorDashboard.objects.filter(nombre=nombre).update(valor=F('valor') + delta)
+
+
+def invalidar(nombre):
+    ContadorDashboard.objects.filter(nombre=nombre).delete()
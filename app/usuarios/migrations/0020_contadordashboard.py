@@ -0,0 +1,26 @@
+# Generated by Django 5.2 on 2026-10-18 07:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0019_add_reporte_permission_and_assign'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContadorDashboard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=50, unique=True)),
+                ('valor', models.BigIntegerField(default=0)),
+                ('contado_en', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Contador del dashboard',
+                'verbose_name_plural': 'Contadores del dashboard',
+            },
+        ),
+    ]
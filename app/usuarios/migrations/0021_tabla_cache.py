@@ -0,0 +1,21 @@
+from django.core.management import call_command
+from django.db import migrations
+
+
+def crear_tabla_cache(apps, schema_editor):
+    """
+    Crea la tabla de la caché compartida (``CACHES`` en settings/base.py).
+    Así un ``migrate`` alcanza; no hace nada si la tabla ya existe.
+    """
+    call_command('createcachetable', database=schema_editor.connection.alias, verbosity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0020_contadordashboard'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_tabla_cache, reverse_code=migrations.RunPython.noop),
+    ]
@@ -177,4 +177,22 @@ class UserRole(models.Model):
         """
         Retorna la relación usuario → rol en formato legible.
         """
-        return f"{self.user.email} → {self.role.name}"
\ No newline at end of file
+        return f"{self.user.email} → {self.role.name}"
+
+class ContadorDashboard(models.Model):
+    """
+    Valor de un contador del dashboard principal (``usuarios/contadores_dashboard.py``).
+
+    Se cuenta con un ``COUNT`` (``contado_en``) y después las señales lo suman
+    o restan con ``F()``, así el valor es el mismo para todos los procesos.
+    """
+    nombre = models.CharField(max_length=50, unique=True)
+    valor = models.BigIntegerField(default=0)
+    contado_en = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Contador del dashboard"
+        verbose_name_plural = "Contadores del dashboard"
+
+    def __str__(self):
+        return f"{self.nombre}: {self.valor}"
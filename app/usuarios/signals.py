@@ -0,0 +1,38 @@
+"""
+Señales que mantienen los contadores del dashboard principal
+(``usuarios/contadores_dashboard.py``). Los cambios se aplican al confirmarse
+la transacción de BD, así un rollback no deja el contador desviado.
+"""
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from . import contadores_dashboard
+
+
+def actualizar_contadores_alta_o_cambio(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    for nombre, filtro in contadores_dashboard.contadores_de_modelo(sender):
+        if created:
+            if contadores_dashboard.cumple(instance, filtro):
+                transaction.on_commit(partial(contadores_dashboard.sumar, nombre, 1))
+        elif filtro:
+            # Pudo entrar o salir del filtro: se recalcula en la próxima lectura
+            transaction.on_commit(partial(contadores_dashboard.invalidar, nombre))
+
+
+def actualizar_contadores_baja(sender, instance, **kwargs):
+    for nombre, filtro in contadores_dashboard.contadores_de_modelo(sender):
+        if contadores_dashboard.cumple(instance, filtro):
+            transaction.on_commit(partial(contadores_dashboard.sumar, nombre, -1))
+
+
+for _modelo in sorted({modelo for modelo, _ in contadores_dashboard.CONTADORES.values()}):
+    post_save.connect(
+        actualizar_contadores_alta_o_cambio, sender=_modelo, dispatch_uid=f"contadores_dashboard_save_{_modelo}",
+    )
+    post_delete.connect(
+        actualizar_contadores_baja, sender=_modelo, dispatch_uid=f"contadores_dashboard_delete_{_modelo}",
+    )
@@ -1,7 +1,7 @@
 """
  Pruebas unitarias de usuarios
 """
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from .models import Role, User, UserRole
@@ -206,3 +206,80 @@ class UsuariosViewsTest(TestCase):
         self.user.refresh_from_db()
         self.user.refresh_from_db()
         self.assertEqual(self.user.estado, EstadoRegistroEnum.ELIMINADO.value)
+
+
+class DashboardContadoresTest(TestCase):
+    """
+    Pruebas del dashboard principal: contadores mantenidos por señales y últimas cotizaciones en una consulta.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(email="dashboard@example.com", password="testpass123", is_active=True)
+        self.client.force_login(self.user)
+
+    def _contexto(self):
+        response = self.client.get(reverse("usuarios:dashboard"))
+        self.assertEqual(response.status_code, 200)
+        return response.context
+
+    def test_contadores_se_mantienen_con_senales(self):
+        """
+        Verifica que altas, bajas y cambios de filtro actualicen los contadores sin recalcular.
+        """
+        from . import contadores_dashboard
+
+        inicial = self._contexto()
+        total, activos = inicial["total_usuarios"], inicial["usuarios_activos"]
+        self.assertEqual(total, User.objects.count())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            otro = User.objects.create_user(email="otro@example.com", password="testpass123", is_active=True)
+        # Una sola lectura de los contadores, sin COUNT
+        with self.assertNumQueries(1):
+            valores = contadores_dashboard.contadores()
+        self.assertEqual((valores["total_usuarios"], valores["usuarios_activos"]), (total + 1, activos + 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            otro.is_active = False
+            otro.save()
+        self.assertEqual(contadores_dashboard.contadores()["usuarios_activos"], activos)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            otro.delete()
+        self.assertEqual(contadores_dashboard.contadores()["total_usuarios"], total)
+
+    @override_settings(DASHBOARD_CONTADORES_SEGUNDOS=60)
+    def test_contador_vencido_se_vuelve_a_contar(self):
+        """
+        Verifica que un desvío (escritura en bloque sin señales) dure a lo sumo el TTL.
+        """
+        from datetime import timedelta
+        from django.utils import timezone
+        from . import contadores_dashboard
+        from .models import ContadorDashboard
+
+        total = contadores_dashboard.contadores()["total_usuarios"]
+        ContadorDashboard.objects.filter(nombre="total_usuarios").update(valor=total + 5)
+        self.assertEqual(contadores_dashboard.contadores()["total_usuarios"], total + 5)
+
+        ContadorDashboard.objects.filter(nombre="total_usuarios").update(
+            contado_en=timezone.now() - timedelta(seconds=61)
+        )
+        self.assertEqual(contadores_dashboard.contadores()["total_usuarios"], total)
+
+    def test_ultimas_cotizaciones_en_una_consulta(self):
+        """
+        Verifica que la última cotización activa de cada moneda se lea en una sola consulta.
+        """
+        from monedas.models import Moneda, TasaCambio
+
+        monedas = Moneda.objects.filter(activa=True, es_base=False)
+        esperadas = {
+            m.codigo: TasaCambio.objects.filter(moneda=m, activa=True).order_by("-fecha_creacion").first()
+            for m in monedas
+        }
+        with self.assertNumQueries(1):
+            ultimas = list(TasaCambio.ultimas_activas(monedas))
+            codigos = [t.moneda.codigo for t in ultimas]
+        self.assertEqual(codigos, sorted(c for c, t in esperadas.items() if t))
+        self.assertEqual({t.moneda.codigo: t for t in ultimas}, {c: t for c, t in esperadas.items() if t})
+        self.assertEqual(list(self._contexto()["ultimas_cotizaciones"]), ultimas)
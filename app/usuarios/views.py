@@ -17,20 +17,23 @@ from django.utils.encoding import force_bytes, force_str
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from .decorators import role_required
 from .forms import AsignarClientesAUsuarioForm, RegistroForm, LoginForm, UserForm, AsignarRolForm, RoleForm, UserCreateForm, PasswordResetRequestForm
+from . import contadores_dashboard
 from .models import Role, UserRole
 from commons.enums import EstadoRegistroEnum
-from clientes.models import Cliente
+from commons.replicas import lectura_en_replica
 from monedas.models import TasaCambio, Moneda
-from transaccion.models import Transaccion
 
 User = get_user_model()
 
 
+@lectura_en_replica
 def dashboard_view(request):
     """
     Vista principal del dashboard.
 
-    Muestra estadísticas generales de usuarios, roles y clientes.
+    Muestra estadísticas generales de usuarios, roles y clientes. Los totales
+    salen de ``contadores_dashboard`` y las últimas cotizaciones se leen con
+    una consulta, así el costo no depende del tamaño de las tablas.
 
     :param request: HttpRequest
     :return: HttpResponse con el dashboard
@@ -40,41 +43,17 @@ def dashboard_view(request):
     cliente_activo_id = request.session.get('cliente_activo')
     context['cliente_activo_id'] = cliente_activo_id
     if request.user.is_authenticated:
-        total_usuarios = User.objects.count()
-        usuarios_activos = User.objects.filter(is_active=True).count()
-        total_roles = Role.objects.count()
-        total_clientes = Cliente.objects.count()
-
         monedas_activas = Moneda.objects.filter(
             activa=True,
             es_base=False
         ).order_by('codigo')
 
-        ultimas_cotizaciones = []
-        for moneda in monedas_activas:
-            ultima_tasa = TasaCambio.objects.filter(
-                moneda=moneda,
-                activa=True
-            ).order_by('-fecha_creacion').first()
-
-            if ultima_tasa:
-                ultimas_cotizaciones.append(ultima_tasa)
-
-        # Obtener totales para las tarjetas
-        total_monedas = Moneda.objects.filter(activa=True).count()
-        total_cotizaciones = TasaCambio.objects.count()
-        total_transacciones = Transaccion.objects.count()
-
-        context.update({
-            'total_usuarios': total_usuarios,
-            'total_clientes': total_clientes,
-            'usuarios_activos': usuarios_activos,
-            'total_roles': total_roles,
-            'ultimas_cotizaciones': ultimas_cotizaciones,
-            'total_monedas': total_monedas,
-            'total_cotizaciones': total_cotizaciones,
-            'total_transacciones': total_transacciones,
-        })
+        # Última cotización activa de cada moneda, en una sola consulta
+        ultimas_cotizaciones = list(TasaCambio.ultimas_activas(monedas_activas))
+
+        # Totales para las tarjetas, desde los contadores mantenidos por señales
+        context.update(contadores_dashboard.contadores())
+        context['ultimas_cotizaciones'] = ultimas_cotizaciones
 
         # Para el gráfico: monedas activas (no base)
         context['monedas_activas'] = list(monedas_activas)